@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Character, Film, Starship, DataSyncStatus
+from .models import Character, Film, Starship, DataSyncStatus, SyncRun
 
 @admin.register(Character)
 class CharacterAdmin(admin.ModelAdmin):
@@ -28,3 +28,9 @@ class DataSyncStatusAdmin(admin.ModelAdmin):
     list_display = ('resource_type', 'last_sync', 'total_records', 'is_syncing')
     list_filter = ('resource_type', 'is_syncing')
     readonly_fields = ('created_at', 'updated_at')
+
+@admin.register(SyncRun)
+class SyncRunAdmin(admin.ModelAdmin):
+    list_display = ('resource_type', 'started_at', 'status', 'duration_seconds', 'records_fetched', 'rows_per_second')
+    list_filter = ('resource_type', 'status')
+    readonly_fields = ('created_at', 'updated_at')
@@ -4,3 +4,7 @@ class CoreConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "core"
     verbose_name = "Star Wars Core Data"
+
+    def ready(self):
+        # Keep CharacterSummary in step with edits made outside the SWAPI sync
+        from . import signals  # noqa: F401
@@ -0,0 +1,10 @@
+from django.urls import path
+from .async_views import AsyncCharacterView, AsyncFilmView, AsyncStarshipView
+
+urlpatterns = []
+for prefix, view in [('characters', AsyncCharacterView), ('films', AsyncFilmView), ('starships', AsyncStarshipView)]:
+    urlpatterns += [
+        path(f'{prefix}/', view.as_view(action='list'), name=f'async-{prefix}-list'),
+        path(f'{prefix}/search/', view.as_view(action='search'), name=f'async-{prefix}-search'),
+        path(f'{prefix}/<int:pk>/', view.as_view(action='retrieve'), name=f'async-{prefix}-detail'),
+    ]
@@ -0,0 +1,100 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.paginator import InvalidPage
+from django.http import JsonResponse
+from django.views import View
+from rest_framework.exceptions import APIException, NotFound
+from .views import CharacterViewSet, FilmViewSet, StarshipViewSet
+
+
+class AsyncCatalogView(View):
+    """Native async list, detail and search endpoints for a catalog viewset.
+
+    Filtering, ordering, pagination and serialization are borrowed from the
+    DRF viewset so responses match the sync endpoints; only query execution
+    moves to Django's async ORM, so a slow client or a long search no longer
+    holds a worker thread for the whole request.
+    """
+    viewset_class = None
+    action = 'list'
+    search_field = 'name'
+
+    def get_viewset(self, request, **kwargs):
+        viewset = self.viewset_class(
+            action_map={'get': self.action}, args=(), kwargs=kwargs, format_kwarg=None
+        )
+        viewset.request = viewset.initialize_request(request)
+        return viewset
+
+    def serializes_inline(self, viewset):
+        """Whether serializing fetched rows is free of extra queries and can run on the event loop"""
+        return True
+
+    async def serialize(self, viewset, instance, many=False):
+        serializer = viewset.get_serializer(instance, many=many)
+        if self.serializes_inline(viewset):
+            return serializer.data
+        return await sync_to_async(lambda: serializer.data)()
+
+    async def get(self, request, pk=None):
+        viewset = self.get_viewset(request, pk=pk)
+        try:
+            if self.action == 'retrieve':
+                return await self.retrieve(viewset, pk)
+            if self.action == 'search':
+                return await self.search(viewset)
+            return await self.list(viewset)
+        except APIException as exc:
+            data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+            return JsonResponse(data, status=exc.status_code, safe=False)
+
+    async def list(self, viewset):
+        return await self.paginated_response(viewset, viewset.filter_queryset(viewset.get_queryset()))
+
+    async def retrieve(self, viewset, pk):
+        queryset = viewset.filter_queryset(viewset.get_queryset())
+        try:
+            instance = await queryset.aget(pk=pk)
+        except queryset.model.DoesNotExist:
+            raise NotFound()
+        return JsonResponse(await self.serialize(viewset, instance))
+
+    async def search(self, viewset):
+        q = viewset.request.GET.get('q', '')
+        if not q:
+            return JsonResponse({'error': 'Query parameter "q" is required'}, status=400)
+        queryset = viewset.get_queryset().filter(**{f'{self.search_field}__icontains': q})
+        return await self.paginated_response(viewset, queryset)
+
+    async def paginated_response(self, viewset, queryset):
+        pagination = viewset.paginator
+        request = viewset.request
+        pagination.request = request
+        paginator = pagination.django_paginator_class(queryset, pagination.get_page_size(request))
+        # Count asynchronously up front so the Django paginator never queries on its own
+        paginator.count = await queryset.acount()
+        page_number = pagination.get_page_number(request, paginator)
+        try:
+            pagination.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(pagination.invalid_page_message.format(page_number=page_number, message=str(exc)))
+        rows = [obj async for obj in pagination.page.object_list]
+        data = await self.serialize(viewset, rows, many=True)
+        return JsonResponse(pagination.get_paginated_response(data).data)
+
+
+class AsyncCharacterView(AsyncCatalogView):
+    viewset_class = CharacterViewSet
+
+    def serializes_inline(self, viewset):
+        # The normalized serializers count nested relations per film/starship
+        return settings.CHARACTER_SUMMARY_READS
+
+
+class AsyncFilmView(AsyncCatalogView):
+    viewset_class = FilmViewSet
+    search_field = 'title'
+
+
+class AsyncStarshipView(AsyncCatalogView):
+    viewset_class = StarshipViewSet
@@ -0,0 +1,95 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from typing import Optional
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils import timezone
+from .models import Character, DataSyncStatus, Film, Starship
+
+
+def catalog_generation() -> str:
+    """Token that changes whenever a SWAPI sync starts or finishes.
+
+    Anything derived from the catalog (facet counts, id indexes, ...) can be
+    cached under this token and is implicitly invalidated by the next sync.
+    """
+    state = DataSyncStatus.objects.aggregate(last=Max('updated_at'), total=Count('id'))
+    if not state['total']:
+        return '0'
+    return f"{state['total']}-{state['last'].timestamp():.6f}"
+
+
+def bump_catalog_generation():
+    """Change the generation outside a sync, e.g. after catalog items were deleted.
+
+    Touches the sync status rows so other processes see it at their next
+    check, and drops this process's id index right away.
+    """
+    DataSyncStatus.objects.update(updated_at=timezone.now())
+    if _id_index is not None:
+        _id_index.invalidate()
+
+
+class CatalogIdIndex:
+    """Per-process sorted arrays of the ids of each catalog model.
+
+    The arrays are rebuilt when catalog_generation() changes; the generation
+    itself is re-read at most every ``check_interval`` seconds, so membership
+    checks in between need no query. Ids created by a sync in another process
+    are unknown until the next check, so callers should confirm a miss
+    against the database. Deletes bump the generation (see core.signals), so
+    other processes may still report a deleted id until their next check.
+    """
+
+    def __init__(self, models, check_interval: float = 5.0):
+        self.models = list(models)
+        self.check_interval = check_interval
+        self._ids = {}
+        self._generation = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < self.check_interval:
+                return
+            generation = catalog_generation()
+            if generation != self._generation:
+                self._ids = {
+                    model: array('q', model.objects.order_by('id').values_list('id', flat=True))
+                    for model in self.models
+                }
+                self._generation = generation
+            self._checked_at = now
+
+    def contains(self, model, pk: int) -> bool:
+        self._refresh()
+        ids = self._ids[model]
+        position = bisect_left(ids, pk)
+        return position < len(ids) and ids[position] == pk
+
+    def invalidate(self):
+        """Rebuild on the next lookup, e.g. after this process ran a sync"""
+        with self._lock:
+            self._generation = None
+            self._checked_at = None
+
+
+_id_index = None
+_id_index_lock = threading.Lock()
+
+
+def get_catalog_id_index() -> Optional[CatalogIdIndex]:
+    """This process's id index of characters, films and starships, or None when disabled"""
+    global _id_index
+    if not settings.CATALOG_ID_INDEX:
+        return None
+    with _id_index_lock:
+        if _id_index is None:
+            _id_index = CatalogIdIndex([Character, Film, Starship], settings.CATALOG_ID_INDEX_CHECK_INTERVAL)
+        return _id_index
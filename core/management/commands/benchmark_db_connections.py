@@ -0,0 +1,78 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.postgresql.psycopg_any import is_psycopg3
+from django.test import RequestFactory
+
+
+class Command(BaseCommand):
+    help = 'Compare the cost of requests with fresh vs pooled database connections'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Requests per mode (default: 500)')
+        parser.add_argument('--concurrency', type=int, default=4, help='Worker threads (default: 4)')
+        parser.add_argument('--pool-size', type=int, default=4, help='Maximum pooled connections (default: 4)')
+        parser.add_argument(
+            '--path',
+            default='/api/films/?page_size=1',
+            help='URL each request gets (default: a short catalog listing)'
+        )
+
+    def handle(self, *args, **options):
+        aliases = list(connections)
+        if not is_psycopg3 or any(connections[alias].vendor != 'postgresql' for alias in aliases):
+            raise CommandError('Connection pooling needs PostgreSQL with psycopg 3 (psycopg[pool])')
+        handler = WSGIHandler()
+        factory = RequestFactory()
+
+        def request(_):
+            environ = factory.get(options['path']).environ
+            statuses = []
+            started = time.perf_counter()
+            response = handler(environ, lambda status, headers: statuses.append(status))
+            b''.join(response)
+            # As a WSGI server would: fires request_finished, which closes or returns the connections
+            response.close()
+            return (time.perf_counter() - started) * 1000, statuses[0]
+
+        original = {
+            alias: (connections.settings[alias]['OPTIONS'], connections.settings[alias]['CONN_MAX_AGE'])
+            for alias in aliases
+        }
+        results = {}
+        try:
+            for mode in ('fresh', 'pooled'):
+                for alias in aliases:
+                    db = connections.settings[alias]
+                    db['OPTIONS'] = {key: value for key, value in original[alias][0].items() if key != 'pool'}
+                    if mode == 'pooled':
+                        db['OPTIONS']['pool'] = {'min_size': 1, 'max_size': options['pool_size']}
+                    db['CONN_MAX_AGE'] = 0
+                # Each mode gets new threads, whose connections are set up from the settings above
+                with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+                    started = time.perf_counter()
+                    responses = list(executor.map(request, range(options['requests'])))
+                    elapsed = time.perf_counter() - started
+                latencies = sorted(latency for latency, _ in responses)
+                errors = sum(not status.startswith('2') for _, status in responses)
+                results[mode] = statistics.mean(latencies)
+                self.stdout.write(
+                    f"{mode:>6}: mean {statistics.mean(latencies):.3f} ms, "
+                    f"p50 {latencies[len(latencies) // 2]:.3f} ms, "
+                    f"p99 {latencies[int(len(latencies) * 0.99) - 1]:.3f} ms, "
+                    f"{options['requests'] / elapsed:.0f} req/s, {errors} non-2xx"
+                )
+            for alias in aliases:
+                self.stdout.write(f"{alias} pool stats: {connections[alias].pool.get_stats()}")
+        finally:
+            for alias in aliases:
+                connections[alias].close_pool()
+                connections.settings[alias]['OPTIONS'], connections.settings[alias]['CONN_MAX_AGE'] = original[alias]
+
+        gain = results['fresh'] - results['pooled']
+        self.stdout.write(self.style.SUCCESS(
+            f"Pooling saves {gain:.3f} ms per request ({results['fresh'] / results['pooled']:.1f}x faster)"
+        ))
@@ -0,0 +1,12 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from starwars_api.schema import render_schema, schema_version, write_schema
+
+
+class Command(BaseCommand):
+    help = 'Render the OpenAPI schema into SCHEMA_CACHE_DIR so /api/schema/ never generates it'
+
+    def handle(self, *args, **options):
+        version = schema_version()
+        write_schema(version, render_schema())
+        self.stdout.write(self.style.SUCCESS(f'Wrote OpenAPI schema version {version} to {settings.SCHEMA_CACHE_DIR}'))
@@ -1,5 +1,8 @@
+import os
+from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
 from core.services import SWAPIService, SWAPIError
+from starwars_api.tracing import EXPORTER, INTERNAL, install_query_tracing, start_trace
 
 class Command(BaseCommand):
     help = 'Populate database with SWAPI data'
@@ -14,8 +17,19 @@ class Command(BaseCommand):
         )
 
     def handle(self, *args, **options):
-        resource = options['resource']
-        
+        if not settings.TRACING:
+            return self.populate(options['resource'])
+        install_query_tracing()
+        # A manual sync is rare and worth a full trace; TRACEPARENT continues a scheduler's trace
+        try:
+            with start_trace('populate_swapi_data', os.environ.get('TRACEPARENT'), INTERNAL, sample_rate=1.0,
+                             resource=options['resource']):
+                return self.populate(options['resource'])
+        finally:
+            # The exporter thread is a daemon; don't exit before it has written the trace
+            EXPORTER.flush()
+
+    def populate(self, resource):
         self.stdout.write(
             self.style.HTTP_INFO('Populating SWAPI data...')
         )
@@ -0,0 +1,87 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_character_summaries(apps, schema_editor):
+    Character = apps.get_model("core", "Character")
+    CharacterSummary = apps.get_model("core", "CharacterSummary")
+    summaries = []
+    for character in Character.objects.prefetch_related("films", "starships"):
+        films = [{"id": film.id, "title": film.title} for film in character.films.all()]
+        starships = [
+            {"id": ship.id, "name": ship.name} for ship in character.starships.all()
+        ]
+        summaries.append(
+            CharacterSummary(
+                character_id=character.id,
+                swapi_id=character.swapi_id,
+                name=character.name,
+                height=character.height,
+                mass=character.mass,
+                hair_color=character.hair_color,
+                skin_color=character.skin_color,
+                eye_color=character.eye_color,
+                birth_year=character.birth_year,
+                gender=character.gender,
+                films=films,
+                starships=starships,
+                films_count=len(films),
+                starships_count=len(starships),
+                created_at=character.created_at,
+                updated_at=character.updated_at,
+            )
+        )
+    CharacterSummary.objects.bulk_create(summaries)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0002_delete_vote"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CharacterSummary",
+            fields=[
+                (
+                    "character",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="summary",
+                        serialize=False,
+                        to="core.character",
+                    ),
+                ),
+                ("swapi_id", models.IntegerField(unique=True)),
+                ("name", models.CharField(max_length=255)),
+                ("height", models.CharField(blank=True, max_length=10, null=True)),
+                ("mass", models.CharField(blank=True, max_length=10, null=True)),
+                ("hair_color", models.CharField(blank=True, max_length=50, null=True)),
+                ("skin_color", models.CharField(blank=True, max_length=50, null=True)),
+                ("eye_color", models.CharField(blank=True, max_length=50, null=True)),
+                ("birth_year", models.CharField(blank=True, max_length=20, null=True)),
+                ("gender", models.CharField(blank=True, max_length=50, null=True)),
+                ("films", models.JSONField(default=list)),
+                ("starships", models.JSONField(default=list)),
+                ("films_count", models.PositiveIntegerField(default=0)),
+                ("starships_count", models.PositiveIntegerField(default=0)),
+                ("created_at", models.DateTimeField()),
+                ("updated_at", models.DateTimeField()),
+                ("refreshed_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "ordering": ["name"],
+                "indexes": [
+                    models.Index(fields=["name"], name="core_charac_name_c66880_idx"),
+                    models.Index(
+                        fields=["gender"], name="core_charac_gender_a00499_idx"
+                    ),
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_character_summaries, migrations.RunPython.noop),
+    ]
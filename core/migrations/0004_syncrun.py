@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0003_charactersummary"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SyncRun",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("run_id", models.UUIDField(db_index=True)),
+                ("resource_type", models.CharField(max_length=50)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("running", "Running"),
+                            ("success", "Success"),
+                            ("failed", "Failed"),
+                        ],
+                        default="running",
+                        max_length=20,
+                    ),
+                ),
+                ("error", models.TextField(blank=True)),
+                ("started_at", models.DateTimeField()),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+                ("duration_seconds", models.FloatField(default=0)),
+                ("fetch_seconds", models.FloatField(default=0)),
+                ("parse_seconds", models.FloatField(default=0)),
+                ("write_seconds", models.FloatField(default=0)),
+                ("link_seconds", models.FloatField(default=0)),
+                ("records_fetched", models.IntegerField(default=0)),
+                ("records_created", models.IntegerField(default=0)),
+                ("rows_per_second", models.FloatField(default=0)),
+                ("bytes_downloaded", models.BigIntegerField(default=0)),
+                ("peak_memory_bytes", models.BigIntegerField(blank=True, null=True)),
+                ("max_rss_bytes", models.BigIntegerField(blank=True, null=True)),
+            ],
+            options={
+                "ordering": ["-started_at"],
+                "indexes": [
+                    models.Index(
+                        fields=["resource_type", "-started_at"],
+                        name="core_syncru_resourc_7fc6b8_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -74,6 +74,74 @@ class Character(BaseModel):
     def __str__(self):
         return self.name
 
+class CharacterSummary(models.Model):
+    """Denormalized read model serving character list and detail responses"""
+    character = models.OneToOneField(
+        Character, primary_key=True, on_delete=models.CASCADE, related_name='summary'
+    )
+    swapi_id = models.IntegerField(unique=True)
+    name = models.CharField(max_length=255)
+    height = models.CharField(max_length=10, null=True, blank=True)
+    mass = models.CharField(max_length=10, null=True, blank=True)
+    hair_color = models.CharField(max_length=50, null=True, blank=True)
+    skin_color = models.CharField(max_length=50, null=True, blank=True)
+    eye_color = models.CharField(max_length=50, null=True, blank=True)
+    birth_year = models.CharField(max_length=20, null=True, blank=True)
+    gender = models.CharField(max_length=50, null=True, blank=True)
+    films = models.JSONField(default=list)
+    starships = models.JSONField(default=list)
+    films_count = models.PositiveIntegerField(default=0)
+    starships_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    refreshed_at = models.DateTimeField(auto_now=True)
+
+    SCALAR_FIELDS = [
+        'swapi_id', 'name', 'height', 'mass', 'hair_color', 'skin_color',
+        'eye_color', 'birth_year', 'gender', 'created_at', 'updated_at',
+    ]
+
+    class Meta:
+        ordering = ['name']
+        indexes = [
+            models.Index(fields=['name']),
+            models.Index(fields=['gender']),
+        ]
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def from_character(cls, character):
+        films = [{'id': film.id, 'title': film.title} for film in character.films.all()]
+        starships = [{'id': ship.id, 'name': ship.name} for ship in character.starships.all()]
+        return cls(
+            character_id=character.id,
+            films=films,
+            starships=starships,
+            films_count=len(films),
+            starships_count=len(starships),
+            **{field: getattr(character, field) for field in cls.SCALAR_FIELDS},
+        )
+
+    @classmethod
+    def rebuild(cls, character_ids=None):
+        """Upsert summaries for the given characters, or for all of them when None"""
+        characters = Character.objects.prefetch_related(
+            models.Prefetch('films', queryset=Film.objects.only('id', 'title', 'episode_id')),
+            models.Prefetch('starships', queryset=Starship.objects.only('id', 'name')),
+        )
+        if character_ids is not None:
+            characters = characters.filter(id__in=list(character_ids))
+        summaries = [cls.from_character(character) for character in characters]
+        cls.objects.bulk_create(
+            summaries,
+            update_conflicts=True,
+            unique_fields=['character'],
+            update_fields=cls.SCALAR_FIELDS + ['films', 'starships', 'films_count', 'starships_count', 'refreshed_at'],
+        )
+        return len(summaries)
+
 class DataSyncStatus(BaseModel):
     """Track SWAPI data synchronization status"""
     resource_type = models.CharField(max_length=50, unique=True)
@@ -83,3 +151,42 @@ class DataSyncStatus(BaseModel):
     
     def __str__(self):
         return f"{self.resource_type}: {self.total_records} records"
+
+
+class SyncRun(BaseModel):
+    """Telemetry of one sync of one SWAPI resource, kept as history"""
+    STATUS_CHOICES = [
+        ('running', 'Running'),
+        ('success', 'Success'),
+        ('failed', 'Failed'),
+    ]
+
+    # Shared by the resources synced together by one populate
+    run_id = models.UUIDField(db_index=True)
+    resource_type = models.CharField(max_length=50)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='running')
+    error = models.TextField(blank=True)
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField(null=True, blank=True)
+    duration_seconds = models.FloatField(default=0)
+    fetch_seconds = models.FloatField(default=0)
+    parse_seconds = models.FloatField(default=0)
+    write_seconds = models.FloatField(default=0)
+    link_seconds = models.FloatField(default=0)
+    records_fetched = models.IntegerField(default=0)
+    records_created = models.IntegerField(default=0)
+    rows_per_second = models.FloatField(default=0)
+    bytes_downloaded = models.BigIntegerField(default=0)
+    # Python allocations only, with SYNC_TRACE_MEMORY
+    peak_memory_bytes = models.BigIntegerField(null=True, blank=True)
+    # The process's resident set high-water mark when the sync finished
+    max_rss_bytes = models.BigIntegerField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-started_at']
+        indexes = [
+            models.Index(fields=['resource_type', '-started_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.resource_type} sync at {self.started_at}: {self.status}"
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Character, Film, Starship, DataSyncStatus
+from .models import Character, CharacterSummary, Film, Starship, DataSyncStatus, SyncRun
 
 class FilmSerializer(serializers.ModelSerializer):
     characters_count = serializers.SerializerMethodField()
@@ -72,8 +72,47 @@ class CharacterListSerializer(serializers.ModelSerializer):
     def get_starships_count(self, obj):
         return obj.starships.count()
 
+class CharacterSummarySerializer(serializers.ModelSerializer):
+    """Character detail served from the denormalized read model"""
+    id = serializers.IntegerField(source='character_id', read_only=True)
+
+    class Meta:
+        model = CharacterSummary
+        fields = [
+            'id', 'swapi_id', 'name', 'height', 'mass', 'hair_color',
+            'skin_color', 'eye_color', 'birth_year', 'gender',
+            'films', 'starships', 'films_count', 'starships_count',
+            'created_at', 'updated_at'
+        ]
+        read_only_fields = fields
+
+class CharacterSummaryListSerializer(serializers.ModelSerializer):
+    """Character list rows served from the denormalized read model"""
+    id = serializers.IntegerField(source='character_id', read_only=True)
+
+    class Meta:
+        model = CharacterSummary
+        fields = [
+            'id', 'swapi_id', 'name', 'height', 'mass', 'gender', 'hair_color',
+            'films_count', 'starships_count', 'created_at'
+        ]
+        read_only_fields = fields
+
+
+class SyncRunSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SyncRun
+        exclude = ['id', 'created_at', 'updated_at']
+
 
 class DataSyncStatusSerializer(serializers.ModelSerializer):
+    recent_runs = serializers.SerializerMethodField()
+
     class Meta:
         model = DataSyncStatus
         fields = '__all__'
+
+    def get_recent_runs(self, obj):
+        # Runs are loaded for all resources at once by the view
+        runs = self.context.get('runs', {}).get(obj.resource_type, [])
+        return SyncRunSerializer(runs, many=True).data
@@ -1,7 +1,13 @@
 import requests
 import logging
 from django.utils import timezone
-from .models import Character, Film, Starship, DataSyncStatus
+from starwars_api.metrics import track_sync
+from starwars_api.routers import primary_reads
+from starwars_api.tracing import CLIENT, span, traceparent_headers
+from .catalog import get_catalog_id_index
+from .signals import summary_signals_paused
+from .telemetry import record_download, record_fetched, record_sync_run, sync_batch, sync_stage
+from .models import Character, CharacterSummary, Film, Starship, DataSyncStatus
 from datetime import datetime
 from typing import Dict, List, Optional
 
@@ -27,12 +33,17 @@ class SWAPIService:
     def make_request(url: str) -> Optional[Dict]:
         """Make HTTP request with error handling"""
         try:
-            response = requests.get(url, timeout=SWAPIService.TIMEOUT)
-            response.raise_for_status()
-            return response.json()
+            with sync_stage('fetch'), span('swapi.request', CLIENT, **{'http.method': 'GET', 'url.full': url}) as request_span:
+                response = requests.get(url, timeout=SWAPIService.TIMEOUT, headers=traceparent_headers())
+                if request_span is not None:
+                    request_span.set_attribute('http.status_code', response.status_code)
+                response.raise_for_status()
         except requests.exceptions.RequestException as e:
-            logger.error(f"SWAPI request failed for {url}: {e}")
+            logger.error("SWAPI request failed for %s: %s", url, e)
             raise SWAPIError(f"Failed to fetch data from SWAPI: {e}")
+        record_download(response)
+        with sync_stage('parse'):
+            return response.json()
     
     @staticmethod
     def update_sync_status(resource_type: str, is_syncing: bool = False, total_records: int = 0):
@@ -47,9 +58,16 @@ class SWAPIService:
             if not is_syncing:
                 status.last_sync = timezone.now()
             status.save()
+        id_index = get_catalog_id_index()
+        if id_index is not None:
+            id_index.invalidate()
         return status
     
     @staticmethod
+    @span('SWAPIService.fetch_all_films')
+    @primary_reads
+    @track_sync('films')
+    @record_sync_run('films')
     def fetch_all_films() -> List[Film]:
         """Fetch all films from SWAPI and store in database"""
         SWAPIService.update_sync_status('films', is_syncing=True)
@@ -60,15 +78,15 @@ class SWAPIService:
             
             if not films_data:
                 raise SWAPIError("Invalid response from SWAPI films endpoint")
+            record_fetched(len(films_data))
             
             created_films = []
             
             for film_data in films_data:
                 try:
-                    swapi_id = SWAPIService.extract_id_from_url(film_data['url'])
-                    film, created = Film.objects.get_or_create(
-                        swapi_id=swapi_id,
-                        defaults={
+                    with sync_stage('parse'):
+                        swapi_id = SWAPIService.extract_id_from_url(film_data['url'])
+                        defaults = {
                             'title': film_data.get('title', ''),
                             'episode_id': film_data.get('episode_id', 0),
                             'opening_crawl': film_data.get('opening_crawl', ''),
@@ -79,12 +97,13 @@ class SWAPIService:
                                 '%Y-%m-%d'
                             ).date(),
                         }
-                    )
+                    with sync_stage('write'):
+                        film, created = Film.objects.get_or_create(swapi_id=swapi_id, defaults=defaults)
                     if created:
                         created_films.append(film)
-                        logger.info(f"Created film: {film.title}")
+                        logger.info("Created film: %s", film.title)
                 except Exception as e:
-                    logger.error(f"Error creating film {film_data.get('title', 'Unknown')}: {e}")
+                    logger.error("Error creating film %s: %s", film_data.get('title', 'Unknown'), e)
                     continue
             
             SWAPIService.update_sync_status('films', is_syncing=False, total_records=Film.objects.count())
@@ -95,6 +114,10 @@ class SWAPIService:
             raise SWAPIError(f"Failed to fetch films: {e}")
     
     @staticmethod
+    @span('SWAPIService.fetch_all_starships')
+    @primary_reads
+    @track_sync('starships')
+    @record_sync_run('starships')
     def fetch_all_starships() -> List[Starship]:
         """Fetch all starships from SWAPI"""
         SWAPIService.update_sync_status('starships', is_syncing=True)
@@ -105,15 +128,15 @@ class SWAPIService:
             
             if not starships_data:
                 raise SWAPIError("Invalid response from SWAPI starships endpoint")
+            record_fetched(len(starships_data))
             
             created_starships = []
             
             for starship_data in starships_data:
                 try:
-                    swapi_id = SWAPIService.extract_id_from_url(starship_data['url'])
-                    starship, created = Starship.objects.get_or_create(
-                        swapi_id=swapi_id,
-                        defaults={
+                    with sync_stage('parse'):
+                        swapi_id = SWAPIService.extract_id_from_url(starship_data['url'])
+                        defaults = {
                             'name': starship_data.get('name', ''),
                             'model': starship_data.get('model', ''),
                             'manufacturer': starship_data.get('manufacturer', ''),
@@ -126,12 +149,13 @@ class SWAPIService:
                             'hyperdrive_rating': starship_data.get('hyperdrive_rating', 'unknown'),
                             'starship_class': starship_data.get('starship_class', 'unknown'),
                         }
-                    )
+                    with sync_stage('write'):
+                        starship, created = Starship.objects.get_or_create(swapi_id=swapi_id, defaults=defaults)
                     if created:
                         created_starships.append(starship)
-                        logger.info(f"Created starship: {starship.name}")
+                        logger.info("Created starship: %s", starship.name)
                 except Exception as e:
-                    logger.error(f"Error creating starship {starship_data.get('name', 'Unknown')}: {e}")
+                    logger.error("Error creating starship %s: %s", starship_data.get('name', 'Unknown'), e)
                     continue
             
             SWAPIService.update_sync_status('starships', is_syncing=False, total_records=Starship.objects.count())
@@ -142,6 +166,11 @@ class SWAPIService:
             raise SWAPIError(f"Failed to fetch starships: {e}")
     
     @staticmethod
+    @span('SWAPIService.fetch_all_characters')
+    @primary_reads
+    @track_sync('characters')
+    @record_sync_run('characters')
+    @summary_signals_paused()
     def fetch_all_characters() -> List[Character]:
         """Fetch all characters from SWAPI with relationships"""
         SWAPIService.update_sync_status('characters', is_syncing=True)
@@ -152,15 +181,15 @@ class SWAPIService:
             
             if not characters_data:
                 raise SWAPIError("Invalid response from SWAPI people endpoint")
+            record_fetched(len(characters_data))
             
             created_characters = []
             
             for char_data in characters_data:
                 try:
-                    swapi_id = SWAPIService.extract_id_from_url(char_data['url'])
-                    character, created = Character.objects.get_or_create(
-                        swapi_id=swapi_id,
-                        defaults={
+                    with sync_stage('parse'):
+                        swapi_id = SWAPIService.extract_id_from_url(char_data['url'])
+                        defaults = {
                             'name': char_data.get('name', ''),
                             'height': char_data.get('height', 'unknown'),
                             'mass': char_data.get('mass', 'unknown'),
@@ -170,40 +199,49 @@ class SWAPIService:
                             'birth_year': char_data.get('birth_year', 'unknown'),
                             'gender': char_data.get('gender', 'unknown'),
                         }
-                    )
+                    with sync_stage('write'):
+                        character, created = Character.objects.get_or_create(swapi_id=swapi_id, defaults=defaults)
                     
                     if created:
-                        # Add film relationships
-                        for film_url in char_data.get('films', []):
-                            try:
-                                film_id = SWAPIService.extract_id_from_url(film_url)
+                        with sync_stage('link'):
+                            # Add film relationships
+                            for film_url in char_data.get('films', []):
                                 try:
-                                    film = Film.objects.get(swapi_id=film_id)
-                                    character.films.add(film)
-                                except Film.DoesNotExist:
-                                    logger.warning(f"Film with swapi_id {film_id} not found for character {character.name}")
-                            except Exception as e:
-                                logger.error(f"Error adding film relationship: {e}")
-                        
-                        # Add starship relationships
-                        for starship_url in char_data.get('starships', []):
-                            try:
-                                starship_id = SWAPIService.extract_id_from_url(starship_url)
+                                    film_id = SWAPIService.extract_id_from_url(film_url)
+                                    try:
+                                        film = Film.objects.get(swapi_id=film_id)
+                                        character.films.add(film)
+                                    except Film.DoesNotExist:
+                                        logger.warning("Film with swapi_id %s not found for character %s", film_id, character.name)
+                                except Exception as e:
+                                    logger.error("Error adding film relationship: %s", e)
+                            
+                            # Add starship relationships
+                            for starship_url in char_data.get('starships', []):
                                 try:
-                                    starship = Starship.objects.get(swapi_id=starship_id)
-                                    character.starships.add(starship)
-                                except Starship.DoesNotExist:
-                                    logger.warning(f"Starship with swapi_id {starship_id} not found for character {character.name}")
-                            except Exception as e:
-                                logger.error(f"Error adding starship relationship: {e}")
+                                    starship_id = SWAPIService.extract_id_from_url(starship_url)
+                                    try:
+                                        starship = Starship.objects.get(swapi_id=starship_id)
+                                        character.starships.add(starship)
+                                    except Starship.DoesNotExist:
+                                        logger.warning("Starship with swapi_id %s not found for character %s", starship_id, character.name)
+                                except Exception as e:
+                                    logger.error("Error adding starship relationship: %s", e)
                         
                         created_characters.append(character)
-                        logger.info(f"Created character: {character.name}")
+                        logger.info("Created character: %s", character.name)
                         
                 except Exception as e:
-                    logger.error(f"Error creating character {char_data.get('name', 'Unknown')}: {e}")
+                    logger.error("Error creating character %s: %s", char_data.get('name', 'Unknown'), e)
                     continue
             
+            # Refresh the read model for new characters and any still missing a summary
+            stale_ids = {character.id for character in created_characters}
+            stale_ids.update(Character.objects.filter(summary__isnull=True).values_list('id', flat=True))
+            if stale_ids:
+                with sync_stage('write'):
+                    CharacterSummary.rebuild(stale_ids)
+            
             SWAPIService.update_sync_status('characters', is_syncing=False, total_records=Character.objects.count())
             return created_characters
             
@@ -212,6 +250,10 @@ class SWAPIService:
             raise SWAPIError(f"Failed to fetch characters: {e}")
 
     @staticmethod
+    @span('SWAPIService.populate_all_data')
+    @primary_reads
+    @track_sync('all')
+    @sync_batch()
     def populate_all_data():
         """Populate all required data from SWAPI"""
         logger.info("Starting SWAPI data population...")
@@ -234,5 +276,5 @@ class SWAPIService:
             }
             
         except Exception as e:
-            logger.error(f"Failed to populate SWAPI data: {e}")
+            logger.error("Failed to populate SWAPI data: %s", e)
             raise SWAPIError(f"Data population failed: {e}")
@@ -0,0 +1,75 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from .catalog import bump_catalog_generation
+from .models import Character, CharacterSummary, Film, Starship
+
+_paused: ContextVar[bool] = ContextVar('character_summary_signals_paused', default=False)
+
+
+@contextmanager
+def summary_signals_paused():
+    """Ignore character changes in the block; for callers that rebuild the summaries themselves"""
+    token = _paused.set(True)
+    try:
+        yield
+    finally:
+        _paused.reset(token)
+
+
+def rebuild_after_commit(character_ids):
+    """Refresh the characters' summaries once the current transaction commits"""
+    if _paused.get():
+        return
+    character_ids = set(character_ids)
+    if character_ids:
+        transaction.on_commit(partial(CharacterSummary.rebuild, character_ids))
+
+
+@receiver(post_save, sender=Character)
+def character_saved(sender, instance, **kwargs):
+    rebuild_after_commit([instance.pk])
+
+
+@receiver(post_save, sender=Film)
+@receiver(post_save, sender=Starship)
+def related_item_saved(sender, instance, created, **kwargs):
+    # A new film or starship has no characters yet
+    if not created:
+        rebuild_after_commit(_character_ids(instance))
+
+
+@receiver(pre_delete, sender=Film)
+@receiver(pre_delete, sender=Starship)
+def related_item_deleted(sender, instance, **kwargs):
+    # The links are gone by post_delete; deletes run in a transaction, so this rebuilds after them
+    rebuild_after_commit(_character_ids(instance))
+
+
+@receiver(post_delete, sender=Character)
+@receiver(post_delete, sender=Film)
+@receiver(post_delete, sender=Starship)
+def catalog_item_deleted(sender, instance, **kwargs):
+    # Votes for ids in the catalog id index skip the existence check, so it must forget deleted ones
+    transaction.on_commit(bump_catalog_generation)
+
+
+@receiver(m2m_changed, sender=Character.films.through)
+@receiver(m2m_changed, sender=Character.starships.through)
+def character_links_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            rebuild_after_commit([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        rebuild_after_commit(pk_set)
+    elif action == 'pre_clear':
+        # Like deletes, clear() runs in a transaction, so this rebuilds after it
+        rebuild_after_commit(_character_ids(instance))
+
+
+def _character_ids(instance):
+    related = instance.characters if isinstance(instance, Film) else instance.pilots
+    return related.values_list('pk', flat=True)
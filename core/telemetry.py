@@ -0,0 +1,120 @@
+import sys
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Optional
+from django.conf import settings
+from django.utils import timezone
+from .models import SyncRun
+
+try:
+    import resource
+except ImportError:  # Windows: no RSS high-water mark
+    resource = None
+
+STAGES = ['fetch', 'parse', 'write', 'link']
+
+_current: ContextVar[Optional['SyncTelemetry']] = ContextVar('sync_telemetry', default=None)
+_run_id: ContextVar[Optional[uuid.UUID]] = ContextVar('sync_run_id', default=None)
+
+
+class SyncTelemetry:
+    """Counters of the resource sync running in this context"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = dict.fromkeys(STAGES, 0.0)
+        self.records_fetched = 0
+        self.bytes_downloaded = 0
+
+
+@contextmanager
+def sync_stage(stage: str):
+    """Count the block's duration towards ``stage`` of the current sync, if one is being recorded"""
+    telemetry = _current.get()
+    if telemetry is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        telemetry.stages[stage] += time.perf_counter() - started
+
+
+def record_download(response):
+    telemetry = _current.get()
+    if telemetry is not None:
+        telemetry.bytes_downloaded += len(response.content)
+
+
+def max_rss_bytes() -> Optional[int]:
+    """Peak resident set size of this process so far"""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def record_fetched(count: int):
+    telemetry = _current.get()
+    if telemetry is not None:
+        telemetry.records_fetched += count
+
+
+@contextmanager
+def sync_batch():
+    """Give the resource syncs run inside the block one shared ``run_id``"""
+    if _run_id.get() is not None:
+        yield
+        return
+    token = _run_id.set(uuid.uuid4())
+    try:
+        yield
+    finally:
+        _run_id.reset(token)
+
+
+def record_sync_run(resource: str):
+    """Save a SyncRun with the wrapped sync's stage times, volumes and peak memory"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            run = SyncRun.objects.create(
+                run_id=_run_id.get() or uuid.uuid4(), resource_type=resource, started_at=timezone.now()
+            )
+            telemetry = SyncTelemetry()
+            token = _current.set(telemetry)
+            # An outer tracemalloc user (e.g. a profiled request) owns the peak; leave it alone
+            trace_memory = settings.SYNC_TRACE_MEMORY and not tracemalloc.is_tracing()
+            if trace_memory:
+                tracemalloc.start()
+            try:
+                result = func(*args, **kwargs)
+                run.status = 'success'
+                run.records_created = len(result) if isinstance(result, list) else 0
+                return result
+            except Exception as e:
+                run.status = 'failed'
+                run.error = str(e)
+                raise
+            finally:
+                if trace_memory:
+                    run.peak_memory_bytes = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+                _current.reset(token)
+                run.finished_at = timezone.now()
+                run.duration_seconds = time.perf_counter() - telemetry.started
+                for stage, seconds in telemetry.stages.items():
+                    setattr(run, f'{stage}_seconds', seconds)
+                run.records_fetched = telemetry.records_fetched
+                run.rows_per_second = telemetry.records_fetched / run.duration_seconds if run.duration_seconds else 0
+                run.bytes_downloaded = telemetry.bytes_downloaded
+                run.max_rss_bytes = max_rss_bytes()
+                run.save()
+        return wrapper
+    return decorator
@@ -1,10 +1,11 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.core.cache import cache
 from django.urls import reverse
 from rest_framework.test import APITestCase
 from rest_framework import status
 from unittest.mock import patch, Mock
 from datetime import date
-from core.models import Character, Film, Starship, DataSyncStatus
+from core.models import Character, CharacterSummary, Film, Starship, DataSyncStatus, SyncRun
 from core.services import SWAPIService, SWAPIError
 from requests.exceptions import RequestException
 
@@ -107,6 +108,7 @@ class CharacterViewSetTest(APITestCase):
             gender="male"
         )
         self.character.films.add(self.film)
+        CharacterSummary.rebuild()
 
     def test_list_characters(self):
         url = reverse('characters-list')
@@ -141,6 +143,7 @@ class CharacterViewSetTest(APITestCase):
 
     def test_order_characters(self):
         Character.objects.create(swapi_id=2, name="Darth Vader", gender="male")
+        CharacterSummary.rebuild()
         url = reverse('characters-list')
         response = self.client.get(url, {'ordering': 'name'})
         self.assertEqual(response.status_code, status.HTTP_200_OK)
@@ -158,6 +161,100 @@ class CharacterViewSetTest(APITestCase):
         response = self.client.delete(url)
         self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
 
+    def test_retrieve_character_is_single_query(self):
+        url = reverse('characters-detail', args=[self.character.id])
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.data['id'], self.character.id)
+        self.assertEqual(response.data['films'], [{'id': self.film.id, 'title': 'A New Hope'}])
+        self.assertEqual(response.data['films_count'], 1)
+
+    @override_settings(CHARACTER_SUMMARY_READS=False)
+    def test_retrieve_character_without_read_model(self):
+        url = reverse('characters-detail', args=[self.character.id])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['films'][0]['title'], 'A New Hope')
+
+    def test_character_facets(self):
+        cache.clear()
+        Character.objects.create(swapi_id=2, name="Leia Organa", gender="female", eye_color="brown")
+        Character.objects.create(swapi_id=3, name="Darth Vader", gender="male", eye_color="yellow")
+        CharacterSummary.rebuild()
+        url = reverse('characters-facets')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual(response.data['facets']['gender'][0], {'value': 'male', 'count': 2})
+        self.assertEqual(len(response.data['facets']['eye_color']), 3)
+
+    def test_character_facets_respect_filters(self):
+        cache.clear()
+        Character.objects.create(swapi_id=2, name="Leia Organa", gender="female")
+        CharacterSummary.rebuild()
+        url = reverse('characters-facets')
+        response = self.client.get(url, {'gender': 'female'})
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(response.data['facets']['gender'], [{'value': 'female', 'count': 1}])
+        response = self.client.get(url, {'search': 'LUKE'})
+        self.assertEqual(response.data['facets']['gender'], [{'value': 'male', 'count': 1}])
+
+    def test_summary_follows_edits(self):
+        starship = Starship.objects.create(
+            swapi_id=12,
+            name="X-wing",
+            model="T-65 X-wing",
+            manufacturer="Incom Corporation",
+            starship_class="Starfighter"
+        )
+        CharacterSummary.rebuild()
+        first_refresh = CharacterSummary.objects.get(pk=self.character.id).refreshed_at
+        with self.captureOnCommitCallbacks(execute=True):
+            self.character.name = "Luke"
+            self.character.save()
+            self.character.starships.add(starship)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.film.title = "Star Wars"
+            self.film.save()
+        summary = CharacterSummary.objects.get(pk=self.character.id)
+        self.assertEqual(summary.name, "Luke")
+        self.assertEqual(summary.films, [{'id': self.film.id, 'title': 'Star Wars'}])
+        self.assertEqual(summary.starships, [{'id': starship.id, 'name': 'X-wing'}])
+        self.assertGreater(summary.refreshed_at, first_refresh)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.film.delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            starship.pilots.clear()
+        summary.refresh_from_db()
+        self.assertEqual((summary.films_count, summary.starships_count), (0, 0))
+
+    def test_character_facets_cached_until_sync(self):
+        cache.clear()
+        url = reverse('characters-facets')
+        self.client.get(url, {'gender': 'male', 'page': 2})
+        Character.objects.create(swapi_id=2, name="Obi-Wan Kenobi", gender="male")
+        CharacterSummary.rebuild()
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {'gender': 'male'})
+        self.assertEqual(response.data['count'], 1)
+        SWAPIService.update_sync_status('characters', is_syncing=False, total_records=2)
+        response = self.client.get(url, {'gender': 'male'})
+        self.assertEqual(response.data['count'], 2)
+
+    def test_character_facets_cache_key_is_normalized(self):
+        cache.clear()
+        url = reverse('characters-facets')
+        self.client.get(url + '?search=Luke%20Sky&gender=male&page=3&page_size=5')
+        for query in ['?gender=male&search=sky%20LUKE', '?search=sky,luke&gender=female&gender=%20male%20']:
+            # Only the catalog generation is read
+            with self.assertNumQueries(1):
+                self.client.get(url + query)
+        # Only the last value of a filter is applied, so it alone is part of the key
+        with self.assertNumQueries(2):
+            response = self.client.get(url + '?search=luke%20sky&gender=male&gender=female')
+        self.assertEqual(response.data['count'], 0)
+
 class FilmViewSetTest(APITestCase):
     def setUp(self):
         self.film = Film.objects.create(
@@ -222,6 +319,60 @@ class StarshipViewSetTest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data['results']), 1)
 
+    def test_starship_facets(self):
+        cache.clear()
+        url = reverse('starships-facets')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['facets']['starship_class'], [{'value': 'Light freighter', 'count': 1}])
+        self.assertEqual(response.data['facets']['manufacturer'][0]['count'], 1)
+
+class AsyncCatalogViewTest(TestCase):
+    def setUp(self):
+        self.film = Film.objects.create(
+            swapi_id=1,
+            title="A New Hope",
+            episode_id=4,
+            opening_crawl="Test crawl",
+            director="George Lucas",
+            producer="Gary Kurtz",
+            release_date=date(1977, 5, 25)
+        )
+        self.character = Character.objects.create(swapi_id=1, name="Luke Skywalker", gender="male")
+        self.character.films.add(self.film)
+        Character.objects.create(swapi_id=2, name="Leia Organa", gender="female")
+        CharacterSummary.rebuild()
+
+    async def test_async_list_matches_sync(self):
+        sync_response = await self.async_client.get(reverse('characters-list'), {'gender': 'male'})
+        response = await self.async_client.get(reverse('async-characters-list'), {'gender': 'male'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), sync_response.json())
+
+    async def test_async_list_pagination(self):
+        response = await self.async_client.get(reverse('async-characters-list'), {'page_size': 1})
+        data = response.json()
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(len(data['results']), 1)
+        self.assertIn('page=2', data['next'])
+        response = await self.async_client.get(reverse('async-characters-list'), {'page': 9})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_async_retrieve(self):
+        response = await self.async_client.get(reverse('async-characters-detail', args=[self.character.id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['films_count'], 1)
+        response = await self.async_client.get(reverse('async-films-detail', args=[self.film.id]))
+        self.assertEqual(response.json()['characters_count'], 1)
+        response = await self.async_client.get(reverse('async-starships-detail', args=[999]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_async_search(self):
+        response = await self.async_client.get(reverse('async-films-search'), {'q': 'hope'})
+        self.assertEqual(response.json()['count'], 1)
+        response = await self.async_client.get(reverse('async-characters-search'))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
 class SWAPIServiceTest(TestCase):
     def test_extract_id_from_url(self):
         url = "https://swapi.info/api/people/1/"
@@ -324,6 +475,10 @@ class SWAPIServiceTest(TestCase):
         self.assertEqual(len(characters), 1)
         self.assertEqual(characters[0].name, 'Luke Skywalker')
 
+        summary = CharacterSummary.objects.get(pk=characters[0].id)
+        self.assertEqual(summary.films, [{'id': film.id, 'title': 'A New Hope'}])
+        self.assertEqual(summary.starships_count, 0)
+
 class SWAPIViewSetTest(APITestCase):
     @patch.object(SWAPIService, 'populate_all_data')
     def test_populate_all_success(self, mock_populate):
@@ -356,4 +511,64 @@ class SWAPIViewSetTest(APITestCase):
         url = reverse('swapi-sync-status')
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
\ No newline at end of file
+        self.assertEqual(len(response.data), 1)
+
+
+class SyncRunTest(APITestCase):
+    FILMS = [{
+        'title': 'A New Hope', 'episode_id': 4, 'opening_crawl': 'Test crawl', 'director': 'George Lucas',
+        'producer': 'Gary Kurtz', 'release_date': '1977-05-25', 'url': 'https://swapi.info/api/films/1/',
+    }]
+    STARSHIPS = [{'name': 'Millennium Falcon', 'url': 'https://swapi.info/api/starships/10/'}]
+    PEOPLE = [{
+        'name': 'Han Solo', 'films': ['https://swapi.info/api/films/1/'],
+        'starships': ['https://swapi.info/api/starships/10/'], 'url': 'https://swapi.info/api/people/14/',
+    }]
+
+    def fake_response(self, url, **kwargs):
+        response = Mock()
+        response.json.return_value = {
+            'films': self.FILMS, 'starships': self.STARSHIPS, 'people': self.PEOPLE
+        }[url.rsplit('/', 1)[-1]]
+        response.content = b'x' * 100
+        return response
+
+    @override_settings(SYNC_TRACE_MEMORY=True)
+    @patch('core.services.requests.get')
+    def test_populate_records_one_run_per_resource(self, mock_get):
+        mock_get.side_effect = self.fake_response
+        SWAPIService.populate_all_data()
+
+        runs = {run.resource_type: run for run in SyncRun.objects.all()}
+        self.assertEqual(set(runs), {'films', 'starships', 'characters'})
+        self.assertEqual(len({run.run_id for run in runs.values()}), 1)
+        characters = runs['characters']
+        self.assertEqual(characters.status, 'success')
+        self.assertEqual((characters.records_fetched, characters.records_created), (1, 1))
+        self.assertEqual(characters.bytes_downloaded, 100)
+        self.assertGreater(characters.write_seconds, 0)
+        self.assertGreater(characters.link_seconds, 0)
+        self.assertGreater(characters.rows_per_second, 0)
+        self.assertGreater(characters.peak_memory_bytes, 0)
+        self.assertLessEqual(
+            characters.fetch_seconds + characters.parse_seconds + characters.write_seconds + characters.link_seconds,
+            characters.duration_seconds,
+        )
+
+    @patch.object(SWAPIService, 'make_request')
+    def test_sync_status_lists_recent_runs(self, mock_request):
+        mock_request.return_value = self.FILMS
+        for _ in range(3):
+            SWAPIService.fetch_all_films()
+        # Without SYNC_TRACE_MEMORY only the process's RSS high-water mark is recorded
+        run = SyncRun.objects.first()
+        self.assertIsNone(run.peak_memory_bytes)
+        self.assertGreater(run.max_rss_bytes, 0)
+
+        response = self.client.get(reverse('swapi-sync-status'), {'history': 2})
+        films = response.data[0]
+        self.assertEqual(films['resource_type'], 'films')
+        self.assertEqual(len(films['recent_runs']), 2)
+        self.assertEqual(films['recent_runs'][0]['records_fetched'], 1)
+        self.assertIn('parse_seconds', films['recent_runs'][0])
+        self.assertEqual(self.client.get(reverse('swapi-sync-status'), {'history': 'x'}).status_code, 400)
@@ -4,15 +4,26 @@ from rest_framework.response import Response
 from rest_framework.pagination import PageNumberPagination
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, Window
+from django.db.models.functions import RowNumber
+from django.utils.http import urlencode
 from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiExample
 from drf_spectacular.types import OpenApiTypes
-from .models import Character, Film, Starship, DataSyncStatus
+from .models import Character, CharacterSummary, Film, Starship, DataSyncStatus, SyncRun
 from .serializers import (
     CharacterSerializer, CharacterListSerializer,
+    CharacterSummarySerializer, CharacterSummaryListSerializer,
     FilmSerializer, StarshipSerializer,
     DataSyncStatusSerializer
 )
 from .services import SWAPIService, SWAPIError
+from .catalog import catalog_generation
+from starwars_api.instrumentation import TimedSerializerMixin
+from starwars_api.tracing import TracedSerializerMixin, TracedViewMixin
+from starwars_api.metrics import record_cache
+import hashlib
 import logging
 
 logger = logging.getLogger(__name__)
@@ -22,10 +33,74 @@ class StandardResultsSetPagination(PageNumberPagination):
     page_size_query_param = 'page_size'
     max_page_size = 100
 
-class ReadOnlyBaseViewSet(mixins.ListModelMixin,
+class ReadOnlyBaseViewSet(TimedSerializerMixin,
+                          TracedSerializerMixin,
+                          TracedViewMixin,
+                          mixins.ListModelMixin,
                           mixins.RetrieveModelMixin,
                           viewsets.GenericViewSet):
-    pass
+    facet_fields = []
+    facets_cache_timeout = None  # cached until the next sync changes the catalog generation
+
+    def get_facets_cache_key(self, request):
+        """Build a cache key from the filter and search params only, so that
+        pagination, ordering and parameter order do not fragment the cache.
+
+        Params are normalized the way the filters read them: django-filter
+        uses the last value of a field, and search matches every term
+        case-insensitively in any order. Terms are lowercased rather than
+        casefolded, since the database doesn't match 'ß' to 'ss'.
+        """
+        params = []
+        for key in sorted(self.filterset_fields):
+            value = request.query_params.get(key, '').strip()
+            if value:
+                params.append((key, value))
+        terms = sorted({term.lower() for term in SearchFilter().get_search_terms(request)})
+        params.extend((SearchFilter.search_param, term) for term in terms)
+        digest = hashlib.sha1(urlencode(params).encode()).hexdigest()
+        return f"facets:{self.basename}:{catalog_generation()}:{digest}"
+
+    def compute_facets(self, queryset):
+        """Count every facet value with a single GROUP BY over all facet columns."""
+        rows = (
+            queryset.prefetch_related(None)
+            .order_by()
+            .values(*self.facet_fields)
+            .annotate(count=Count('pk'))
+        )
+        counts = {field: {} for field in self.facet_fields}
+        total = 0
+        for row in rows:
+            total += row['count']
+            for field in self.facet_fields:
+                bucket = counts[field]
+                bucket[row[field]] = bucket.get(row[field], 0) + row['count']
+        return {
+            'count': total,
+            'facets': {
+                field: [
+                    {'value': value, 'count': count}
+                    for value, count in sorted(values.items(), key=lambda item: (-item[1], str(item[0])))
+                ]
+                for field, values in counts.items()
+            },
+        }
+
+    @extend_schema(
+        summary="Get facet counts",
+        description="Count results per facet value for the current search and filters. Results are cached until the next SWAPI sync.",
+        responses=OpenApiTypes.OBJECT
+    )
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        cache_key = self.get_facets_cache_key(request)
+        data = cache.get(cache_key)
+        record_cache('facets', hits=data is not None, misses=data is None)
+        if data is None:
+            data = self.compute_facets(self.filter_queryset(self.get_queryset()))
+            cache.set(cache_key, data, self.facets_cache_timeout)
+        return Response(data)
 
 @extend_schema(tags=['Characters'])
 class CharacterViewSet(ReadOnlyBaseViewSet):
@@ -34,11 +109,21 @@ class CharacterViewSet(ReadOnlyBaseViewSet):
     pagination_class = StandardResultsSetPagination
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_fields = ['gender', 'eye_color', 'hair_color']
+    facet_fields = ['gender', 'eye_color', 'hair_color']
     search_fields = ['name', 'hair_color', 'eye_color']
     ordering_fields = ['name', 'height', 'mass', 'created_at']
     ordering = ['name']
 
+    def get_queryset(self):
+        if settings.CHARACTER_SUMMARY_READS:
+            return CharacterSummary.objects.all()
+        return super().get_queryset()
+
     def get_serializer_class(self):
+        if settings.CHARACTER_SUMMARY_READS:
+            if self.action == 'list':
+                return CharacterSummaryListSerializer
+            return CharacterSummarySerializer
         if self.action == 'list':
             return CharacterListSerializer
         return CharacterSerializer
@@ -127,7 +212,7 @@ class CharacterViewSet(ReadOnlyBaseViewSet):
         q = request.GET.get('q', '')
         if not q:
             return Response({'error': 'Query parameter "q" is required'}, status=status.HTTP_400_BAD_REQUEST)
-        queryset = self.queryset.filter(name__icontains=q)
+        queryset = self.get_queryset().filter(name__icontains=q)
         page = self.paginate_queryset(queryset)
         serializer = self.get_serializer(page or queryset, many=True)
         if page is not None:
@@ -141,6 +226,7 @@ class FilmViewSet(ReadOnlyBaseViewSet):
     pagination_class = StandardResultsSetPagination
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_fields = ['episode_id', 'director']
+    facet_fields = ['director']
     search_fields = ['title', 'director', 'opening_crawl']
     ordering_fields = ['title', 'episode_id', 'release_date', 'created_at']
     ordering = ['episode_id']
@@ -240,6 +326,7 @@ class StarshipViewSet(ReadOnlyBaseViewSet):
     pagination_class = StandardResultsSetPagination
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_fields = ['starship_class', 'manufacturer']
+    facet_fields = ['starship_class', 'manufacturer']
     search_fields = ['name', 'model', 'manufacturer']
     ordering_fields = ['name', 'length', 'created_at']
     ordering = ['name']
@@ -331,7 +418,7 @@ class StarshipViewSet(ReadOnlyBaseViewSet):
 
 
 @extend_schema(tags=['SWAPI Integration'])
-class SWAPIViewSet(viewsets.ViewSet):
+class SWAPIViewSet(TracedViewMixin, viewsets.ViewSet):
 
     @extend_schema(
         summary="Populate all SWAPI data",
@@ -359,16 +446,37 @@ class SWAPIViewSet(viewsets.ViewSet):
 
     @extend_schema(
         summary="Get synchronization status",
-        description="Get the current synchronization status for all SWAPI resources including last sync time and record counts."
+        description=(
+            "Get the current synchronization status for all SWAPI resources including last sync time and record counts. "
+            "Each resource also lists its most recent sync runs with per-stage timings (fetch, parse, write, link), "
+            "rows per second, bytes downloaded and peak memory."
+        ),
+        parameters=[
+            OpenApiParameter(
+                name='history', type=OpenApiTypes.INT,
+                description=f'Sync runs to list per resource (default {settings.SYNC_STATUS_HISTORY}, max 100)'
+            ),
+        ]
     )
     @action(detail=False, methods=['get'])
     def sync_status(self, request):
         try:
+            try:
+                history = min(max(int(request.query_params.get('history', settings.SYNC_STATUS_HISTORY)), 0), 100)
+            except ValueError:
+                return Response({'error': 'history must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
             statuses = DataSyncStatus.objects.all()
-            serializer = DataSyncStatusSerializer(statuses, many=True)
+            runs = {}
+            if history:
+                recent = SyncRun.objects.annotate(
+                    position=Window(RowNumber(), partition_by=F('resource_type'), order_by=F('started_at').desc())
+                ).filter(position__lte=history).order_by('resource_type', '-started_at')
+                for run in recent:
+                    runs.setdefault(run.resource_type, []).append(run)
+            serializer = DataSyncStatusSerializer(statuses, many=True, context={'runs': runs})
             return Response(serializer.data)
         except Exception as e:
-            logger.error(f"Error retrieving sync status: {e}")
+            logger.error("Error retrieving sync status: %s", e)
             return Response({
                 'error': 'Failed to retrieve synchronization status'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
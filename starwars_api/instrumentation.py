@@ -0,0 +1,172 @@
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from rest_framework.renderers import JSONRenderer
+
+logger = logging.getLogger(__name__)
+
+# Server-Timing metric names in header order
+STAGES = ['db', 'serialize', 'render']
+
+_timings: ContextVar[Optional['RequestTimings']] = ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    """Seconds spent per stage of one request, plus the number of queries"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.stages = dict.fromkeys(STAGES, 0.0)
+        # Scattered vote queries report from worker threads
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float, queries: int = 0):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+            self.queries += queries
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def server_timing(self) -> str:
+        metrics = [f'db;dur={self.stages["db"] * 1000:.1f};desc="{self.queries} queries"']
+        metrics += [f'{stage};dur={seconds * 1000:.1f}' for stage, seconds in self.stages.items() if stage != 'db']
+        metrics.append(f'total;dur={self.elapsed() * 1000:.1f}')
+        return ', '.join(metrics)
+
+
+def current_timings() -> Optional[RequestTimings]:
+    return _timings.get()
+
+
+@contextmanager
+def request_timings():
+    """Time the block as a request, joining the timings already running in this context if any"""
+    timings = _timings.get()
+    if timings is not None:
+        yield timings
+        return
+    timings = RequestTimings()
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+@contextmanager
+def timed(stage: str):
+    """Count the block's duration towards ``stage`` of the current request, if it is being timed"""
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(stage, time.perf_counter() - started)
+
+
+def _record_query(execute, sql, params, many, context):
+    timings = _timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.add('db', time.perf_counter() - started, queries=1)
+
+
+def _install_query_wrapper(sender=None, connection=None, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def enable_query_timing():
+    """Time queries on every connection; outside timed requests the wrapper only checks a ContextVar"""
+    connection_created.connect(_install_query_wrapper, dispatch_uid='starwars_api.instrumentation')
+    for connection in connections.all(initialized_only=True):
+        _install_query_wrapper(connection=connection)
+
+
+class TimedJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with timed('render'):
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class TimedSerializerMixin:
+    """Count the view's serializer validation and output towards the ``serialize`` stage"""
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        if _timings.get() is not None:
+            for method in ('to_representation', 'is_valid'):
+                setattr(serializer, method, _timed_call('serialize', getattr(serializer, method)))
+        return serializer
+
+
+def _timed_call(stage, func):
+    def wrapper(*args, **kwargs):
+        with timed(stage):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+class ServerTimingMiddleware:
+    """Report DB, serializer and render time of sampled requests in a ``Server-Timing``
+    header and a ``request ...`` log line. Removed from the stack when SERVER_TIMING is off."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.SERVER_TIMING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        enable_query_timing()
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def sampled(self) -> bool:
+        rate = settings.SERVER_TIMING_SAMPLE_RATE
+        return rate >= 1 or random.random() < rate
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+        with request_timings() as timings:
+            response = self.get_response(request)
+        return self.finish(request, response, timings)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+        with request_timings() as timings:
+            response = await self.get_response(request)
+        return self.finish(request, response, timings)
+
+    def finish(self, request, response, timings: RequestTimings):
+        response['Server-Timing'] = timings.server_timing()
+        if logger.isEnabledFor(logging.INFO):
+            match = request.resolver_match
+            stages = ' '.join(f'{stage}_ms={seconds * 1000:.1f}' for stage, seconds in timings.stages.items())
+            logger.info(
+                "request method=%s path=%s view=%s status=%s total_ms=%.1f queries=%s %s",
+                request.method, request.path, match.view_name if match else '-', response.status_code,
+                timings.elapsed() * 1000, timings.queries, stages,
+            )
+        return response
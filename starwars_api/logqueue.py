@@ -0,0 +1,133 @@
+import logging
+import os
+import queue
+import threading
+from logging.handlers import RotatingFileHandler
+
+# Put on the queue by close() to stop the writer after what was queued before it
+_STOP = object()
+_default_formatter = logging.Formatter()
+
+
+class QueuedRotatingFileHandler(logging.Handler):
+    """Rotating file handler that never blocks the logging thread on disk I/O.
+
+    ``emit`` renders the message, then puts the record on a bounded
+    in-memory queue; a writer thread formats queued records and appends them
+    to the file in batches of up to ``batch_size``, rolling it over at
+    ``max_bytes``. When the queue is full records are dropped and
+    counted rather than waiting, and the count is written to the file with
+    the next batch.
+    """
+
+    def __init__(self, filename, max_bytes: int = 0, backup_count: int = 0,
+                 queue_size: int = 10000, batch_size: int = 500, encoding=None):
+        super().__init__()
+        self.file = RotatingFileHandler(
+            filename, maxBytes=max_bytes, backupCount=backup_count, encoding=encoding, delay=True
+        )
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.dropped = 0
+        # Not the handler lock: logging.shutdown holds that while flush() waits for the writer
+        self._dropped_lock = threading.Lock()
+        self.queue = None
+        self._thread = None
+        self._pid = None
+
+    def _start(self):
+        # Also after a fork: the parent's writer thread doesn't exist in the child
+        self._pid = os.getpid()
+        self.queue = queue.Queue(self.queue_size)
+        self._thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+        self._thread.start()
+
+    def handle(self, record) -> bool:
+        # No handler lock: the queue does its own locking
+        rv = self.filter(record)
+        if rv:
+            self.emit(record)
+        return rv
+
+    def emit(self, record):
+        if self._pid != os.getpid():
+            with self.lock:
+                if self._pid != os.getpid():
+                    self._start()
+        # As QueueHandler.prepare does: arguments (mutable objects, model
+        # instances) and tracebacks are rendered now, as they were when logged
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = (self.formatter or _default_formatter).formatException(record.exc_info)
+            record.exc_info = None
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # += isn't atomic; the lock is only taken when the queue is already full
+            with self._dropped_lock:
+                self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            self.write([item for item in batch if isinstance(item, logging.LogRecord)])
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+            if _STOP in batch:
+                return
+
+    def write(self, records):
+        lines = []
+        with self._dropped_lock:
+            dropped, self.dropped = self.dropped, 0
+        if dropped:
+            lines.append(f'{dropped} log records dropped: log queue full\n')
+        for record in records:
+            try:
+                lines.append(self.format(record) + self.file.terminator)
+            except Exception:
+                self.handleError(record)
+        if not lines:
+            return
+        text = ''.join(lines)
+        try:
+            self.file.acquire()
+            try:
+                if self.file.stream is None:
+                    self.file.stream = self.file._open()
+                size = self.file.stream.tell()
+                if self.file.maxBytes and size and size + len(text) >= self.file.maxBytes:
+                    self.file.doRollover()
+                    # Rotated files are reopened lazily
+                    self.file.stream = self.file.stream or self.file._open()
+                self.file.stream.write(text)
+                self.file.stream.flush()
+            finally:
+                self.file.release()
+        except Exception:
+            if records:
+                self.handleError(records[-1])
+
+    def flush(self):
+        """Wait until everything queued so far has been written"""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        written = threading.Event()
+        self.queue.put(written)
+        written.wait(timeout=5)
+
+    def close(self):
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            self.queue.put(_STOP)
+            self._thread.join(timeout=5)
+        self._thread = None
+        self._pid = None
+        self.file.close()
+        super().close()
@@ -0,0 +1,358 @@
+import atexit
+import glob
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from functools import wraps
+from typing import Dict, Iterable, Tuple
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import Http404, HttpResponse
+from .instrumentation import enable_query_timing, request_timings
+
+try:
+    import fcntl
+except ImportError:  # Windows: exited workers' files are kept as they are
+    fcntl = None
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SYNC_BUCKETS = (1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# metrics-<pid>-<random id>.json: the pid to see whether the process is still
+# running, the id so a process that reuses a pid doesn't overwrite its file
+PROCESS_FILE = re.compile(r'^metrics-(\d+)-[0-9a-f]+\.json$')
+# Running totals of exited processes, and which files are already in them
+EXITED_FILE = 'metrics-exited.json'
+
+
+class Registry:
+    """Process-local metric values, shared with other workers through per-pid files.
+
+    With METRICS_DIR set, a background thread writes this process's values
+    to ``METRICS_DIR/metrics-<pid>-<id>.json`` every METRICS_FLUSH_INTERVAL
+    seconds; a scrape adds up every process's file, so counters and
+    histograms cover all workers. Files of processes that have exited are
+    folded into ``metrics-exited.json`` by the next scrape, so their values
+    stay in the totals without the directory growing with every restart.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self._dirty = False
+        self._thread = None
+        self._file_pid = None
+        self._file_name = None
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def changed(self):
+        """Called under ``lock`` after every update"""
+        if os.getpid() != self.pid:
+            # Forked worker: the parent's values are already in its own file
+            self.pid = os.getpid()
+            self._thread = None
+            for metric in self.metrics.values():
+                metric.values.clear()
+        self._dirty = True
+        if self._thread is None and settings.METRICS_DIR:
+            self._thread = threading.Thread(target=self._run, name='metrics-flush', daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def snapshot(self) -> Dict[str, list]:
+        with self.lock:
+            return {
+                name: [[list(labels), value] for labels, value in metric.values.items()]
+                for name, metric in self.metrics.items()
+            }
+
+    def path(self) -> str:
+        if self._file_pid != os.getpid():
+            self._file_pid = os.getpid()
+            self._file_name = f'metrics-{self._file_pid}-{uuid.uuid4().hex[:12]}.json'
+        return os.path.join(settings.METRICS_DIR, self._file_name)
+
+    def flush(self):
+        if not self._dirty or not settings.METRICS_DIR:
+            return
+        self._dirty = False
+        path = self.path()
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(path + '.tmp', path)
+
+    def _run(self):
+        while True:
+            time.sleep(settings.METRICS_FLUSH_INTERVAL)
+            self.flush()
+
+    def collect(self) -> Dict[str, dict]:
+        """Values summed over this process and, with METRICS_DIR, every other process's file"""
+        snapshots = [self.snapshot()]
+        if settings.METRICS_DIR:
+            self.fold_exited()
+            snapshots.extend(self._read_files())
+        return self._merge(snapshots)
+
+    def _merge(self, snapshots) -> Dict[str, dict]:
+        merged = {name: {} for name in self.metrics}
+        for snapshot in snapshots:
+            for name, values in snapshot.items():
+                metric = self.metrics.get(name)
+                if metric is None:
+                    continue
+                for labels, value in values:
+                    key = tuple(labels)
+                    merged[name][key] = metric.combine(merged[name].get(key), value)
+        return merged
+
+    def _process_files(self) -> Dict[str, int]:
+        """Other processes' files in METRICS_DIR, with their pids"""
+        files = {}
+        own = os.path.basename(self.path())
+        for path in glob.glob(os.path.join(settings.METRICS_DIR, 'metrics-*.json')):
+            match = PROCESS_FILE.match(os.path.basename(path))
+            if match and os.path.basename(path) != own:
+                files[path] = int(match.group(1))
+        return files
+
+    def _read_files(self) -> list:
+        # Process files first: one folded in meanwhile is then in the exited totals read after
+        snapshots = {path: _read_json(path) for path in self._process_files()}
+        exited = _read_json(os.path.join(settings.METRICS_DIR, EXITED_FILE)) or {'files': [], 'metrics': {}}
+        folded = set(exited['files'])
+        return [exited['metrics']] + [
+            # None: being replaced right now; its values show up on the next scrape
+            snapshot for path, snapshot in snapshots.items()
+            if snapshot is not None and os.path.basename(path) not in folded
+        ]
+
+    def fold_exited(self):
+        """Add the files of processes that are no longer running to the exited totals, and remove them"""
+        if fcntl is None:
+            return
+        dead = [path for path, pid in self._process_files().items() if not _running(pid)]
+        if not dead:
+            return
+        exited_path = os.path.join(settings.METRICS_DIR, EXITED_FILE)
+        with open(os.path.join(settings.METRICS_DIR, '.lock'), 'w') as lock:
+            # One scraper at a time, or two could each add a file to their own copy of the totals
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            exited = _read_json(exited_path) or {'files': [], 'metrics': {}}
+            # Names are only needed until their file is gone
+            files = [name for name in exited['files'] if os.path.exists(os.path.join(settings.METRICS_DIR, name))]
+            snapshots = [exited['metrics']]
+            for path in dead:
+                snapshot = _read_json(path)
+                if snapshot is not None and os.path.basename(path) not in files:
+                    snapshots.append(snapshot)
+                    files.append(os.path.basename(path))
+            metrics = {
+                name: [[list(labels), value] for labels, value in values.items()]
+                for name, values in self._merge(snapshots).items()
+            }
+            with open(exited_path + '.tmp', 'w') as f:
+                json.dump({'files': files, 'metrics': metrics}, f)
+            os.replace(exited_path + '.tmp', exited_path)
+            for path in dead:
+                try:
+                    os.remove(path)
+                except OSError:
+                    # Listed in the totals' files, so it isn't counted twice
+                    pass
+
+    def render(self) -> str:
+        lines = []
+        for name, values in self.collect().items():
+            metric = self.metrics[name]
+            lines.append(f'# HELP {name} {metric.help}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            for labels, value in sorted(values.items()):
+                lines.extend(metric.samples(dict(zip(metric.labelnames, labels)), value))
+        return '\n'.join(lines) + '\n'
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Running as another user
+        return True
+    return True
+
+
+REGISTRY = Registry()
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), registry: Registry = REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[Tuple[str, ...], float] = {}
+        self.registry = registry
+        registry.register(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+            self.registry.changed()
+
+    @staticmethod
+    def combine(total, value):
+        return (total or 0) + value
+
+    def samples(self, labels, value):
+        return [f'{self.name}{_labels(labels)} {value}']
+
+
+class Histogram(Counter):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS, registry=REGISTRY):
+        super().__init__(name, help, labelnames, registry)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self.registry.lock:
+            # Per-bucket counts (the last is +Inf), then the sum of observations
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+            self.registry.changed()
+
+    @staticmethod
+    def combine(total, value):
+        return [a + b for a, b in zip(total, value)] if total else list(value)
+
+    def samples(self, labels, value):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), value[:-1]):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{_labels({**labels, "le": bound})} {cumulative}')
+        lines.append(f'{self.name}_sum{_labels(labels)} {value[-1]}')
+        lines.append(f'{self.name}_count{_labels(labels)} {cumulative}')
+        return lines
+
+
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'Request latency by view.', ['view', 'method']
+)
+REQUESTS = Counter('http_requests_total', 'Responses by view and status code.', ['view', 'method', 'status'])
+REQUEST_QUERIES = Histogram(
+    'http_request_db_queries', 'Database queries per request.', ['view'], buckets=QUERY_COUNT_BUCKETS
+)
+REQUEST_DB_DURATION = Histogram('http_request_db_duration_seconds', 'Time in database queries per request.', ['view'])
+CACHE_REQUESTS = Counter('cache_requests_total', 'Cache lookups by cache and result (hit or miss).', ['cache', 'result'])
+VOTES_CAST = Counter('votes_cast_total', 'Votes accepted, by vote type and write path.', ['vote_type', 'mode'])
+SYNC_DURATION = Histogram(
+    'swapi_sync_duration_seconds', 'SWAPI sync duration by resource and outcome.', ['resource', 'result'],
+    buckets=SYNC_BUCKETS
+)
+
+
+def record_cache(cache: str, hits: int = 0, misses: int = 0):
+    if hits:
+        CACHE_REQUESTS.inc(hits, cache=cache, result='hit')
+    if misses:
+        CACHE_REQUESTS.inc(misses, cache=cache, result='miss')
+
+
+def track_sync(resource: str):
+    """Observe the wrapped sync's duration in SYNC_DURATION"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            result = 'error'
+            try:
+                value = func(*args, **kwargs)
+                result = 'success'
+                return value
+            finally:
+                SYNC_DURATION.observe(time.perf_counter() - started, resource=resource, result=result)
+        return wrapper
+    return decorator
+
+
+class MetricsMiddleware:
+    """Record request latency, status and query histograms per view. Removed when METRICS is off."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        enable_query_timing()
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with request_timings() as timings:
+            response = self.get_response(request)
+        self.record(request, response, timings)
+        return response
+
+    async def __acall__(self, request):
+        with request_timings() as timings:
+            response = await self.get_response(request)
+        self.record(request, response, timings)
+        return response
+
+    def record(self, request, response, timings):
+        match = request.resolver_match
+        # Unrouted paths share one label so scanners can't inflate the series count
+        view = match.view_name if match else 'unmatched'
+        REQUEST_DURATION.observe(timings.elapsed(), view=view, method=request.method)
+        REQUESTS.inc(view=view, method=request.method, status=response.status_code)
+        REQUEST_QUERIES.observe(timings.queries, view=view)
+        REQUEST_DB_DURATION.observe(timings.stages['db'], view=view)
+
+
+def metrics_view(request):
+    """Prometheus text exposition of all workers' metrics"""
+    if not settings.METRICS:
+        raise Http404
+    return HttpResponse(REGISTRY.render(), content_type=CONTENT_TYPE)
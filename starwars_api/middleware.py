@@ -0,0 +1,46 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from .routers import _use_primary
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class PrimaryPinningMiddleware:
+    """Pin database reads to the primary for writing requests and, through a
+    short-lived cookie, for the same client's requests right after a write."""
+    sync_capable = True
+    async_capable = True
+    cookie_name = 'primary_pin'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _use_primary.set(self.should_pin(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            _use_primary.reset(token)
+        return self.process_response(request, response)
+
+    async def __acall__(self, request):
+        token = _use_primary.set(self.should_pin(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            _use_primary.reset(token)
+        return self.process_response(request, response)
+
+    def should_pin(self, request):
+        return request.method not in SAFE_METHODS or self.cookie_name in request.COOKIES
+
+    def process_response(self, request, response):
+        if settings.DATABASE_REPLICAS and request.method not in SAFE_METHODS and response.status_code < 400:
+            response.set_cookie(
+                self.cookie_name, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax'
+            )
+        return response
@@ -0,0 +1,195 @@
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Optional
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse, JsonResponse
+
+MODES = ('cpu', 'mem')
+TRACEMALLOC_FRAMES = 64
+
+
+def _frame_name(code) -> str:
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+class StackProfiler:
+    """Deterministic profiler of the current thread that attributes time to whole stacks.
+
+    Every call and return switches the stack that elapsed time counts
+    towards, so the result is self time per stack. ``folded()`` returns one
+    ``outer;...;inner microseconds`` line per stack, the input format of
+    flamegraph.pl and speedscope.
+    """
+
+    def __init__(self):
+        self.stacks = Counter()
+        self._keys = {}
+        self._current = None
+        self._last = 0.0
+
+    def _key(self, frame) -> str:
+        key = self._keys.get(frame)
+        if key is None:
+            name = _frame_name(frame.f_code)
+            key = name if frame.f_back is None else f'{self._key(frame.f_back)};{name}'
+            self._keys[frame] = key
+        return key
+
+    def _profile(self, frame, event, arg):
+        now = time.perf_counter()
+        if self._current is not None:
+            self.stacks[self._current] += now - self._last
+        if event == 'call':
+            self._current = self._key(frame)
+        elif event == 'return':
+            # Also fires when a coroutine suspends; resuming it is a new call
+            self._keys.pop(frame, None)
+            self._current = self._key(frame.f_back) if frame.f_back is not None else None
+        elif event == 'c_call':
+            self._current = f'{self._key(frame)};{getattr(arg, "__qualname__", arg)} (builtin)'
+        else:
+            self._current = self._key(frame)
+        # Keep the profiler's own bookkeeping out of the measurement
+        self._last = time.perf_counter()
+
+    def __enter__(self):
+        self._previous = sys.getprofile()
+        self._last = time.perf_counter()
+        sys.setprofile(self._profile)
+        return self
+
+    def __exit__(self, *exc):
+        sys.setprofile(self._previous)
+        self._keys.clear()
+
+    def folded(self) -> str:
+        return ''.join(
+            f'{stack} {round(seconds * 1e6)}\n'
+            for stack, seconds in self.stacks.most_common() if seconds >= 5e-7
+        )
+
+
+def folded_allocations(snapshot: tracemalloc.Snapshot) -> str:
+    """Bytes still allocated at the end of the request, as folded stacks weighted by size"""
+    stacks = Counter()
+    for stat in snapshot.statistics('traceback'):
+        frames = [f'{os.path.basename(frame.filename)}:{frame.lineno}' for frame in reversed(stat.traceback)]
+        stacks[';'.join(frames)] += stat.size
+    return ''.join(f'{stack} {size}\n' for stack, size in stacks.most_common())
+
+
+class ProfilingMiddleware:
+    """Profile one request when a staff user adds ``?_profile=cpu`` or ``?_profile=mem``.
+
+    ``cpu`` runs the request under a deterministic profiler, so its times are
+    inflated but every call is seen; ``mem`` traces allocations with
+    tracemalloc. The response is
+    replaced by the profile as folded stacks (flamegraph.pl/speedscope input),
+    which is also saved under REQUEST_PROFILING_DIR when set. At most
+    REQUEST_PROFILING_RATE_LIMIT profiles run per minute per process. Removed
+    from the stack when REQUEST_PROFILING is off; otherwise other requests
+    only pay for a substring check of the query string.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self._started = deque()
+        self._lock = threading.Lock()
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def requested_mode(self, request) -> Optional[str]:
+        if '_profile=' not in request.META.get('QUERY_STRING', ''):
+            return None
+        return request.GET.get('_profile')
+
+    def refusal(self, request, mode) -> Optional[HttpResponse]:
+        if mode not in MODES:
+            return JsonResponse({'error': f'_profile must be one of: {", ".join(MODES)}'}, status=400)
+        if not (request.user.is_authenticated and request.user.is_staff):
+            return JsonResponse({'error': 'Profiling is restricted to staff users'}, status=403)
+        now = time.monotonic()
+        with self._lock:
+            while self._started and now - self._started[0] > 60:
+                self._started.popleft()
+            if len(self._started) >= settings.REQUEST_PROFILING_RATE_LIMIT:
+                return JsonResponse({'error': 'Profiling rate limit reached, try again in a minute'}, status=429)
+            self._started.append(now)
+        return None
+
+    @contextmanager
+    def profiled(self, mode):
+        """Profile the block; yields a dict that receives ``folded`` and, for mem, ``peak_bytes``"""
+        result = {}
+        if mode == 'cpu':
+            # On the async path this profiles the event loop thread, so concurrent requests show up too
+            with StackProfiler() as profiler:
+                yield result
+            result['folded'] = profiler.folded()
+            return
+        was_tracing = tracemalloc.is_tracing()
+        if was_tracing:
+            # Someone else is tracing (e.g. a sync's telemetry): measure the peak from here,
+            # above what was already allocated, not since they started
+            tracemalloc.reset_peak()
+        else:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        baseline = tracemalloc.get_traced_memory()[0]
+        try:
+            yield result
+            result['folded'] = folded_allocations(tracemalloc.take_snapshot())
+            result['peak_bytes'] = tracemalloc.get_traced_memory()[1] - baseline
+        finally:
+            if not was_tracing:
+                tracemalloc.stop()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        mode = self.requested_mode(request)
+        if mode is None:
+            return self.get_response(request)
+        refusal = self.refusal(request, mode)
+        if refusal is not None:
+            return refusal
+        with self.profiled(mode) as profile:
+            response = self.get_response(request)
+        return self.profile_response(request, mode, response, profile)
+
+    async def __acall__(self, request):
+        mode = self.requested_mode(request)
+        if mode is None:
+            return await self.get_response(request)
+        refusal = await sync_to_async(self.refusal)(request, mode)
+        if refusal is not None:
+            return refusal
+        with self.profiled(mode) as profile:
+            response = await self.get_response(request)
+        return self.profile_response(request, mode, response, profile)
+
+    def profile_response(self, request, mode, response, profile: dict):
+        folded = profile['folded']
+        result = HttpResponse(folded, content_type='text/plain; charset=utf-8')
+        result['X-Profile-Mode'] = mode
+        result['X-Profiled-Status'] = str(response.status_code)
+        if 'peak_bytes' in profile:
+            result['X-Profile-Peak-Bytes'] = str(profile['peak_bytes'])
+        if settings.REQUEST_PROFILING_DIR:
+            match = request.resolver_match
+            view = match.view_name if match else 'unmatched'
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{view}-{mode}.folded"
+            with open(os.path.join(settings.REQUEST_PROFILING_DIR, name), 'w') as f:
+                f.write(folded)
+            result['X-Profile-File'] = name
+        return result
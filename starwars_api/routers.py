@@ -0,0 +1,53 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from django.conf import settings
+
+_use_primary = ContextVar('use_primary', default=False)
+
+
+@contextmanager
+def use_primary():
+    """Send reads inside the block to the primary"""
+    token = _use_primary.set(True)
+    try:
+        yield
+    finally:
+        _use_primary.reset(token)
+
+
+def primary_reads(func):
+    """Decorator running ``func`` with reads pinned to the primary"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with use_primary():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+class PrimaryReplicaRouter:
+    """Send writes to the primary and spread reads across DATABASE_REPLICAS.
+
+    Reads stay on the primary while pinned (see ``use_primary``),
+    which the PrimaryPinningMiddleware does for writing requests and for a
+    short window after them so clients read their own writes.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas or _use_primary.get():
+            return 'default'
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {'default', *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
@@ -0,0 +1,172 @@
+import glob
+import gzip
+import hashlib
+import logging
+import os
+import threading
+from typing import Dict
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+
+logger = logging.getLogger(__name__)
+
+# format -> (file extension, content type)
+FORMATS = {
+    'yaml': ('yaml', 'application/vnd.oai.openapi; charset=utf-8'),
+    'json': ('json', 'application/vnd.oai.openapi+json; charset=utf-8'),
+}
+# Source that ends up in the schema; a change to any of it is a new version
+SOURCE_DIRS = ['core', 'voting', 'starwars_api']
+
+
+class SchemaDocument:
+    """One rendering of the schema, kept as plain and gzipped bytes"""
+
+    def __init__(self, body: bytes, content_type: str):
+        self.body = body
+        self.gzipped = gzip.compress(body, 9)
+        self.content_type = content_type
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        self.etag = f'"{digest}"'
+        # Each content coding is its own representation, so it gets its own tag
+        self.gzip_etag = f'"{digest}-gzip"'
+
+
+_documents: Dict[str, SchemaDocument] = {}
+_version = None
+_lock = threading.Lock()
+
+
+def schema_version() -> str:
+    """SCHEMA_VERSION, or a hash of the project's Python source and settings"""
+    global _version
+    if _version is None:
+        if settings.SCHEMA_VERSION:
+            _version = settings.SCHEMA_VERSION
+        else:
+            digest = hashlib.sha256(repr(settings.SPECTACULAR_SETTINGS).encode())
+            for directory in SOURCE_DIRS:
+                for path in sorted(glob.glob(os.path.join(settings.BASE_DIR, directory, '**', '*.py'), recursive=True)):
+                    with open(path, 'rb') as f:
+                        digest.update(f.read())
+            _version = digest.hexdigest()[:16]
+    return _version
+
+
+def _path(version: str, fmt: str) -> str:
+    return os.path.join(settings.SCHEMA_CACHE_DIR, f'schema-{version}.{FORMATS[fmt][0]}')
+
+
+def render_schema() -> Dict[str, bytes]:
+    """Generate the schema with drf_spectacular, in every format"""
+    from drf_spectacular.generators import SchemaGenerator
+    from drf_spectacular.renderers import OpenApiJsonRenderer, OpenApiYamlRenderer
+
+    schema = SchemaGenerator().get_schema(request=None, public=True)
+    return {
+        'yaml': OpenApiYamlRenderer().render(schema, renderer_context={}),
+        'json': OpenApiJsonRenderer().render(schema, renderer_context={}),
+    }
+
+
+def write_schema(version: str, bodies: Dict[str, bytes]):
+    """Save the rendered schema under SCHEMA_CACHE_DIR, replacing other versions"""
+    os.makedirs(settings.SCHEMA_CACHE_DIR, exist_ok=True)
+    for fmt, body in bodies.items():
+        path = _path(version, fmt)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(body)
+        os.replace(path + '.tmp', path)
+    for path in glob.glob(os.path.join(settings.SCHEMA_CACHE_DIR, 'schema-*')):
+        if not os.path.basename(path).startswith(f'schema-{version}.'):
+            os.remove(path)
+
+
+def get_schema_document(fmt: str) -> SchemaDocument:
+    """The schema for this code version: from memory, else SCHEMA_CACHE_DIR, else generated once"""
+    document = _documents.get(fmt)
+    if document is not None:
+        return document
+    with _lock:
+        if fmt not in _documents:
+            version = schema_version()
+            bodies = {}
+            try:
+                for name in FORMATS:
+                    with open(_path(version, name), 'rb') as f:
+                        bodies[name] = f.read()
+            except OSError:
+                bodies = render_schema()
+                try:
+                    write_schema(version, bodies)
+                except OSError as e:
+                    # e.g. a read-only image; this process keeps it in memory anyway
+                    logger.warning("Could not cache the OpenAPI schema in %s: %s", settings.SCHEMA_CACHE_DIR, e)
+            for name, body in bodies.items():
+                _documents[name] = SchemaDocument(body, FORMATS[name][1])
+        return _documents[fmt]
+
+
+def requested_format(request) -> str:
+    fmt = request.GET.get('format')
+    if fmt in FORMATS:
+        return fmt
+    accept = request.headers.get('Accept', '')
+    return 'json' if 'json' in accept and 'yaml' not in accept else 'yaml'
+
+
+def accepts_gzip(request) -> bool:
+    """Whether Accept-Encoding allows gzip, by name or through ``*``, with a non-zero q"""
+    qualities = {}
+    for coding in request.headers.get('Accept-Encoding', '').split(','):
+        name, *params = [part.strip() for part in coding.split(';')]
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name:
+            qualities[name.lower()] = quality
+    return qualities.get('gzip', qualities.get('*', 0.0)) > 0
+
+
+def etag_matches(request, etag: str) -> bool:
+    """Weak If-None-Match comparison against one exact tag"""
+    tags = parse_etags(request.headers.get('If-None-Match', ''))
+    return '*' in tags or etag in (tag.removeprefix('W/') for tag in tags)
+
+
+def schema_view(request):
+    """OpenAPI schema as precomputed bytes, with ETag revalidation and gzip"""
+    document = get_schema_document(requested_format(request))
+    gzipped = accepts_gzip(request)
+    etag = document.gzip_etag if gzipped else document.etag
+    if etag_matches(request, etag):
+        response = HttpResponseNotModified()
+    elif gzipped:
+        response = HttpResponse(document.gzipped, content_type=document.content_type)
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(document.body, content_type=document.content_type)
+    response['ETag'] = etag
+    response['Cache-Control'] = f'public, max-age={settings.SCHEMA_MAX_AGE}'
+    patch_vary_headers(response, ['Accept', 'Accept-Encoding'])
+    return response
+
+
+def docs_view(name: str):
+    """A drf_spectacular docs page (e.g. ``SpectacularSwaggerView``), imported on its first request"""
+    view = None
+
+    def lazy_docs_view(request, *args, **kwargs):
+        nonlocal view
+        if view is None:
+            from drf_spectacular import views
+            view = getattr(views, name).as_view(url_name='schema')
+        return view(request, *args, **kwargs)
+    return lazy_docs_view
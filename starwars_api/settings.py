@@ -1,6 +1,6 @@
 from pathlib import Path
 import os
-from decouple import config
+from decouple import config, Csv
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -25,12 +25,18 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "starwars_api.tracing.TracingMiddleware",
+    "starwars_api.instrumentation.ServerTimingMiddleware",
+    "starwars_api.metrics.MetricsMiddleware",
+    "starwars_api.slowqueries.SlowQueryMiddleware",
     "corsheaders.middleware.CorsMiddleware",
+    "starwars_api.middleware.PrimaryPinningMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "starwars_api.profiling.ProfilingMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -64,9 +70,57 @@ DATABASES = {
         "PASSWORD": config('DB_PASSWORD'),
         "HOST": config('DB_HOST', default='localhost'),
         "PORT": config('DB_PORT', default='5432'),
+        "CONN_MAX_AGE": config('DB_CONN_MAX_AGE', default=0, cast=int),
+        "CONN_HEALTH_CHECKS": config('DB_CONN_HEALTH_CHECKS', default=False, cast=bool),
     }
 }
 
+# Django's PostgreSQL connection pool (psycopg 3 with psycopg_pool), one per
+# process and database. Pooled connections replace persistent ones, and the
+# health check runs on every checkout.
+if config('DB_POOL', default=False, cast=bool):
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = config('DB_POOL_CHECK', default=True, cast=bool)
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': config('DB_POOL_MIN_SIZE', default=1, cast=int),
+            'max_size': config('DB_POOL_MAX_SIZE', default=10, cast=int),
+            'timeout': config('DB_POOL_TIMEOUT', default=30.0, cast=float),
+            'max_idle': config('DB_POOL_MAX_IDLE', default=600.0, cast=float),
+        },
+    }
+
+# Read replicas: "host[:port]" entries sharing the primary's credentials
+# (file paths when the primary is SQLite). Reads go to a random replica.
+DATABASE_REPLICAS = []
+for index, replica in enumerate(config('DB_REPLICAS', default='', cast=Csv())):
+    alias = f'replica_{index + 1}'
+    if 'sqlite' in DATABASES['default']['ENGINE']:
+        DATABASES[alias] = {**DATABASES['default'], 'NAME': replica}
+    else:
+        host, _, port = replica.partition(':')
+        DATABASES[alias] = {**DATABASES['default'], 'HOST': host, 'PORT': port or DATABASES['default']['PORT']}
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(alias)
+
+# Vote shards: "host[:port]" entries (file paths when the primary is SQLite).
+# Vote rows are spread across them by a hash of (vote_type, item_id); the
+# catalog and everything else stays on the default database.
+VOTE_SHARD_DATABASES = []
+for index, shard in enumerate(config('DB_VOTE_SHARDS', default='', cast=Csv())):
+    alias = f'votes_{index}'
+    if 'sqlite' in DATABASES['default']['ENGINE']:
+        DATABASES[alias] = {**DATABASES['default'], 'NAME': shard}
+    else:
+        host, _, port = shard.partition(':')
+        DATABASES[alias] = {**DATABASES['default'], 'HOST': host, 'PORT': port or DATABASES['default']['PORT']}
+    VOTE_SHARD_DATABASES.append(alias)
+
+DATABASE_ROUTERS = ['voting.sharding.VoteShardRouter', 'starwars_api.routers.PrimaryReplicaRouter']
+
+# Seconds a client keeps reading from the primary after one of its writes
+REPLICA_PIN_SECONDS = config('DB_REPLICA_PIN_SECONDS', default=5, cast=int)
+
 # REST Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
@@ -78,10 +132,106 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'starwars_api.instrumentation.TimedJSONRenderer',
     ],
 }
 
+# Serve character list/detail from the denormalized CharacterSummary read model
+CHARACTER_SUMMARY_READS = config('CHARACTER_SUMMARY_READS', default=True, cast=bool)
+
+# Validate voted ids against an in-memory index of catalog ids, re-checking
+# the catalog generation at most every CATALOG_ID_INDEX_CHECK_INTERVAL seconds
+CATALOG_ID_INDEX = config('CATALOG_ID_INDEX', default=True, cast=bool)
+CATALOG_ID_INDEX_CHECK_INTERVAL = config('CATALOG_ID_INDEX_CHECK_INTERVAL', default=5.0, cast=float)
+
+# Write-behind voting: buffer votes per process and flush them as batched
+# increments every VOTE_FLUSH_INTERVAL seconds or VOTE_FLUSH_MAX_PENDING votes
+VOTE_WRITE_BEHIND = config('VOTE_WRITE_BEHIND', default=False, cast=bool)
+VOTE_FLUSH_INTERVAL = config('VOTE_FLUSH_INTERVAL', default=1.0, cast=float)
+VOTE_FLUSH_MAX_PENDING = config('VOTE_FLUSH_MAX_PENDING', default=1000, cast=int)
+
+# Sharded vote counters: spread each item's votes over N shard rows (0 = off),
+# folded back into Vote every VOTE_SHARD_COMPACT_INTERVAL seconds (0 = command only)
+VOTE_COUNTER_SHARDS = config('VOTE_COUNTER_SHARDS', default=0, cast=int)
+VOTE_SHARD_COMPACT_INTERVAL = config('VOTE_SHARD_COMPACT_INTERVAL', default=30.0, cast=float)
+
+# In-memory vote leaderboard serving stats and rank lookups, reloaded from the
+# database every VOTE_LEADERBOARD_VERIFY_INTERVAL seconds (0 = never)
+VOTE_LEADERBOARD = config('VOTE_LEADERBOARD', default=False, cast=bool)
+VOTE_LEADERBOARD_VERIFY_INTERVAL = config('VOTE_LEADERBOARD_VERIFY_INTERVAL', default=60.0, cast=float)
+
+# Vote history: per-minute counts rolled up into hour and day buckets, flushed
+# every VOTE_HISTORY_FLUSH_INTERVAL seconds; retention per resolution (0 = forever)
+VOTE_HISTORY = config('VOTE_HISTORY', default=False, cast=bool)
+VOTE_HISTORY_FLUSH_INTERVAL = config('VOTE_HISTORY_FLUSH_INTERVAL', default=10.0, cast=float)
+VOTE_HISTORY_MINUTE_RETENTION_HOURS = config('VOTE_HISTORY_MINUTE_RETENTION_HOURS', default=48, cast=int)
+VOTE_HISTORY_HOUR_RETENTION_DAYS = config('VOTE_HISTORY_HOUR_RETENTION_DAYS', default=90, cast=int)
+VOTE_HISTORY_DAY_RETENTION_DAYS = config('VOTE_HISTORY_DAY_RETENTION_DAYS', default=0, cast=int)
+
+# Seconds between pushes on the vote stats event stream
+VOTE_STREAM_INTERVAL = config('VOTE_STREAM_INTERVAL', default=2.0, cast=float)
+
+# Estimate distinct voters per item from the optional voter_id on votes,
+# using a HyperLogLog sketch per item (~1.6% standard error)
+VOTE_UNIQUE_VOTERS = config('VOTE_UNIQUE_VOTERS', default=False, cast=bool)
+# Rows each category's voter sketch is split over, so votes don't all lock one row
+VOTE_UNIQUE_VOTERS_CATEGORY_SLOTS = config('VOTE_UNIQUE_VOTERS_CATEGORY_SLOTS', default=16, cast=int)
+
+# Per-request Server-Timing header and timing log line (DB, serializer and
+# render time); the middleware removes itself when disabled
+SERVER_TIMING = config('SERVER_TIMING', default=False, cast=bool)
+SERVER_TIMING_SAMPLE_RATE = config('SERVER_TIMING_SAMPLE_RATE', default=1.0, cast=float)
+
+# Prometheus metrics at /metrics; with several worker processes point
+# METRICS_DIR at a directory they share (emptied on deploy) so the scrape
+# adds up every worker's values
+METRICS = config('METRICS', default=False, cast=bool)
+METRICS_DIR = config('METRICS_DIR', default='')
+METRICS_FLUSH_INTERVAL = config('METRICS_FLUSH_INTERVAL', default=1.0, cast=float)
+
+# Slow query log: queries over SLOW_QUERY_MS (0 = off) are kept with their
+# view, stack and, on PostgreSQL, EXPLAIN plan in a per-process ring buffer
+SLOW_QUERY_MS = config('SLOW_QUERY_MS', default=0, cast=float)
+SLOW_QUERY_LOG_SIZE = config('SLOW_QUERY_LOG_SIZE', default=100, cast=int)
+SLOW_QUERY_EXPLAIN = config('SLOW_QUERY_EXPLAIN', default=True, cast=bool)
+
+# On-demand profiling: staff add ?_profile=cpu or ?_profile=mem to get the
+# request's profile as folded stacks, rate limited per worker process
+REQUEST_PROFILING = config('REQUEST_PROFILING', default=False, cast=bool)
+REQUEST_PROFILING_RATE_LIMIT = config('REQUEST_PROFILING_RATE_LIMIT', default=6, cast=int)
+REQUEST_PROFILING_DIR = config('REQUEST_PROFILING_DIR', default='')
+
+# Logging: records are queued and written to starwars_api.log by a background
+# thread in batches; the file rotates at LOG_FILE_MAX_BYTES (0 = never)
+LOG_FILE_MAX_BYTES = config('LOG_FILE_MAX_BYTES', default=10 * 1024 * 1024, cast=int)
+LOG_FILE_BACKUP_COUNT = config('LOG_FILE_BACKUP_COUNT', default=5, cast=int)
+LOG_QUEUE_SIZE = config('LOG_QUEUE_SIZE', default=10000, cast=int)
+
+# SWAPI sync history: every resource sync is saved as a SyncRun with its
+# stage times; sync_status lists the last SYNC_STATUS_HISTORY runs per resource.
+# SYNC_TRACE_MEMORY adds peak memory via tracemalloc, which slows every thread of
+# the process (and so inflates the recorded stage times) while a sync runs
+SYNC_TRACE_MEMORY = config('SYNC_TRACE_MEMORY', default=False, cast=bool)
+SYNC_STATUS_HISTORY = config('SYNC_STATUS_HISTORY', default=10, cast=int)
+
+# Tracing: a TRACING_SAMPLE_RATE share of requests (or those whose incoming
+# traceparent is sampled) get spans for views, serializers, queries and SWAPI
+# calls, exported as OTLP/JSON to TRACING_FILE or an OTLP/HTTP collector
+TRACING = config('TRACING', default=False, cast=bool)
+TRACING_SAMPLE_RATE = config('TRACING_SAMPLE_RATE', default=0.1, cast=float)
+TRACING_EXPORTER = config('TRACING_EXPORTER', default='file')
+TRACING_FILE = config('TRACING_FILE', default=str(BASE_DIR / 'traces.jsonl'))
+TRACING_OTLP_ENDPOINT = config('TRACING_OTLP_ENDPOINT', default='http://localhost:4318/v1/traces')
+TRACING_EXPORT_INTERVAL = config('TRACING_EXPORT_INTERVAL', default=1.0, cast=float)
+TRACING_SERVICE_NAME = config('TRACING_SERVICE_NAME', default='starwars_api')
+
+# OpenAPI schema: rendered once per code version (SCHEMA_VERSION, or a hash of
+# the source) by `manage.py generate_schema` or the first request, then served
+# from SCHEMA_CACHE_DIR and memory
+SCHEMA_VERSION = config('SCHEMA_VERSION', default='')
+SCHEMA_CACHE_DIR = config('SCHEMA_CACHE_DIR', default=str(BASE_DIR / 'schema_cache'))
+SCHEMA_MAX_AGE = config('SCHEMA_MAX_AGE', default=300, cast=int)
+
 # API Documentation
 SPECTACULAR_SETTINGS = {
     'TITLE': 'Star Wars API',
@@ -142,8 +292,11 @@ LOGGING = {
     'handlers': {
         'file': {
             'level': 'INFO',
-            'class': 'logging.FileHandler',
+            'class': 'starwars_api.logqueue.QueuedRotatingFileHandler',
             'filename': BASE_DIR / 'starwars_api.log',
+            'max_bytes': LOG_FILE_MAX_BYTES,
+            'backup_count': LOG_FILE_BACKUP_COUNT,
+            'queue_size': LOG_QUEUE_SIZE,
         },
     },
     'root': {
@@ -0,0 +1,177 @@
+import logging
+import threading
+import time
+import traceback
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from typing import List, Optional
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+MAX_PARAMS_LENGTH = 1000
+STACK_FRAMES = 12
+# Plans reused for repeats of the same statement, so a hot slow query is explained once
+EXPLAIN_CACHE_SIZE = 256
+# Statements EXPLAIN accepts; anything else (DDL, SAVEPOINT, SET...) isn't explained
+EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE')
+
+_current_request = ContextVar('slow_query_request', default=None)
+
+
+class SlowQueryLog:
+    """Bounded, newest-last ring buffer of slow queries seen by this process"""
+
+    def __init__(self, size: int):
+        self.entries = deque(maxlen=size)
+        self.plans = OrderedDict()
+        self.lock = threading.Lock()
+
+    def add(self, entry: dict):
+        with self.lock:
+            self.entries.append(entry)
+
+    def cached_plan(self, alias: str, sql: str):
+        with self.lock:
+            plan = self.plans.get((alias, sql))
+            if plan is not None:
+                self.plans.move_to_end((alias, sql))
+            return plan
+
+    def cache_plan(self, alias: str, sql: str, plan: str):
+        with self.lock:
+            self.plans[(alias, sql)] = plan
+            while len(self.plans) > EXPLAIN_CACHE_SIZE:
+                self.plans.popitem(last=False)
+
+    def recent(self, limit: Optional[int] = None) -> List[dict]:
+        with self.lock:
+            entries = list(reversed(self.entries))
+        return entries[:limit] if limit else entries
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+_log = None
+_log_lock = threading.Lock()
+
+
+def get_slow_query_log() -> SlowQueryLog:
+    global _log
+    with _log_lock:
+        if _log is None:
+            _log = SlowQueryLog(settings.SLOW_QUERY_LOG_SIZE)
+        return _log
+
+
+def _app_stack() -> List[str]:
+    """Innermost project frames of the current stack, skipping Django, DRF and this module"""
+    base = str(settings.BASE_DIR)
+    frames = [
+        frame for frame in traceback.extract_stack()
+        if frame.filename.startswith(base) and 'site-packages' not in frame.filename
+        and not frame.filename.endswith(('slowqueries.py', 'instrumentation.py'))
+    ]
+    return [f'{frame.filename[len(base) + 1:]}:{frame.lineno} in {frame.name}' for frame in frames[-STACK_FRAMES:]]
+
+
+def explain(connection, sql: str, params) -> Optional[str]:
+    """PostgreSQL plan of a statement, from a raw cursor so it isn't itself logged or timed"""
+    if connection.vendor != 'postgresql' or not sql.lstrip().upper().startswith(EXPLAINABLE):
+        return None
+    log = get_slow_query_log()
+    plan = log.cached_plan(connection.alias, sql)
+    if plan is None:
+        # A failed statement aborts the whole transaction on PostgreSQL; inside
+        # the request's own transaction the EXPLAIN gets a savepoint to undo it
+        in_transaction = connection.in_atomic_block or not connection.get_autocommit()
+        with connection.connection.cursor() as cursor:
+            if in_transaction:
+                cursor.execute('SAVEPOINT slow_query_explain')
+            try:
+                cursor.execute('EXPLAIN ' + sql, params)
+                plan = '\n'.join(row[0] for row in cursor.fetchall())
+            except Exception as e:
+                # e.g. params EXPLAIN can't bind; the query itself already succeeded
+                if in_transaction:
+                    cursor.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+                return f'EXPLAIN failed: {e}'
+            finally:
+                if in_transaction:
+                    cursor.execute('RELEASE SAVEPOINT slow_query_explain')
+        log.cache_plan(connection.alias, sql, plan)
+    return plan
+
+
+def _record_slow_query(execute, sql, params, many, context):
+    started = time.perf_counter()
+    result = execute(sql, params, many, context)
+    threshold = settings.SLOW_QUERY_MS
+    duration_ms = (time.perf_counter() - started) * 1000
+    if threshold and duration_ms >= threshold:
+        connection = context['connection']
+        request = _current_request.get()
+        match = getattr(request, 'resolver_match', None)
+        entry = {
+            'recorded_at': timezone.now().isoformat(),
+            'duration_ms': round(duration_ms, 3),
+            'database': connection.alias,
+            'sql': sql,
+            'params': repr(params)[:MAX_PARAMS_LENGTH],
+            'many': many,
+            'view': match.view_name if match else None,
+            'path': request.get_full_path() if request is not None else None,
+            'stack': _app_stack(),
+            'plan': None if many or not settings.SLOW_QUERY_EXPLAIN else explain(connection, sql, params),
+        }
+        get_slow_query_log().add(entry)
+        logger.warning(
+            "Slow query (%s ms) on %s from %s: %.200s",
+            entry['duration_ms'], entry['database'], entry['view'] or '-', sql,
+        )
+    return result
+
+
+def _install_slow_query_wrapper(sender=None, connection=None, **kwargs):
+    if _record_slow_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_slow_query)
+
+
+class SlowQueryMiddleware:
+    """Record queries slower than SLOW_QUERY_MS with the view, stack and plan that
+    produced them. Removed from the stack, with no query hook, when the threshold is 0."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.SLOW_QUERY_MS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        connection_created.connect(_install_slow_query_wrapper, dispatch_uid='starwars_api.slowqueries')
+        for connection in connections.all(initialized_only=True):
+            _install_slow_query_wrapper(connection=connection)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _current_request.set(request)
+        try:
+            return self.get_response(request)
+        finally:
+            _current_request.reset(token)
+
+    async def __acall__(self, request):
+        token = _current_request.set(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            _current_request.reset(token)
@@ -5,8 +5,27 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': ':memory:',
-    }
+    },
+    # Independent second database for the read-replica routing tests
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    },
+    # Vote shards for the sharding tests, enabled per test
+    'votes_0': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    },
+    'votes_1': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    },
 }
+DATABASE_REPLICAS = []
+VOTE_SHARD_DATABASES = []
+
+# Tests create catalog rows without a sync, which the id index can't notice
+CATALOG_ID_INDEX = False
 
 # Disable migrations for faster tests
 class DisableMigrations:
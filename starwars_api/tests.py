@@ -0,0 +1,455 @@
+import gzip
+import io
+import json
+import logging
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from contextlib import contextmanager
+from unittest.mock import MagicMock, patch
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from core.models import Character
+from core.services import SWAPIService
+from starwars_api import schema
+from starwars_api.instrumentation import current_timings
+from starwars_api.logqueue import QueuedRotatingFileHandler
+from starwars_api.metrics import Counter, Histogram, Registry
+from starwars_api.slowqueries import explain, get_slow_query_log
+from starwars_api.tracing import EXPORTER, start_trace
+
+
+class DbPoolStatusTest(TestCase):
+    def test_reports_stats_of_pooled_databases_to_staff(self):
+        url = reverse('db-pool-status')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(User.objects.create_user('admin', password='secret', is_staff=True))
+        self.assertEqual(self.client.get(url).json(), {})
+        pooled = MagicMock(settings_dict={'OPTIONS': {'pool': {'max_size': 4}}})
+        pooled.pool.get_stats.return_value = {'pool_size': 2, 'requests_waiting': 0}
+        unpooled = MagicMock(settings_dict={'OPTIONS': {}})
+        with patch('starwars_api.views.connections', {'default': pooled, 'replica': unpooled}):
+            self.assertEqual(self.client.get(url).json(), {'default': {'pool_size': 2, 'requests_waiting': 0}})
+
+
+@override_settings(SERVER_TIMING=True)
+class ServerTimingTest(TestCase):
+    def setUp(self):
+        Character.objects.create(swapi_id=1, name="Luke Skywalker")
+
+    def test_header_and_log_line_report_stages(self):
+        with self.assertLogs('starwars_api.instrumentation', 'INFO') as logs:
+            response = self.client.get(reverse('characters-list'))
+        header = response['Server-Timing']
+        queries = int(re.search(r'db;dur=[\d.]+;desc="(\d+) queries"', header).group(1))
+        self.assertGreater(queries, 0)
+        for stage in ('serialize', 'render', 'total'):
+            self.assertRegex(header, rf'{stage};dur=[\d.]+')
+        self.assertIn('view=characters-list status=200', logs.output[0])
+        self.assertIn(f'queries={queries}', logs.output[0])
+        self.assertIsNone(current_timings())
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_not_timed(self):
+        response = self.client.get(reverse('characters-list'))
+        self.assertNotIn('Server-Timing', response)
+
+    @override_settings(SERVER_TIMING=False)
+    def test_disabled_middleware_is_removed(self):
+        response = self.client.get(reverse('characters-list'))
+        self.assertNotIn('Server-Timing', response)
+
+
+class MetricsRegistryTest(SimpleTestCase):
+    def test_histogram_exposition_is_cumulative(self):
+        registry = Registry()
+        histogram = Histogram('latency_seconds', 'Latency.', ['view'], buckets=(0.1, 1.0), registry=registry)
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value, view='a"b')
+        text = registry.render()
+        self.assertIn('# TYPE latency_seconds histogram', text)
+        self.assertIn('latency_seconds_bucket{view="a\\"b",le="0.1"} 2', text)
+        self.assertIn('latency_seconds_bucket{view="a\\"b",le="1.0"} 3', text)
+        self.assertIn('latency_seconds_bucket{view="a\\"b",le="+Inf"} 4', text)
+        self.assertIn('latency_seconds_count{view="a\\"b"} 4', text)
+
+    def test_scrape_adds_up_worker_files(self):
+        registry = Registry()
+        counter = Counter('jobs_total', 'Jobs.', ['kind'], registry=registry)
+        counter.inc(2, kind='sync')
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(METRICS_DIR=directory, METRICS_FLUSH_INTERVAL=3600):
+            registry.flush()
+            self.assertTrue(os.path.exists(registry.path()))
+            # Another worker's file, written the same way (pid 1 is always running)
+            with open(os.path.join(directory, 'metrics-1-0a1b2c.json'), 'w') as f:
+                json.dump({'jobs_total': [[['sync'], 5], [['cleanup'], 1]]}, f)
+            text = registry.render()
+        self.assertIn('jobs_total{kind="sync"} 7', text)
+        self.assertIn('jobs_total{kind="cleanup"} 1', text)
+
+    def test_exited_workers_are_folded_into_the_totals(self):
+        registry = Registry()
+        counter = Counter('jobs_total', 'Jobs.', ['kind'], registry=registry)
+        counter.inc(2, kind='sync')
+        exited = subprocess.Popen([sys.executable, '-c', ''])
+        exited.wait()
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(METRICS_DIR=directory, METRICS_FLUSH_INTERVAL=3600):
+            # Two exited workers that had the same pid
+            for name in (f'metrics-{exited.pid}-aaaa.json', f'metrics-{exited.pid}-bbbb.json'):
+                with open(os.path.join(directory, name), 'w') as f:
+                    json.dump({'jobs_total': [[['sync'], 5]]}, f)
+            for _ in range(2):
+                self.assertIn('jobs_total{kind="sync"} 12', registry.render())
+            self.assertEqual(sorted(os.listdir(directory)), ['.lock', 'metrics-exited.json'])
+        self.assertNotEqual(Registry().path(), registry.path())
+
+
+@override_settings(METRICS=True)
+class MetricsEndpointTest(TestCase):
+    def scrape(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        return response.content.decode()
+
+    def sample(self, text, series):
+        match = re.search(rf'^{re.escape(series)} (\S+)$', text, re.MULTILINE)
+        return float(match.group(1)) if match else 0.0
+
+    def test_requests_and_votes_are_counted(self):
+        luke = Character.objects.create(swapi_id=1, name="Luke Skywalker")
+        requests_series = 'http_requests_total{view="characters-list",method="GET",status="200"}'
+        votes_series = 'votes_cast_total{vote_type="character",mode="direct"}'
+        before = self.scrape()
+        self.client.get(reverse('characters-list'))
+        self.client.post(reverse('votes-list'), {'vote_type': 'character', 'item_id': luke.id})
+        after = self.scrape()
+        self.assertEqual(self.sample(after, requests_series) - self.sample(before, requests_series), 1)
+        self.assertEqual(self.sample(after, votes_series) - self.sample(before, votes_series), 1)
+        self.assertIn('http_request_duration_seconds_bucket{view="characters-list",method="GET",le="+Inf"}', after)
+        self.assertIn('http_request_db_queries_count{view="votes-list"}', after)
+        self.assertIn('# TYPE swapi_sync_duration_seconds histogram', after)
+
+    @override_settings(METRICS=False)
+    def test_disabled_endpoint_is_not_found(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+
+
+class SlowQueryLogTest(TestCase):
+    def setUp(self):
+        Character.objects.create(swapi_id=1, name="Luke Skywalker")
+        get_slow_query_log().clear()
+        self.staff = User.objects.create_user('admin', password='secret', is_staff=True)
+
+    @contextmanager
+    def slow_queries(self):
+        """Treat any query as slow for the block, capturing its warnings"""
+        with self.settings(SLOW_QUERY_MS=0.0001), self.assertLogs('starwars_api.slowqueries', 'WARNING') as logs:
+            yield logs.output
+
+    def test_slow_queries_are_recorded_with_view_and_stack(self):
+        with self.slow_queries() as output:
+            self.client.get(reverse('characters-search'), {'q': 'luke'})
+        self.assertTrue(any('Slow query' in line and 'characters-search' in line for line in output))
+        entries = [entry for entry in get_slow_query_log().recent() if entry['view'] == 'characters-search']
+        self.assertTrue(entries)
+        entry = entries[0]
+        self.assertIn('LIKE', entry['sql'])
+        self.assertIn('%luke%', entry['params'])
+        self.assertEqual(entry['path'], '/api/characters/search/?q=luke')
+        self.assertTrue(any(frame.startswith('core/views.py') for frame in entry['stack']))
+        # EXPLAIN is only captured on PostgreSQL
+        self.assertIsNone(entry['plan'])
+
+    def test_log_is_staff_only_and_bounded(self):
+        with self.slow_queries() as output:
+            self.assertEqual(self.client.get(reverse('slow-queries')).status_code, 403)
+            self.client.force_login(self.staff)
+            for _ in range(3):
+                self.client.get(reverse('characters-list'))
+            response = self.client.get(reverse('slow-queries'), {'limit': 2})
+            self.assertEqual(len(response.json()['entries']), 2)
+            self.assertLessEqual(len(get_slow_query_log().recent()), get_slow_query_log().entries.maxlen)
+            self.assertEqual(self.client.delete(reverse('slow-queries')).status_code, 204)
+        self.assertTrue(all(line.startswith('WARNING:starwars_api.slowqueries:Slow query') for line in output))
+        self.assertEqual(get_slow_query_log().recent(), [])
+
+    def test_failed_explain_is_rolled_back_to_a_savepoint(self):
+        connection = MagicMock(vendor='postgresql', alias='pg', in_atomic_block=True)
+        cursor = connection.connection.cursor.return_value.__enter__.return_value
+
+        def execute(sql, params=None):
+            if sql.startswith('EXPLAIN'):
+                raise ValueError('cannot bind')
+        cursor.execute.side_effect = execute
+
+        self.assertIsNone(explain(connection, 'SAVEPOINT "s1"', None))
+        self.assertEqual(explain(connection, 'SELECT 1 WHERE %s', ['x']), 'EXPLAIN failed: cannot bind')
+        self.assertEqual(
+            [call.args[0] for call in cursor.execute.call_args_list],
+            ['SAVEPOINT slow_query_explain', 'EXPLAIN SELECT 1 WHERE %s',
+             'ROLLBACK TO SAVEPOINT slow_query_explain', 'RELEASE SAVEPOINT slow_query_explain'],
+        )
+
+
+@override_settings(REQUEST_PROFILING=True, REQUEST_PROFILING_RATE_LIMIT=2)
+class RequestProfilingTest(TestCase):
+    def setUp(self):
+        for i in range(1, 30):
+            Character.objects.create(swapi_id=i, name=f"Character {i}")
+        self.staff = User.objects.create_user('admin', password='secret', is_staff=True)
+
+    def test_profile_is_staff_only(self):
+        response = self.client.get(reverse('characters-list'), {'_profile': 'cpu'})
+        self.assertEqual(response.status_code, 403)
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get(reverse('characters-list'), {'_profile': 'disk'}).status_code, 400)
+
+    def test_cpu_and_mem_profiles_are_folded_stacks(self):
+        self.client.force_login(self.staff)
+        for mode in ('cpu', 'mem'):
+            response = self.client.get(reverse('characters-list'), {'page_size': 100, '_profile': mode})
+            self.assertEqual(response['X-Profile-Mode'], mode)
+            self.assertEqual(response['X-Profiled-Status'], '200')
+            lines = response.content.decode().splitlines()
+            self.assertTrue(lines)
+            for line in lines:
+                self.assertRegex(line, r'^\S.* \d+$')
+        self.assertIn(';', response.content.decode())
+        self.assertGreater(int(response['X-Profile-Peak-Bytes']), 0)
+
+    def test_mem_peak_starts_at_the_request_when_already_tracing(self):
+        self.client.force_login(self.staff)
+        tracemalloc.start()
+        try:
+            earlier = bytearray(32 * 1024 * 1024)
+            del earlier
+            response = self.client.get(reverse('characters-list'), {'_profile': 'mem'})
+            self.assertTrue(tracemalloc.is_tracing())
+        finally:
+            tracemalloc.stop()
+        self.assertLess(int(response['X-Profile-Peak-Bytes']), 16 * 1024 * 1024)
+
+    def test_profiles_are_rate_limited_and_stored(self):
+        self.client.force_login(self.staff)
+        with tempfile.TemporaryDirectory() as directory, self.settings(REQUEST_PROFILING_DIR=directory):
+            for _ in range(2):
+                response = self.client.get(reverse('characters-list'), {'_profile': 'mem'})
+                self.assertTrue(os.path.exists(os.path.join(directory, response['X-Profile-File'])))
+            self.assertEqual(self.client.get(reverse('characters-list'), {'_profile': 'mem'}).status_code, 429)
+        # Requests without the switch are served as usual
+        self.assertIn('results', self.client.get(reverse('characters-list')).json())
+
+
+class QueuedLogHandlerTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, 'app.log')
+        self.logger = logging.getLogger('starwars_api.tests.logqueue')
+        self.logger.propagate = False
+        self.addCleanup(setattr, self.logger, 'propagate', True)
+
+    def attach(self, **kwargs):
+        handler = QueuedRotatingFileHandler(self.path, **kwargs)
+        handler.setFormatter(logging.Formatter('%(levelname)s %(message)s'))
+        self.logger.addHandler(handler)
+        self.addCleanup(self.logger.removeHandler, handler)
+        self.addCleanup(handler.close)
+        return handler
+
+    def read(self, path=None):
+        with open(path or self.path) as f:
+            return f.read()
+
+    def test_records_are_formatted_and_written_by_the_writer_thread(self):
+        handler = self.attach()
+        self.logger.warning("Created character: %s", "Luke Skywalker")
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            self.logger.exception("Sync failed")
+        handler.flush()
+        content = self.read()
+        self.assertIn('WARNING Created character: Luke Skywalker\n', content)
+        self.assertIn('ValueError: boom', content)
+
+    def test_arguments_are_rendered_when_logged(self):
+        handler = self.attach()
+        handler._start()
+        films = ['A New Hope']
+        with patch.object(handler.queue, 'put_nowait') as put:
+            self.logger.warning("Linked films: %s", films)
+        # Changed before the writer gets to the record
+        films.append('The Empire Strikes Back')
+        self.assertEqual(put.call_args.args[0].getMessage(), "Linked films: ['A New Hope']")
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        handler = self.attach(queue_size=1)
+        handler._start()
+        # Hold the writer so nothing is taken off the queue
+        handler.file.acquire()
+        try:
+            for i in range(50):
+                self.logger.warning("record %s", i)
+        finally:
+            handler.file.release()
+        handler.flush()
+        self.logger.warning("after")
+        handler.flush()
+        self.assertRegex(self.read(), r'\d+ log records dropped')
+
+    def test_file_rotates_at_max_bytes(self):
+        handler = self.attach(max_bytes=200, backup_count=2)
+        for i in range(20):
+            self.logger.warning("%s", 'x' * 40)
+            handler.flush()
+        self.assertTrue(os.path.exists(self.path + '.1'))
+        self.assertFalse(os.path.exists(self.path + '.3'))
+        self.assertLessEqual(os.path.getsize(self.path + '.1'), 200)
+
+
+@override_settings(TRACING=True, TRACING_SAMPLE_RATE=1.0, TRACING_EXPORTER='file', TRACING_EXPORT_INTERVAL=0.01)
+class TracingTest(TestCase):
+    TRACE_ID = '4bf92f3577b34da6a3ce929d0e0e4736'
+    PARENT_ID = '00f067aa0ba902b7'
+
+    def setUp(self):
+        Character.objects.create(swapi_id=1, name="Luke Skywalker")
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'traces.jsonl')
+        settings_override = self.settings(TRACING_FILE=self.path)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def exported_spans(self):
+        EXPORTER.flush()
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path) as f:
+            return [
+                span
+                for line in f
+                for resource in json.loads(line)['resourceSpans']
+                for scope in resource['scopeSpans']
+                for span in scope['spans']
+            ]
+
+    def test_request_continues_incoming_trace(self):
+        response = self.client.get(
+            reverse('characters-list'), headers={'traceparent': f'00-{self.TRACE_ID}-{self.PARENT_ID}-01'}
+        )
+        self.assertTrue(response['traceresponse'].startswith(f'00-{self.TRACE_ID}-'))
+        spans = self.exported_spans()
+        self.assertEqual({span['traceId'] for span in spans}, {self.TRACE_ID})
+        by_name = {span['name']: span for span in spans}
+        root = by_name['GET characters-list']
+        self.assertEqual(root['parentSpanId'], self.PARENT_ID)
+        self.assertEqual(by_name['CharacterViewSet.list']['parentSpanId'], root['spanId'])
+        self.assertIn('CharacterSummaryListSerializer.to_representation', by_name)
+        self.assertIn('db.query', by_name)
+
+    def test_head_sampling(self):
+        response = self.client.get(
+            reverse('characters-list'), headers={'traceparent': f'00-{self.TRACE_ID}-{self.PARENT_ID}-00'}
+        )
+        self.assertNotIn('traceresponse', response)
+        with self.settings(TRACING_SAMPLE_RATE=0.0):
+            self.assertNotIn('traceresponse', self.client.get(reverse('characters-list')))
+        self.assertEqual(self.exported_spans(), [])
+
+    @patch('core.services.requests.get')
+    def test_swapi_requests_propagate_trace_context(self, mock_get):
+        mock_get.return_value.json.return_value = []
+        mock_get.return_value.status_code = 200
+        with start_trace('populate') as root:
+            SWAPIService.make_request('https://swapi.info/api/films')
+        traceparent = mock_get.call_args.kwargs['headers']['traceparent']
+        self.assertTrue(traceparent.startswith(f'00-{root.trace_id}-'))
+        request_span = next(span for span in self.exported_spans() if span['name'] == 'swapi.request')
+        self.assertEqual(traceparent.split('-')[2], request_span['spanId'])
+
+
+    @patch('core.services.requests.get')
+    def test_populate_command_is_one_trace(self, mock_get):
+        mock_get.return_value.json.return_value = [{
+            'title': 'A New Hope', 'episode_id': 4, 'release_date': '1977-05-25',
+            'url': 'https://swapi.info/api/films/1/',
+        }]
+        mock_get.return_value.status_code = 200
+        with self.settings(TRACING_SAMPLE_RATE=0.0):
+            call_command('populate_swapi_data', '--resource', 'films', stdout=io.StringIO())
+        spans = self.exported_spans()
+        by_name = {span['name']: span for span in spans}
+        root = by_name['populate_swapi_data']
+        self.assertNotIn('parentSpanId', root)
+        self.assertEqual({span['traceId'] for span in spans}, {root['traceId']})
+        self.assertEqual(by_name['SWAPIService.fetch_all_films']['parentSpanId'], root['spanId'])
+        self.assertIn('swapi.request', by_name)
+        self.assertIn('db.query', by_name)
+
+class SchemaCacheTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings_override = self.settings(SCHEMA_CACHE_DIR=self.directory, SCHEMA_VERSION='test')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        for state in (schema._documents.clear, self.reset_version):
+            state()
+            self.addCleanup(state)
+
+    def reset_version(self):
+        schema._version = None
+
+    def test_schema_is_generated_once_and_served_with_etag_and_gzip(self):
+        with patch('starwars_api.schema.render_schema', wraps=schema.render_schema) as render:
+            response = self.client.get(reverse('schema'))
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.content.startswith(b'openapi:'))
+            self.assertTrue(os.path.exists(os.path.join(self.directory, 'schema-test.yaml')))
+
+            self.assertEqual(self.client.get(reverse('schema'), headers={'If-None-Match': response['ETag']}).status_code, 304)
+            compressed = self.client.get(reverse('schema'), headers={'Accept-Encoding': 'gzip, br'})
+            self.assertEqual(compressed['Content-Encoding'], 'gzip')
+            self.assertNotEqual(compressed['ETag'], response['ETag'])
+            self.assertEqual(gzip.decompress(compressed.content), response.content)
+            self.assertIn('Accept-Encoding', compressed['Vary'])
+            refused = self.client.get(reverse('schema'), headers={'Accept-Encoding': 'gzip;q=0, identity'})
+            self.assertNotIn('Content-Encoding', refused)
+            self.assertEqual(refused['ETag'], response['ETag'])
+            # The plain tag doesn't revalidate the gzip representation
+            stale = self.client.get(
+                reverse('schema'), headers={'Accept-Encoding': 'gzip', 'If-None-Match': response['ETag']}
+            )
+            self.assertEqual(stale.status_code, 200)
+            self.assertEqual(self.client.get(reverse('schema'), headers={
+                'Accept-Encoding': 'gzip', 'If-None-Match': f'"other", W/{compressed["ETag"]}',
+            }).status_code, 304)
+            as_json = self.client.get(reverse('schema'), {'format': 'json'})
+            self.assertIn('/api/characters/', json.loads(as_json.content)['paths'])
+        render.assert_called_once()
+
+    def test_docs_pages_load_drf_spectacular_views_on_demand(self):
+        self.assertEqual(self.client.get(reverse('swagger-ui')).status_code, 200)
+        self.assertEqual(self.client.get(reverse('redoc')).status_code, 200)
+
+    def test_precomputed_schema_is_served_without_generating(self):
+        schema.write_schema('old', {'yaml': b'stale', 'json': b'{}'})
+        call_command('generate_schema', stdout=io.StringIO())
+        self.assertEqual(sorted(os.listdir(self.directory)), ['schema-test.json', 'schema-test.yaml'])
+
+        schema.write_schema('test', {'yaml': b'openapi: 3.0.3\n', 'json': b'{"openapi": "3.0.3"}'})
+        with patch('starwars_api.schema.render_schema') as render:
+            response = self.client.get(reverse('schema'), headers={'Accept': 'application/json'})
+        render.assert_not_called()
+        self.assertEqual(response.content, b'{"openapi": "3.0.3"}')
+        self.assertIn('Accept-Encoding', response['Vary'])
@@ -0,0 +1,322 @@
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+from urllib.request import Request, urlopen
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+# OTLP span kinds
+INTERNAL, SERVER, CLIENT = 1, 2, 3
+MAX_STATEMENT_LENGTH = 1000
+EXPORT_BATCH_SIZE = 512
+EXPORT_QUEUE_SIZE = 8192
+
+TRACEPARENT = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+_current_span: ContextVar[Optional['Span']] = ContextVar('current_span', default=None)
+
+
+class Span:
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str] = None,
+                 kind: int = INTERNAL, attributes: Optional[dict] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = attributes or {}
+        self.error = None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def traceparent(self) -> str:
+        # Only sampled traces have spans, so the flag is always set
+        return f'00-{self.trace_id}-{self.span_id}-01'
+
+    def to_otlp(self) -> dict:
+        data = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns),
+            'attributes': [_otlp_attribute(key, value) for key, value in self.attributes.items()],
+            'status': {'code': 2, 'message': self.error} if self.error else {'code': 1},
+        }
+        if self.parent_id:
+            data['parentSpanId'] = self.parent_id
+        return data
+
+
+def _otlp_attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {'key': key, 'value': {'boolValue': value}}
+    if isinstance(value, int):
+        return {'key': key, 'value': {'intValue': str(value)}}
+    if isinstance(value, float):
+        return {'key': key, 'value': {'doubleValue': value}}
+    return {'key': key, 'value': {'stringValue': str(value)}}
+
+
+def otlp_payload(spans: List[Span]) -> dict:
+    """OTLP/JSON ExportTraceServiceRequest for ``spans``"""
+    return {'resourceSpans': [{
+        'resource': {'attributes': [_otlp_attribute('service.name', settings.TRACING_SERVICE_NAME)]},
+        'scopeSpans': [{'scope': {'name': __name__}, 'spans': [span.to_otlp() for span in spans]}],
+    }]}
+
+
+class SpanExporter:
+    """Sends finished spans from a background thread, in batches.
+
+    With TRACING_EXPORTER ``file`` each batch is appended to TRACING_FILE as
+    one line of OTLP/JSON; with ``otlp`` it is POSTed to
+    TRACING_OTLP_ENDPOINT, an OTLP/HTTP collector's ``/v1/traces``. Spans are
+    dropped rather than queued without bound when the exporter falls behind.
+    """
+
+    def __init__(self):
+        self.queue = None
+        self.dropped = 0
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    # Also after a fork: the parent's thread doesn't exist in the child
+                    self._pid = os.getpid()
+                    self.queue = queue.Queue(EXPORT_QUEUE_SIZE)
+                    threading.Thread(target=self._run, name='span-exporter', daemon=True).start()
+        try:
+            self.queue.put_nowait(span)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + settings.TRACING_EXPORT_INTERVAL
+            while len(batch) < EXPORT_BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            spans = [item for item in batch if isinstance(item, Span)]
+            with self._lock:
+                dropped, self.dropped = self.dropped, 0
+            if dropped:
+                logger.warning("Dropped %s spans: export queue full", dropped)
+            if spans:
+                try:
+                    self.send(spans)
+                except Exception as e:
+                    logger.warning("Failed to export %s spans: %s", len(spans), e)
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+
+    def send(self, spans: List[Span]):
+        body = json.dumps(otlp_payload(spans)).encode()
+        if settings.TRACING_EXPORTER == 'otlp':
+            request = Request(
+                settings.TRACING_OTLP_ENDPOINT, data=body, headers={'Content-Type': 'application/json'}
+            )
+            with urlopen(request, timeout=10):
+                pass
+        else:
+            with open(settings.TRACING_FILE, 'ab') as f:
+                f.write(body + b'\n')
+
+    def flush(self, timeout: float = 5.0):
+        """Wait until the spans finished so far have been exported"""
+        if self._pid != os.getpid():
+            return
+        exported = threading.Event()
+        self.queue.put(exported)
+        exported.wait(timeout)
+
+
+EXPORTER = SpanExporter()
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+@contextmanager
+def span(name: str, kind: int = INTERNAL, **attributes):
+    """Child span of the current span; a no-op yielding None outside a sampled trace"""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    with _activate(Span(name, parent.trace_id, parent.span_id, kind, attributes)) as child:
+        yield child
+
+
+@contextmanager
+def start_trace(name: str, traceparent: Optional[str] = None, kind: int = SERVER,
+                sample_rate: Optional[float] = None, **attributes):
+    """Root span of this process's part of a trace, or None when the trace isn't sampled.
+
+    A valid W3C ``traceparent`` continues the caller's trace and follows its
+    sampling decision; otherwise ``sample_rate``, by default
+    TRACING_SAMPLE_RATE, decides for a new trace.
+    """
+    match = TRACEPARENT.match(traceparent or '')
+    if match and match.group(1) != '0' * 32 and match.group(2) != '0' * 16:
+        trace_id, parent_id, sampled = match.group(1), match.group(2), int(match.group(3), 16) & 1
+    else:
+        trace_id, parent_id = os.urandom(16).hex(), None
+        sampled = random.random() < (settings.TRACING_SAMPLE_RATE if sample_rate is None else sample_rate)
+    if not sampled:
+        yield None
+        return
+    with _activate(Span(name, trace_id, parent_id, kind, attributes)) as root:
+        yield root
+
+
+@contextmanager
+def _activate(new_span: Span):
+    token = _current_span.set(new_span)
+    try:
+        yield new_span
+    except BaseException as e:
+        new_span.error = f'{type(e).__name__}: {e}'
+        raise
+    finally:
+        _current_span.reset(token)
+        new_span.end_ns = time.time_ns()
+        EXPORTER.export(new_span)
+
+
+def traceparent_headers() -> Dict[str, str]:
+    """Headers that continue the current trace in an outgoing HTTP request"""
+    current = _current_span.get()
+    return {'traceparent': current.traceparent()} if current is not None else {}
+
+
+def _trace_query(execute, sql, params, many, context):
+    if _current_span.get() is None:
+        return execute(sql, params, many, context)
+    connection = context['connection']
+    with span(
+        'db.query', CLIENT, **{
+            'db.system': connection.vendor, 'db.name': connection.alias,
+            'db.statement': sql[:MAX_STATEMENT_LENGTH], 'db.executemany': many,
+        }
+    ):
+        return execute(sql, params, many, context)
+
+
+def _install_trace_wrapper(sender=None, connection=None, **kwargs):
+    if _trace_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_trace_query)
+
+
+def install_query_tracing():
+    """Give queries on every connection, open or yet to be opened, a span inside sampled traces"""
+    connection_created.connect(_install_trace_wrapper, dispatch_uid='starwars_api.tracing')
+    for connection in connections.all(initialized_only=True):
+        _install_trace_wrapper(connection=connection)
+
+
+class TracedViewMixin:
+    """Span per view action"""
+
+    def dispatch(self, request, *args, **kwargs):
+        with span(type(self).__name__) as view_span:
+            response = super().dispatch(request, *args, **kwargs)
+            if view_span is not None:
+                view_span.name = f'{type(self).__name__}.{getattr(self, "action", None) or request.method.lower()}'
+            return response
+
+
+class TracedSerializerMixin:
+    """Span per serializer validation or output pass of a generic view"""
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        if _current_span.get() is not None:
+            # many=True serializers are named after their child
+            name = type(getattr(serializer, 'child', serializer)).__name__
+            for method in ('to_representation', 'is_valid'):
+                setattr(serializer, method, _traced_call(f'{name}.{method}', getattr(serializer, method)))
+        return serializer
+
+
+def _traced_call(name, func):
+    def wrapper(*args, **kwargs):
+        with span(name):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+class TracingMiddleware:
+    """Root span per sampled request, continuing an incoming ``traceparent``.
+
+    Sampled responses carry a ``traceresponse`` header with the trace id.
+    Removed from the stack when TRACING is off; unsampled requests and their
+    queries only pay for a ContextVar lookup.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.TRACING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        install_query_tracing()
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def start(self, request):
+        return start_trace(
+            request.method, request.headers.get('traceparent'),
+            **{'http.method': request.method, 'url.path': request.path},
+        )
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with self.start(request) as root:
+            response = self.get_response(request)
+            return self.finish(request, response, root)
+
+    async def __acall__(self, request):
+        with self.start(request) as root:
+            response = await self.get_response(request)
+            return self.finish(request, response, root)
+
+    def finish(self, request, response, root: Optional[Span]):
+        if root is not None:
+            match = request.resolver_match
+            if match:
+                # Router routes are regexes, so spans are named by view instead
+                root.name = f'{request.method} {match.view_name}'
+                root.set_attribute('http.route', match.route)
+            root.set_attribute('http.status_code', response.status_code)
+            if response.status_code >= 500:
+                root.error = f'HTTP {response.status_code}'
+            response['traceresponse'] = root.traceparent()
+        return response
@@ -1,14 +1,25 @@
 from django.contrib import admin
 from django.urls import path, include
-from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
+from .metrics import metrics_view
+from .schema import docs_view, schema_view
+from .views import db_pool_status, slow_queries
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('core.urls')),
     path('api/', include('voting.urls')),
     
+    # Native async read endpoints, served without a worker thread under ASGI
+    path('api/async/', include('core.async_urls')),
+    path('api/async/', include('voting.async_urls')),
+    
+    # Monitoring
+    path('api/health/db-pool/', db_pool_status, name='db-pool-status'),
+    path('api/health/slow-queries/', slow_queries, name='slow-queries'),
+    path('metrics', metrics_view, name='metrics'),
+    
     # API Documentation
-    path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
-    path('api/docs/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
-    path('api/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
+    path('api/schema/', schema_view, name='schema'),
+    path('api/docs/', docs_view('SpectacularSwaggerView'), name='swagger-ui'),
+    path('api/redoc/', docs_view('SpectacularRedocView'), name='redoc'),
 ]
@@ -0,0 +1,38 @@
+from drf_spectacular.utils import extend_schema
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from django.conf import settings
+from django.db import connections
+from .slowqueries import get_slow_query_log
+
+
+@extend_schema(exclude=True)
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def db_pool_status(request):
+    """psycopg_pool sizes, waits and counters of this process's pool for each pooled database"""
+    return Response({
+        alias: connections[alias].pool.get_stats()
+        for alias in connections
+        if connections[alias].settings_dict['OPTIONS'].get('pool')
+    })
+
+
+@extend_schema(exclude=True)
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAdminUser])
+def slow_queries(request):
+    """Most recent queries over SLOW_QUERY_MS in this process, newest first; DELETE clears them"""
+    log = get_slow_query_log()
+    if request.method == 'DELETE':
+        log.clear()
+        return Response(status=204)
+    try:
+        limit = int(request.query_params.get('limit', 0)) or None
+    except ValueError:
+        return Response({'error': 'Query parameter "limit" must be an integer'}, status=400)
+    return Response({
+        'threshold_ms': settings.SLOW_QUERY_MS,
+        'entries': log.recent(limit),
+    })
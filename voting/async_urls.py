@@ -0,0 +1,7 @@
+from django.urls import path
+from .async_views import AsyncVoteStatsView, VoteStatsStreamView
+
+urlpatterns = [
+    path('votes/stats/', AsyncVoteStatsView.as_view(), name='async-votes-stats'),
+    path('votes/stats/stream/', VoteStatsStreamView.as_view(), name='async-votes-stats-stream'),
+]
@@ -0,0 +1,61 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views import View
+from .buffer import pending_votes
+from .leaderboard import get_leaderboard
+from .stats import TOP_ITEMS, abuild_vote_stats, parse_top_n
+from .stream import get_stats_broadcaster
+from .voters import add_unique_voters
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+async def current_vote_stats(top_n=TOP_ITEMS):
+    leaderboard = await sync_to_async(get_leaderboard)()
+    if leaderboard:
+        # Served from memory; only names of items voted since the last load may query
+        stats = await sync_to_async(leaderboard.stats)(top_n)
+    else:
+        stats = await abuild_vote_stats(pending_votes(), top_n)
+    if settings.VOTE_UNIQUE_VOTERS:
+        stats = await sync_to_async(add_unique_voters)(stats)
+    return stats
+
+
+class AsyncVoteStatsView(View):
+    """Native async counterpart of VoteViewSet.stats"""
+
+    async def get(self, request):
+        try:
+            top_n = parse_top_n(request.GET.get('top_n'))
+        except ValueError:
+            return JsonResponse({'error': 'Query parameter "top_n" must be an integer'}, status=400)
+        try:
+            return JsonResponse(await current_vote_stats(top_n))
+        except Exception as e:
+            logger.error("Error getting vote statistics: %s", e)
+            return JsonResponse({
+                'error': 'Failed to retrieve voting statistics'
+            }, status=500)
+
+
+class VoteStatsStreamView(View):
+    """Server-sent events with vote statistics, pushed every VOTE_STREAM_INTERVAL seconds when they change.
+
+    All connections served by a worker share one broadcaster, so the stats
+    are computed once per interval however many dashboards are listening.
+    Only served under ASGI: a WSGI server would hold a worker thread for as
+    long as each dashboard stays open.
+    """
+
+    async def get(self, request):
+        if not isinstance(request, ASGIRequest):
+            return JsonResponse({'error': 'The stats stream is only served under ASGI'}, status=501)
+        broadcaster = get_stats_broadcaster(current_vote_stats, settings.VOTE_STREAM_INTERVAL)
+        response = StreamingHttpResponse(broadcaster.subscribe(), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
@@ -0,0 +1,185 @@
+import atexit
+import logging
+import threading
+from typing import Callable, Dict, Iterable, Optional, Set, Tuple
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from .services import VoteService
+
+logger = logging.getLogger(__name__)
+
+
+class VoteBuffer:
+    """Per-process write-behind buffer for vote increments.
+
+    Votes are summed per (vote_type, item_id) in memory and written to the
+    Vote table as one batched transaction every ``flush_interval`` seconds,
+    or sooner once ``max_pending`` votes are waiting (with no interval, by
+    the request that fills the buffer), so a burst on a hot item
+    costs one row update per flush instead of one locked update per vote.
+    A failed flush puts its increments back so they are retried. ``apply``
+    lets the same buffering batch other per-key counters, e.g. vote history.
+    Voter ids given with votes are kept per item and minute and folded into
+    the unique-voter sketches once their votes are written.
+    """
+
+    def __init__(self, flush_interval: Optional[float] = 1.0, max_pending: int = 1000,
+                 apply: Optional[Callable[[Dict[tuple, int]], int]] = None, name: str = 'vote-buffer'):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        # Writes a batch of summed increments; VoteService.apply_increments by default
+        self.apply = apply
+        self.name = name
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending: Dict[tuple, int] = {}
+        self._in_flight: Dict[tuple, int] = {}
+        # (vote_type, item_id, minute) -> voter ids
+        self._voters: Dict[tuple, Set[str]] = {}
+        self._pending_votes = 0
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        # Whether or not a flusher thread ever starts
+        atexit.register(self.stop)
+
+    def add(self, vote_type: str, item_id: int, count: int = 1, voter_ids: Iterable[str] = ()) -> int:
+        """Buffer votes for an item and return the item's pending count"""
+        pending = self.add_key((vote_type, item_id), count)
+        voter_ids = [voter for voter in voter_ids if voter] if settings.VOTE_UNIQUE_VOTERS else []
+        if voter_ids:
+            minute = timezone.now().replace(second=0, microsecond=0)
+            with self._lock:
+                self._voters.setdefault((vote_type, item_id, minute), set()).update(voter_ids)
+        return pending
+
+    def add_key(self, key: tuple, count: int = 1) -> int:
+        with self._lock:
+            self._pending[key] = self._pending.get(key, 0) + count
+            self._pending_votes += count
+            pending = self._pending[key] + self._in_flight.get(key, 0)
+            full = self._pending_votes >= self.max_pending
+        self._ensure_running()
+        if full:
+            if self.flush_interval is None:
+                self._flush_logged()
+            else:
+                self._wake.set()
+        return pending
+
+    def pending(self) -> Dict[tuple, int]:
+        """Votes accepted but not yet committed, including a flush in progress.
+
+        A flushing batch stays in here until its write has returned, so a read
+        racing that commit can briefly count the batch twice, once from the
+        database and once from here, but never miss it.
+        """
+        with self._lock:
+            merged = dict(self._in_flight)
+            for key, count in self._pending.items():
+                merged[key] = merged.get(key, 0) + count
+        return merged
+
+    def flush(self) -> int:
+        """Write all pending votes to the database, then their voters; returns the rows touched"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending, self._pending_votes = self._pending, {}, 0
+                voters, self._voters = self._voters, {}
+                self._in_flight = batch
+            rows = 0
+            if batch:
+                try:
+                    rows = (self.apply or VoteService.apply_increments)(batch)
+                except Exception:
+                    with self._lock:
+                        for key, count in batch.items():
+                            self._pending[key] = self._pending.get(key, 0) + count
+                            self._pending_votes += count
+                        self._in_flight = {}
+                    self._restore_voters(voters)
+                    raise
+                # Right after the commit: from here on readers get the batch from the database
+                with self._lock:
+                    self._in_flight = {}
+            if voters:
+                try:
+                    self._record_voters(voters)
+                except Exception:
+                    # The votes are committed; only their voters are retried
+                    self._restore_voters(voters)
+                    raise
+            return rows
+
+    def _record_voters(self, voters: Dict[tuple, Set[str]]):
+        # Imported here because voters -> history -> buffer
+        from .voters import record_voters
+        by_minute = {}
+        for (vote_type, item_id, minute), voter_ids in voters.items():
+            by_minute.setdefault(minute, {})[(vote_type, item_id)] = voter_ids
+        for minute, minute_voters in sorted(by_minute.items()):
+            record_voters(minute_voters, minute)
+
+    def _restore_voters(self, voters: Dict[tuple, Set[str]]):
+        with self._lock:
+            for key, voter_ids in voters.items():
+                self._voters.setdefault(key, set()).update(voter_ids)
+
+    def _ensure_running(self):
+        if self.flush_interval is None or self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            close_old_connections()
+            self._flush_logged()
+
+    def _flush_logged(self):
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error("Failed to flush %s: %s", self.name, e)
+
+    def stop(self):
+        """Stop the background flusher and flush whatever is still pending"""
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+        try:
+            self.flush()
+        except Exception as e:
+            # A failed flush put everything back, so this is what is lost
+            with self._lock:
+                votes = self._pending_votes
+                voters = sum(len(voter_ids) for voter_ids in self._voters.values())
+            logger.error(
+                "Failed to flush %s at shutdown; dropping %d pending votes and %d voter ids: %s",
+                self.name, votes, voters, e,
+            )
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_vote_buffer() -> VoteBuffer:
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = VoteBuffer(settings.VOTE_FLUSH_INTERVAL, settings.VOTE_FLUSH_MAX_PENDING)
+        return _buffer
+
+
+def pending_votes() -> Optional[Dict[Tuple[str, int], int]]:
+    """Pending deltas to merge into reads, or None when write-behind is off"""
+    if not settings.VOTE_WRITE_BEHIND:
+        return None
+    return get_vote_buffer().pending()
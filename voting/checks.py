@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.checks import Error, register
+
+
+@register()
+def check_vote_sharding(app_configs, **kwargs):
+    if not settings.VOTE_SHARD_DATABASES:
+        return []
+    errors = []
+    if settings.VOTE_COUNTER_SHARDS:
+        errors.append(Error(
+            'DB_VOTE_SHARDS cannot be combined with VOTE_COUNTER_SHARDS.',
+            hint='Counter shards live next to their Vote row; spread hot items across databases instead.',
+            id='voting.E001',
+        ))
+    if 'voting.sharding.VoteShardRouter' not in settings.DATABASE_ROUTERS:
+        errors.append(Error(
+            'VOTE_SHARD_DATABASES is set but voting.sharding.VoteShardRouter is not in DATABASE_ROUTERS.',
+            id='voting.E002',
+        ))
+    for alias in settings.VOTE_SHARD_DATABASES:
+        if alias not in settings.DATABASES:
+            errors.append(Error(f'Vote shard database "{alias}" is not configured in DATABASES.', id='voting.E003'))
+    return errors
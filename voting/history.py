@@ -0,0 +1,163 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Dict, List, Optional, Tuple
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Sum
+from django.utils import timezone
+from .buffer import VoteBuffer
+from .models import VoteBucket, VoterBucket
+from .sharding import scatter
+
+logger = logging.getLogger(__name__)
+
+# Finest to coarsest
+RESOLUTIONS = [
+    ('minute', timedelta(minutes=1)),
+    ('hour', timedelta(hours=1)),
+    ('day', timedelta(days=1)),
+]
+RESOLUTION_STEPS = dict(RESOLUTIONS)
+MAX_HISTORY_POINTS = 500
+PRUNE_EVERY_SECONDS = 3600
+
+
+def bucket_start(moment: datetime, resolution: str) -> datetime:
+    """Start of the UTC minute, hour or day containing ``moment``"""
+    moment = moment.astimezone(dt_timezone.utc)
+    if resolution == 'minute':
+        return moment.replace(second=0, microsecond=0)
+    if resolution == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def retention(resolution: str) -> Optional[timedelta]:
+    """How long buckets of a resolution are kept, or None to keep them forever"""
+    keep = {
+        'minute': timedelta(hours=settings.VOTE_HISTORY_MINUTE_RETENTION_HOURS),
+        'hour': timedelta(days=settings.VOTE_HISTORY_HOUR_RETENTION_DAYS),
+        'day': timedelta(days=settings.VOTE_HISTORY_DAY_RETENTION_DAYS),
+    }[resolution]
+    return keep or None
+
+
+class VoteHistoryService:
+    @staticmethod
+    def upsert_sql(connection) -> str:
+        """Insert-or-increment one bucket. Params: resolution, vote_type, item_id, bucket_start, count."""
+        qn = connection.ops.quote_name
+        table = qn(VoteBucket._meta.db_table)
+        key = ', '.join(qn(column) for column in ('resolution', 'vote_type', 'item_id', 'bucket_start'))
+        return (
+            f"INSERT INTO {table} ({key}, {qn('votes')}) VALUES (%s, %s, %s, %s, %s) "
+            f"ON CONFLICT ({key}) DO UPDATE SET {qn('votes')} = {table}.{qn('votes')} + EXCLUDED.{qn('votes')}"
+        )
+
+    @staticmethod
+    def record(increments: Dict[Tuple[str, int, datetime], int]) -> int:
+        """Add per-minute vote counts to their minute, hour and day buckets.
+
+        ``increments`` maps (vote_type, item_id, minute start) to votes. Every
+        resolution is rolled up as the counts are written, so coarse buckets
+        never need to be recomputed from finer ones.
+        """
+        rolled = {}
+        for (vote_type, item_id, minute), count in increments.items():
+            for resolution, _ in RESOLUTIONS:
+                key = (resolution, vote_type, item_id, bucket_start(minute, resolution))
+                rolled[key] = rolled.get(key, 0) + count
+        alias = router.db_for_write(VoteBucket)
+        connection = connections[alias]
+        params = [
+            [resolution, vote_type, item_id, connection.ops.adapt_datetimefield_value(start), count]
+            for (resolution, vote_type, item_id, start), count in sorted(rolled.items())
+        ]
+        with transaction.atomic(using=alias), connection.cursor() as cursor:
+            cursor.executemany(VoteHistoryService.upsert_sql(connection), params)
+        return len(params)
+
+    @staticmethod
+    def prune(now: Optional[datetime] = None) -> Dict[str, int]:
+        """Delete vote and voter buckets older than their resolution's retention"""
+        now = now or timezone.now()
+        deleted = {}
+        for resolution, _ in RESOLUTIONS:
+            keep = retention(resolution)
+            if keep is None:
+                continue
+            deleted[resolution], _ = VoteBucket.objects.filter(
+                resolution=resolution, bucket_start__lt=now - keep
+            ).delete()
+            # Voter buckets live on the vote shards
+            voter_buckets = VoterBucket.objects.filter(resolution=resolution, bucket_start__lt=now - keep)
+            deleted[resolution] += sum(scatter(lambda alias: voter_buckets.using(alias).delete()[0]))
+        return deleted
+
+    @staticmethod
+    def choose_resolution(start: datetime, end: datetime, now: Optional[datetime] = None) -> str:
+        """Finest resolution that is still retained at ``start`` and covers the range in
+        at most MAX_HISTORY_POINTS buckets, so the rows read stay bounded"""
+        now = now or timezone.now()
+        for resolution, step in RESOLUTIONS:
+            keep = retention(resolution)
+            if keep is not None and start < now - keep:
+                continue
+            if (end - start) / step <= MAX_HISTORY_POINTS:
+                return resolution
+        return RESOLUTIONS[-1][0]
+
+    @staticmethod
+    def series(start: datetime, end: datetime, resolution: str,
+               vote_type: Optional[str] = None, item_id: Optional[int] = None) -> List[dict]:
+        """Votes per bucket in [start, end), summed over items unless one is given"""
+        buckets = VoteBucket.objects.filter(
+            resolution=resolution,
+            bucket_start__gte=bucket_start(start, resolution),
+            bucket_start__lt=end,
+        )
+        if vote_type:
+            buckets = buckets.filter(vote_type=vote_type)
+        if item_id:
+            buckets = buckets.filter(item_id=item_id)
+        return list(
+            buckets.values('bucket_start').annotate(votes=Sum('votes')).order_by('bucket_start')
+        )
+
+
+class _HistoryWriter:
+    """Flushes buffered minute counts and prunes expired buckets about once an hour"""
+
+    def __init__(self):
+        self.last_pruned = None
+
+    def __call__(self, increments):
+        rows = VoteHistoryService.record(increments)
+        if self.last_pruned is None or time.monotonic() - self.last_pruned >= PRUNE_EVERY_SECONDS:
+            self.last_pruned = time.monotonic()
+            VoteHistoryService.prune()
+        return rows
+
+
+_recorder = None
+_recorder_lock = threading.Lock()
+
+
+def get_history_recorder() -> VoteBuffer:
+    global _recorder
+    with _recorder_lock:
+        if _recorder is None:
+            _recorder = VoteBuffer(
+                settings.VOTE_HISTORY_FLUSH_INTERVAL, settings.VOTE_FLUSH_MAX_PENDING,
+                apply=_HistoryWriter(), name='vote-history'
+            )
+        return _recorder
+
+
+def record_votes(vote_type: str, item_id: int, count: int = 1):
+    """Count accepted votes towards the current minute's history bucket"""
+    if settings.VOTE_HISTORY:
+        minute = bucket_start(timezone.now(), 'minute')
+        get_history_recorder().add_key((vote_type, item_id, minute), count)
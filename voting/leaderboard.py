@@ -0,0 +1,289 @@
+import logging
+import random
+import threading
+import time
+from itertools import chain
+from typing import Dict, List, Optional
+from django.conf import settings
+from django.db import close_old_connections
+from .buffer import pending_votes
+from .sharding import scatter
+from .stats import CATEGORIES, TOP_ITEMS, item_stats, vote_counters
+
+logger = logging.getLogger(__name__)
+
+# With several workers every verify sees the others' votes as drift, so only
+# the first drift in this many seconds is a warning; the rest are debug logs
+DRIFT_WARNING_INTERVAL = 3600.0
+
+
+class _Node:
+    __slots__ = ('key', 'priority', 'left', 'right', 'size')
+
+    def __init__(self, key):
+        self.key = key
+        self.priority = random.random()
+        self.left = None
+        self.right = None
+        self.size = 1
+
+
+def _size(node):
+    return node.size if node is not None else 0
+
+
+def _update(node):
+    node.size = 1 + _size(node.left) + _size(node.right)
+    return node
+
+
+def _split(node, key, inclusive=False):
+    """Split into (keys < key, keys >= key), or (<=, >) when ``inclusive``"""
+    if node is None:
+        return None, None
+    if node.key < key or (inclusive and node.key == key):
+        node.right, right = _split(node.right, key, inclusive)
+        return _update(node), right
+    left, node.left = _split(node.left, key, inclusive)
+    return left, _update(node)
+
+
+def _merge(left, right):
+    if left is None or right is None:
+        return left or right
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        return _update(left)
+    right.left = _merge(left, right.left)
+    return _update(right)
+
+
+class OrderStatisticTree:
+    """Treap of unique, sortable keys with subtree sizes.
+
+    Insert, remove and rank are O(log n) expected; ``first(n)`` walks the
+    n smallest keys in order.
+    """
+
+    def __init__(self):
+        self._root = None
+
+    def __len__(self):
+        return _size(self._root)
+
+    def insert(self, key):
+        left, right = _split(self._root, key)
+        self._root = _merge(_merge(left, _Node(key)), right)
+
+    def remove(self, key):
+        left, right = _split(self._root, key)
+        _, right = _split(right, key, inclusive=True)
+        self._root = _merge(left, right)
+
+    def rank(self, key) -> int:
+        """Number of keys smaller than ``key``"""
+        rank = 0
+        node = self._root
+        while node is not None:
+            if key <= node.key:
+                node = node.left
+            else:
+                rank += _size(node.left) + 1
+                node = node.right
+        return rank
+
+    def first(self, n: int) -> List:
+        keys = []
+        stack = []
+        node = self._root
+        while (stack or node is not None) and len(keys) < n:
+            while node is not None:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            keys.append(node.key)
+            node = node.right
+        return keys
+
+
+class _Board:
+    """Ranking of one vote type: items ordered by (-votes, item_id) plus a running total"""
+
+    def __init__(self):
+        self.tree = OrderStatisticTree()
+        self.votes: Dict[int, int] = {}
+        self.total = 0
+
+    def set(self, item_id: int, votes: int):
+        self.discard(item_id)
+        self.votes[item_id] = votes
+        self.tree.insert((-votes, item_id))
+        self.total += votes
+
+    def discard(self, item_id: int):
+        old = self.votes.pop(item_id, None)
+        if old is not None:
+            self.tree.remove((-old, item_id))
+            self.total -= old
+
+
+class VoteLeaderboard:
+    """Per-process, incrementally maintained vote rankings.
+
+    Loaded from the database once, then updated in O(log n) by the vote
+    write paths of this process, so stats and rank lookups need no query.
+    Writes made by other processes are picked up when ``verify`` reloads the
+    boards from the database every ``verify_interval`` seconds.
+    """
+
+    def __init__(self, verify_interval: Optional[float] = 60.0):
+        self.verify_interval = verify_interval
+        self._lock = threading.Lock()
+        self._boards: Dict[str, _Board] = {vote_type: _Board() for vote_type, *_ in CATEGORIES}
+        self._names: Dict[str, Dict[int, Optional[str]]] = {vote_type: {} for vote_type, *_ in CATEGORIES}
+        self._stopped = threading.Event()
+        self._thread = None
+        self._warned_at = None
+
+    @staticmethod
+    def _read_boards() -> Dict[str, _Board]:
+        boards = {vote_type: _Board() for vote_type, *_ in CATEGORIES}
+        votes, field = vote_counters()
+        rows = scatter(lambda alias: list(votes.using(alias).values_list('vote_type', 'item_id', field)))
+        for vote_type, item_id, count in chain.from_iterable(rows):
+            boards[vote_type].set(item_id, count)
+        for (vote_type, item_id), delta in (pending_votes() or {}).items():
+            board = boards[vote_type]
+            board.set(item_id, board.votes.get(item_id, 0) + delta)
+        return boards
+
+    def load(self):
+        """Replace the in-memory boards with the database state; returns the number of
+        items whose count differed, i.e. how far this process had drifted"""
+        boards = self._read_boards()
+        names = {
+            vote_type: dict(model.objects.values_list('id', name_field))
+            for vote_type, key, model, name_field in CATEGORIES
+        }
+        with self._lock:
+            drift = 0
+            for vote_type, board in boards.items():
+                current = self._boards[vote_type].votes
+                drift += sum(
+                    current.get(item_id) != board.votes.get(item_id)
+                    for item_id in current.keys() | board.votes.keys()
+                )
+            self._boards = boards
+            self._names = names
+        return drift
+
+    def verify(self) -> int:
+        drift = self.load()
+        if drift:
+            now = time.monotonic()
+            if self._warned_at is None or now - self._warned_at >= DRIFT_WARNING_INTERVAL:
+                self._warned_at = now
+                logger.warning(
+                    "Vote leaderboard drifted from the database on %s entries; reloaded "
+                    "(votes cast by other processes count too; warned at most every %ss)",
+                    drift, DRIFT_WARNING_INTERVAL,
+                )
+            else:
+                logger.debug("Vote leaderboard drifted from the database on %s entries; reloaded", drift)
+        return drift
+
+    def set_votes(self, vote_type: str, item_id: int, votes: int):
+        with self._lock:
+            self._boards[vote_type].set(item_id, votes)
+
+    def add_votes(self, vote_type: str, item_id: int, delta: int):
+        with self._lock:
+            board = self._boards[vote_type]
+            board.set(item_id, board.votes.get(item_id, 0) + delta)
+
+    def remove(self, vote_type: str, item_id: int):
+        with self._lock:
+            self._boards[vote_type].discard(item_id)
+
+    def rank(self, vote_type: str, item_id: int) -> Optional[dict]:
+        """1-based place of an item within its vote type, or None if it has no votes"""
+        with self._lock:
+            board = self._boards[vote_type]
+            votes = board.votes.get(item_id)
+            if votes is None:
+                return None
+            return {
+                'vote_type': vote_type,
+                'item_id': item_id,
+                'votes': votes,
+                'rank': board.tree.rank((-votes, item_id)) + 1,
+                'total_items': len(board.tree),
+            }
+
+    def _name(self, vote_type: str, item_id: int, model, name_field) -> Optional[str]:
+        with self._lock:
+            names = self._names[vote_type]
+            if item_id in names:
+                return names[item_id]
+        # Voted after the last load; queried outside the lock so votes don't wait on it,
+        # and misses are remembered too so they are looked up once
+        item = model.objects.only(name_field).filter(id=item_id).first()
+        name = getattr(item, name_field) if item else None
+        with self._lock:
+            self._names[vote_type][item_id] = name
+        return name
+
+    def stats(self, top_n: int = TOP_ITEMS) -> dict:
+        """Same shape as build_vote_stats, served from memory"""
+        with self._lock:
+            ranked = {
+                vote_type: (board.total, board.tree.first(top_n))
+                for vote_type, board in self._boards.items()
+            }
+        stats = {}
+        overall_total = 0
+        for vote_type, key, model, name_field in CATEGORIES:
+            total, top = ranked[vote_type]
+            top_items = []
+            for negative_votes, item_id in top:
+                name = self._name(vote_type, item_id, model, name_field)
+                if name is not None:
+                    top_items.append(item_stats(item_id, -negative_votes, name, total))
+            stats[key] = {'total_votes': total, 'top_items': top_items}
+            overall_total += total
+        stats['overall_total'] = overall_total
+        return stats
+
+    def start(self):
+        if self.verify_interval and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='vote-leaderboard', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.verify_interval):
+            close_old_connections()
+            try:
+                self.verify()
+            except Exception as e:
+                logger.error("Failed to verify vote leaderboard: %s", e)
+
+    def stop(self):
+        self._stopped.set()
+
+
+_leaderboard = None
+_leaderboard_lock = threading.Lock()
+
+
+def get_leaderboard() -> Optional[VoteLeaderboard]:
+    """This process's leaderboard, loaded on first use, or None when disabled"""
+    global _leaderboard
+    if not settings.VOTE_LEADERBOARD:
+        return None
+    with _leaderboard_lock:
+        if _leaderboard is None:
+            leaderboard = VoteLeaderboard(settings.VOTE_LEADERBOARD_VERIFY_INTERVAL)
+            leaderboard.load()
+            leaderboard.start()
+            _leaderboard = leaderboard
+        return _leaderboard
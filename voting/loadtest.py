@@ -0,0 +1,236 @@
+import multiprocessing
+import random
+import threading
+import time
+from collections import Counter
+from itertools import accumulate
+from typing import List, Optional, Tuple
+from django.db import connection, connections
+from django.test import Client
+from .services import ITEM_MODELS
+
+VOTES_PATH = '/api/votes/'
+STATS_PATH = '/api/votes/stats/'
+
+
+def _percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def zipf_cum_weights(count: int, skew: float) -> List[float]:
+    """Cumulative Zipf weights for ranks 1..count; rank 1 is the hottest item"""
+    return list(accumulate(1 / rank ** skew for rank in range(1, count + 1)))
+
+
+def classify_error(exc: Exception) -> str:
+    message = str(exc).lower()
+    if 'deadlock' in message:
+        return 'deadlocks'
+    if 'lock' in message:
+        # PostgreSQL lock_timeout, SQLite "database is locked"
+        return 'lock_timeouts'
+    return 'errors'
+
+
+class _Session:
+    """Issues requests in-process through the Django test client, or over HTTP with ``base_url``"""
+
+    def __init__(self, base_url: Optional[str]):
+        self.base_url = base_url.rstrip('/') if base_url else None
+        if self.base_url:
+            import requests
+            self.http = requests.Session()
+        else:
+            self.client = Client(raise_request_exception=True)
+
+    def post(self, path, data):
+        if self.base_url:
+            return self.http.post(self.base_url + path, json=data).status_code
+        return self.client.post(path, data, content_type='application/json').status_code
+
+    def get(self, path):
+        if self.base_url:
+            return self.http.get(self.base_url + path).status_code
+        return self.client.get(path).status_code
+
+
+def run_worker(config: dict, seed: int) -> dict:
+    """Run one client loop until the deadline or its request quota; returns raw samples"""
+    rng = random.Random(seed)
+    session = _Session(config['base_url'])
+    items = config['items']
+    cum_weights = zipf_cum_weights(len(items), config['skew'])
+    result = {'attempts': 0, 'write': [], 'read': [], 'status': Counter(), 'failures': Counter()}
+    deadline = time.monotonic() + config['duration'] if config['duration'] else None
+    remaining = config['requests_per_worker']
+    try:
+        while (deadline is None or time.monotonic() < deadline) and (remaining is None or remaining > 0):
+            if remaining is not None:
+                remaining -= 1
+            result['attempts'] += 1
+            is_read = rng.random() < config['read_ratio']
+            started = time.perf_counter()
+            try:
+                if is_read:
+                    status = session.get(config['stats_path'])
+                else:
+                    vote_type, item_id = rng.choices(items, cum_weights=cum_weights)[0]
+                    status = session.post(VOTES_PATH, {'vote_type': vote_type, 'item_id': item_id})
+            except Exception as e:
+                result['failures'][classify_error(e)] += 1
+                continue
+            result['read' if is_read else 'write'].append((time.perf_counter() - started) * 1000)
+            result['status'][status] += 1
+            if status >= 500:
+                result['failures']['errors'] += 1
+    finally:
+        if not config['base_url']:
+            connection.close()
+    return result
+
+
+def _run_threads(config: dict, seed: int) -> List[dict]:
+    results = [None] * config['threads']
+
+    def target(index):
+        results[index] = run_worker(config, seed * 1000 + index)
+
+    threads = [threading.Thread(target=target, args=(index,)) for index in range(config['threads'])]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def _run_process(args: Tuple[dict, int]) -> List[dict]:
+    config, seed = args
+    return _run_threads(config, seed)
+
+
+class LockMonitor:
+    """Samples waiting lock requests and the server's deadlock counter on PostgreSQL"""
+
+    SQL_WAITING = "SELECT count(*) FROM pg_locks WHERE NOT granted"
+    SQL_DEADLOCKS = "SELECT deadlocks FROM pg_stat_database WHERE datname = current_database()"
+
+    def __init__(self, alias='default', interval=0.1):
+        self.alias = alias
+        self.interval = interval
+        self.enabled = connections[alias].vendor == 'postgresql'
+        self.samples = []
+        self._stopped = threading.Event()
+        self._thread = None
+        self._deadlocks_before = None
+
+    def _query(self, sql):
+        with connections[self.alias].cursor() as cursor:
+            cursor.execute(sql)
+            return cursor.fetchone()[0]
+
+    def start(self):
+        if not self.enabled:
+            return
+        self._deadlocks_before = self._query(self.SQL_DEADLOCKS)
+        self._thread = threading.Thread(target=self._run, name='loadtest-lock-monitor', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            while not self._stopped.wait(self.interval):
+                self.samples.append(self._query(self.SQL_WAITING))
+        finally:
+            connections[self.alias].close()
+
+    def stop(self) -> Optional[dict]:
+        if not self.enabled:
+            return None
+        self._stopped.set()
+        self._thread.join()
+        return {
+            'samples': len(self.samples),
+            'max_waiting': max(self.samples, default=0),
+            'mean_waiting': round(sum(self.samples) / len(self.samples), 2) if self.samples else 0.0,
+            'server_deadlocks': self._query(self.SQL_DEADLOCKS) - self._deadlocks_before,
+        }
+
+
+def load_items(vote_type: str, limit: int) -> List[Tuple[str, int]]:
+    """(vote_type, id) pairs to vote on, in Zipf rank order; ``all`` mixes every type"""
+    vote_types = list(ITEM_MODELS) if vote_type == 'all' else [vote_type]
+    items = []
+    for kind in vote_types:
+        ids = ITEM_MODELS[kind].objects.order_by('id').values_list('id', flat=True)[:limit]
+        items.extend((kind, item_id) for item_id in ids)
+    return items
+
+
+def _summary(latencies: List[float], elapsed: float) -> dict:
+    return {
+        'count': len(latencies),
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(_percentile(latencies, 0.50), 3),
+        'p95_ms': round(_percentile(latencies, 0.95), 3),
+        'p99_ms': round(_percentile(latencies, 0.99), 3),
+    }
+
+
+def run_load_test(items: List[Tuple[str, int]], threads: int = 4, processes: int = 1, duration: float = 10.0,
+                  requests: Optional[int] = None, skew: float = 1.1, read_ratio: float = 0.1,
+                  stats_path: str = STATS_PATH, base_url: Optional[str] = None, seed: int = 0) -> dict:
+    """Drive concurrent vote POSTs (and stats GETs) and report throughput, latency and failures.
+
+    Runs ``processes`` x ``threads`` clients, each for ``duration`` seconds
+    or, when ``requests`` is given, for its share of that many requests.
+    Items are voted on with Zipf-distributed popularity in list order.
+    """
+    if not items:
+        raise ValueError('No items to vote on; populate the catalog first')
+    workers = threads * processes
+    config = {
+        'items': items,
+        'threads': threads,
+        'duration': None if requests else duration,
+        'requests_per_worker': -(-requests // workers) if requests else None,
+        'skew': skew,
+        'read_ratio': read_ratio,
+        'stats_path': stats_path,
+        'base_url': base_url,
+    }
+    monitor = LockMonitor()
+    monitor.start()
+    started = time.perf_counter()
+    if processes > 1:
+        # Forked children must open their own database connections
+        connections.close_all()
+        with multiprocessing.get_context('fork').Pool(processes) as pool:
+            batches = pool.map(_run_process, [(config, seed + index) for index in range(processes)])
+        results = [result for batch in batches for result in batch]
+    else:
+        results = _run_threads(config, seed)
+    elapsed = time.perf_counter() - started
+    lock_waits = monitor.stop()
+
+    writes = [sample for result in results for sample in result['write']]
+    reads = [sample for result in results for sample in result['read']]
+    status = Counter()
+    failures = Counter()
+    for result in results:
+        status.update(result['status'])
+        failures.update(result['failures'])
+    return {
+        'workers': workers,
+        'duration_s': round(elapsed, 3),
+        'requests': sum(result['attempts'] for result in results),
+        'throughput_rps': round((len(writes) + len(reads)) / elapsed, 1) if elapsed else 0.0,
+        'writes': _summary(writes, elapsed),
+        'reads': _summary(reads, elapsed),
+        'status_codes': dict(sorted(status.items())),
+        'errors': failures['errors'],
+        'lock_timeouts': failures['lock_timeouts'],
+        'deadlocks': failures['deadlocks'],
+        'lock_waits': lock_waits,
+    }
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from voting.services import VoteService
+
+
+class Command(BaseCommand):
+    help = 'Fold sharded vote counters into their Vote rows'
+
+    def handle(self, *args, **options):
+        compacted = VoteService.compact_shards()
+        self.stdout.write(self.style.SUCCESS(f'Compacted vote shards for {compacted} items'))
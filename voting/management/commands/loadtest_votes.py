@@ -0,0 +1,72 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from voting.loadtest import STATS_PATH, load_items, run_load_test
+
+
+class Command(BaseCommand):
+    help = 'Load-test the vote endpoint with concurrent, Zipf-skewed votes and stats polling'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4, help='Client threads per process (default: 4)')
+        parser.add_argument('--processes', type=int, default=1, help='Client processes (default: 1)')
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds to run (default: 10)')
+        parser.add_argument('--requests', type=int, help='Stop after this many requests instead of --duration')
+        parser.add_argument(
+            '--vote-type',
+            choices=['character', 'film', 'starship', 'all'],
+            default='character',
+            help='Items to vote on (default: character)'
+        )
+        parser.add_argument('--items', type=int, default=100, help='Distinct items per vote type (default: 100)')
+        parser.add_argument('--skew', type=float, default=1.1, help='Zipf exponent; higher is hotter (default: 1.1)')
+        parser.add_argument(
+            '--read-ratio', type=float, default=0.1,
+            help='Fraction of requests that poll stats instead of voting (default: 0.1)'
+        )
+        parser.add_argument('--stats-path', default=STATS_PATH, help=f'Stats URL to poll (default: {STATS_PATH})')
+        parser.add_argument(
+            '--url',
+            help='Base URL of a running server (e.g. http://localhost:8000); default runs the app in-process'
+        )
+        parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        items = load_items(options['vote_type'], options['items'])
+        try:
+            report = run_load_test(
+                items,
+                threads=options['threads'],
+                processes=options['processes'],
+                duration=options['duration'],
+                requests=options['requests'],
+                skew=options['skew'],
+                read_ratio=options['read_ratio'],
+                stats_path=options['stats_path'],
+                base_url=options['url'],
+                seed=options['seed'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self.stdout.write(
+            f"{report['requests']} requests from {report['workers']} clients in {report['duration_s']} s: "
+            f"{report['throughput_rps']} req/s"
+        )
+        for kind in ('writes', 'reads'):
+            summary = report[kind]
+            self.stdout.write(
+                f"{kind:>6}: {summary['count']} ({summary['rps']}/s), "
+                f"p50 {summary['p50_ms']} ms, p95 {summary['p95_ms']} ms, p99 {summary['p99_ms']} ms"
+            )
+        self.stdout.write(f"status codes: {report['status_codes']}")
+        self.stdout.write(
+            f"errors: {report['errors']}, lock timeouts: {report['lock_timeouts']}, deadlocks: {report['deadlocks']}"
+        )
+        if report['lock_waits'] is not None:
+            self.stdout.write(f"lock waits: {report['lock_waits']}")
+        style = self.style.SUCCESS if not (report['errors'] or report['deadlocks']) else self.style.WARNING
+        self.stdout.write(style('Load test finished'))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from voting.history import VoteHistoryService
+
+
+class Command(BaseCommand):
+    help = 'Delete vote history buckets older than their retention'
+
+    def handle(self, *args, **options):
+        deleted = VoteHistoryService.prune()
+        for resolution, count in deleted.items():
+            self.stdout.write(f"- {resolution}: {count} buckets deleted")
+        self.stdout.write(self.style.SUCCESS('Vote history pruned'))
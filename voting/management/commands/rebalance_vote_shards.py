@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from voting.services import VoteService
+from voting.voters import VoterSketchService
+
+
+class Command(BaseCommand):
+    help = 'Move Vote rows to the shard they hash to after DB_VOTE_SHARDS changes (pause voting while it runs)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Count the rows that would move')
+        parser.add_argument(
+            '--include-default', action='store_true',
+            help='Also move votes stored on the default database before sharding was enabled'
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        if not settings.VOTE_SHARD_DATABASES:
+            raise CommandError('No vote shards configured; set DB_VOTE_SHARDS')
+        moved = VoteService.rebalance_shards(
+            include_default=options['include_default'],
+            dry_run=options['dry_run'],
+            batch_size=options['batch_size'],
+        )
+        sketches = VoterSketchService.rebalance_shards(
+            include_default=options['include_default'], dry_run=options['dry_run']
+        )
+        verb = 'Would move' if options['dry_run'] else 'Moved'
+        for alias, count in moved.items():
+            self.stdout.write(f'{alias}: {count}')
+        self.stdout.write(self.style.SUCCESS(f'{verb} {sum(moved.values())} votes and {sketches} voter sketches'))
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("voting", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="VoteShard",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "vote_type",
+                    models.CharField(
+                        choices=[
+                            ("character", "Character"),
+                            ("film", "Film"),
+                            ("starship", "Starship"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("item_id", models.PositiveIntegerField()),
+                ("shard", models.PositiveSmallIntegerField()),
+                ("votes", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "unique_together": {("vote_type", "item_id", "shard")},
+            },
+        ),
+    ]
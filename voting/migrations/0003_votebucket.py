@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("voting", "0002_voteshard"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="VoteBucket",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "resolution",
+                    models.CharField(
+                        choices=[
+                            ("minute", "Minute"),
+                            ("hour", "Hour"),
+                            ("day", "Day"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                (
+                    "vote_type",
+                    models.CharField(
+                        choices=[
+                            ("character", "Character"),
+                            ("film", "Film"),
+                            ("starship", "Starship"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("item_id", models.PositiveIntegerField()),
+                ("bucket_start", models.DateTimeField()),
+                ("votes", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["resolution", "bucket_start"],
+                        name="voting_vote_resolut_0f8297_idx",
+                    )
+                ],
+                "unique_together": {
+                    ("resolution", "vote_type", "item_id", "bucket_start")
+                },
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("voting", "0003_votebucket"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="VoterSketch",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "vote_type",
+                    models.CharField(
+                        choices=[
+                            ("character", "Character"),
+                            ("film", "Film"),
+                            ("starship", "Starship"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("item_id", models.PositiveIntegerField()),
+                ("slot", models.PositiveSmallIntegerField(default=0)),
+                ("sketch", models.BinaryField()),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "unique_together": {("vote_type", "item_id", "slot")},
+            },
+        ),
+    ]
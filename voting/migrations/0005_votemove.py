@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("voting", "0004_votersketch"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="VoteMove",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("source", models.CharField(max_length=100)),
+                ("source_pk", models.BigIntegerField()),
+            ],
+            options={
+                "unique_together": {("source", "source_pk")},
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+from collections import defaultdict
+
+from django.db import migrations
+
+from voting.hll import HyperLogLog
+
+CATEGORY_ITEM_ID = 0
+
+
+def build_category_sketches(apps, schema_editor):
+    """Merge each database's existing item sketches into per-vote-type category sketches"""
+    VoterSketch = apps.get_model('voting', 'VoterSketch')
+    alias = schema_editor.connection.alias
+    categories = defaultdict(HyperLogLog)
+    rows = VoterSketch.objects.using(alias).exclude(item_id=CATEGORY_ITEM_ID)
+    for vote_type, data in rows.values_list('vote_type', 'sketch').iterator():
+        categories[vote_type].merge(HyperLogLog.from_bytes(data))
+    for vote_type, sketch in categories.items():
+        VoterSketch.objects.using(alias).update_or_create(
+            vote_type=vote_type, item_id=CATEGORY_ITEM_ID, defaults={'sketch': sketch.to_bytes()}
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("voting", "0005_votemove"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            build_category_sketches, migrations.RunPython.noop, hints={'model_name': 'votersketch'}
+        ),
+    ]
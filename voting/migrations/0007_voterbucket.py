@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("voting", "0006_category_voter_sketches"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="VoterBucket",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "resolution",
+                    models.CharField(
+                        choices=[
+                            ("minute", "Minute"),
+                            ("hour", "Hour"),
+                            ("day", "Day"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                (
+                    "vote_type",
+                    models.CharField(
+                        choices=[
+                            ("character", "Character"),
+                            ("film", "Film"),
+                            ("starship", "Starship"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("item_id", models.PositiveIntegerField()),
+                ("bucket_start", models.DateTimeField()),
+                ("slot", models.PositiveSmallIntegerField(default=0)),
+                ("sketch", models.BinaryField()),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["resolution", "bucket_start"],
+                        name="voting_vote_resolut_75c36d_idx",
+                    )
+                ],
+                "unique_together": {
+                    ("resolution", "vote_type", "item_id", "bucket_start", "slot")
+                },
+            },
+        ),
+    ]
@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.core.validators import MinValueValidator
 
 class BaseModel(models.Model):
@@ -9,6 +11,17 @@ class BaseModel(models.Model):
     class Meta:
         abstract = True
 
+class VoteQuerySet(models.QuerySet):
+    def with_shard_totals(self):
+        """Annotate ``total_votes``: the compacted count plus uncompacted shard increments"""
+        shard_votes = VoteShard.objects.filter(
+            vote_type=OuterRef('vote_type'), item_id=OuterRef('item_id')
+        ).order_by().values('vote_type', 'item_id').annotate(total=Sum('votes')).values('total')
+        return self.annotate(
+            total_votes=F('votes') + Coalesce(Subquery(shard_votes), 0, output_field=models.PositiveIntegerField())
+        )
+
+
 class Vote(BaseModel):
     VOTE_TYPE_CHOICES = [
         ('character', 'Character'),
@@ -19,6 +32,8 @@ class Vote(BaseModel):
     vote_type = models.CharField(max_length=20, choices=VOTE_TYPE_CHOICES, db_index=True)
     item_id = models.PositiveIntegerField()
     votes = models.PositiveIntegerField(default=0, validators=[MinValueValidator(0)])
+
+    objects = VoteQuerySet.as_manager()
     
     class Meta:
         unique_together = ('vote_type', 'item_id')
@@ -28,3 +43,108 @@ class Vote(BaseModel):
         
     def __str__(self):
         return f"{self.get_vote_type_display()} {self.item_id}: {self.votes} votes"
+
+
+class VoteShard(models.Model):
+    """Uncompacted increments for one slice of a Vote counter.
+
+    In sharded mode each vote adds to a random one of VOTE_COUNTER_SHARDS rows
+    so concurrent votes on a hot item don't queue on a single row lock; the
+    shards are periodically folded back into ``Vote.votes``.
+    """
+    vote_type = models.CharField(max_length=20, choices=Vote.VOTE_TYPE_CHOICES)
+    item_id = models.PositiveIntegerField()
+    shard = models.PositiveSmallIntegerField()
+    votes = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('vote_type', 'item_id', 'shard')
+
+    def __str__(self):
+        return f"{self.get_vote_type_display()} {self.item_id} shard {self.shard}: {self.votes} votes"
+
+
+class VoteBucket(models.Model):
+    """Votes cast for one item during one minute, hour or day (UTC)"""
+    RESOLUTION_CHOICES = [
+        ('minute', 'Minute'),
+        ('hour', 'Hour'),
+        ('day', 'Day'),
+    ]
+
+    resolution = models.CharField(max_length=10, choices=RESOLUTION_CHOICES)
+    vote_type = models.CharField(max_length=20, choices=Vote.VOTE_TYPE_CHOICES)
+    item_id = models.PositiveIntegerField()
+    bucket_start = models.DateTimeField()
+    votes = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('resolution', 'vote_type', 'item_id', 'bucket_start')
+        indexes = [
+            models.Index(fields=['resolution', 'bucket_start']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_vote_type_display()} {self.item_id} @ {self.bucket_start:%Y-%m-%d %H:%M} ({self.resolution}): {self.votes} votes"
+
+
+class VoterSketch(models.Model):
+    """HyperLogLog sketch of the distinct voters of one item (see voting.hll).
+
+    Lives on the same database as the item's Vote row. Sketches merge by
+    register-wise max, so per-shard sketches combine exactly; VoterBucket
+    holds the same sketches per period.
+    """
+    vote_type = models.CharField(max_length=20, choices=Vote.VOTE_TYPE_CHOICES)
+    item_id = models.PositiveIntegerField()
+    # Category sketches are split over several rows by voter (see voting.voters); items use slot 0
+    slot = models.PositiveSmallIntegerField(default=0)
+    sketch = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('vote_type', 'item_id', 'slot')
+
+    def __str__(self):
+        return f"{self.get_vote_type_display()} {self.item_id} voter sketch"
+
+
+class VoterBucket(models.Model):
+    """Sketch of the distinct voters of one item during one minute, hour or day (UTC).
+
+    The VoteBucket of unique voters: written with it when VOTE_HISTORY is on,
+    but stored next to the item's VoterSketch. Merging the buckets of a range
+    counts each voter in that window once.
+    """
+    resolution = models.CharField(max_length=10, choices=VoteBucket.RESOLUTION_CHOICES)
+    vote_type = models.CharField(max_length=20, choices=Vote.VOTE_TYPE_CHOICES)
+    item_id = models.PositiveIntegerField()
+    bucket_start = models.DateTimeField()
+    slot = models.PositiveSmallIntegerField(default=0)
+    sketch = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('resolution', 'vote_type', 'item_id', 'bucket_start', 'slot')
+        indexes = [
+            models.Index(fields=['resolution', 'bucket_start']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_vote_type_display()} {self.item_id} @ {self.bucket_start:%Y-%m-%d %H:%M} ({self.resolution}) voter sketch"
+
+
+class VoteMove(models.Model):
+    """A Vote row copied to this shard by a rebalance but maybe not yet deleted from its source.
+
+    Written in the same transaction as the copied votes, so a rebalance that
+    is re-run after dying between the copy and the delete skips the copy.
+    """
+    source = models.CharField(max_length=100)
+    source_pk = models.BigIntegerField()
+
+    class Meta:
+        unique_together = ('source', 'source_pk')
+
+    def __str__(self):
+        return f"Vote {self.source_pk} moved from {self.source}"
@@ -1,38 +1,100 @@
+from datetime import timedelta
+from django.utils import timezone
 from rest_framework import serializers
-from .models import Vote
-from core.models import Character, Film, Starship
+from .history import MAX_HISTORY_POINTS, RESOLUTION_STEPS
+from .models import Vote, VoteBucket
+from .sharding import is_sharded, public_vote_id
 
 class VoteSerializer(serializers.ModelSerializer):
+    # Opaque voter identity (user id, session, device...), only used to count unique voters
+    voter_id = serializers.CharField(write_only=True, required=False, allow_blank=True, max_length=255)
+
     class Meta:
         model = Vote
-        fields = ['id', 'vote_type', 'item_id', 'votes', 'created_at', 'updated_at']
+        fields = ['id', 'vote_type', 'item_id', 'votes', 'voter_id', 'created_at', 'updated_at']
         read_only_fields = ['id', 'votes', 'created_at', 'updated_at']
-    
-    def validate(self, attrs):
-        vote_type = attrs.get('vote_type')
-        item_id = attrs.get('item_id')
-        
-        # Validate that the item exists
-        if vote_type == 'character':
-            if not Character.objects.filter(id=item_id).exists():
-                raise serializers.ValidationError("Character with this ID does not exist.")
-        elif vote_type == 'film':
-            if not Film.objects.filter(id=item_id).exists():
-                raise serializers.ValidationError("Film with this ID does not exist.")
-        elif vote_type == 'starship':
-            if not Starship.objects.filter(id=item_id).exists():
-                raise serializers.ValidationError("Starship with this ID does not exist.")
-        
-        return attrs
+        # Item existence and repeat votes are handled by VoteService.cast_vote's upsert
+        validators = []
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # Sharded counters: report the compacted count plus pending shards
+        if getattr(instance, 'total_votes', None) is not None:
+            data['votes'] = instance.total_votes
+        if is_sharded():
+            data['id'] = public_vote_id(instance)
+        return data
+
+class BulkVoteItemSerializer(serializers.Serializer):
+    vote_type = serializers.ChoiceField(choices=Vote.VOTE_TYPE_CHOICES)
+    item_id = serializers.IntegerField(min_value=1)
+    count = serializers.IntegerField(min_value=1, max_value=1000, default=1)
+    voter_id = serializers.CharField(required=False, allow_blank=True, max_length=255)
+
+class BulkVoteRejectedSerializer(serializers.Serializer):
+    index = serializers.IntegerField()
+    errors = serializers.DictField()
+
+class BulkVoteResultSerializer(serializers.Serializer):
+    accepted = BulkVoteItemSerializer(many=True)
+    rejected = BulkVoteRejectedSerializer(many=True)
+    accepted_votes = serializers.IntegerField()
+
+class VoteRankQuerySerializer(serializers.Serializer):
+    vote_type = serializers.ChoiceField(choices=Vote.VOTE_TYPE_CHOICES)
+    item_id = serializers.IntegerField(min_value=1)
+
+class VoteRankSerializer(VoteRankQuerySerializer):
+    votes = serializers.IntegerField()
+    rank = serializers.IntegerField()
+    total_items = serializers.IntegerField()
+
+class VoteHistoryQuerySerializer(serializers.Serializer):
+    vote_type = serializers.ChoiceField(choices=Vote.VOTE_TYPE_CHOICES, required=False)
+    item_id = serializers.IntegerField(min_value=1, required=False)
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+    resolution = serializers.ChoiceField(
+        choices=['auto'] + [value for value, _ in VoteBucket.RESOLUTION_CHOICES], default='auto'
+    )
+
+    def validate(self, data):
+        data.setdefault('end', timezone.now())
+        data.setdefault('start', data['end'] - timedelta(days=1))
+        if data['start'] >= data['end']:
+            raise serializers.ValidationError({'start': 'Must be before end.'})
+        if data.get('item_id') and not data.get('vote_type'):
+            raise serializers.ValidationError({'vote_type': 'Required when item_id is given.'})
+        step = RESOLUTION_STEPS.get(data['resolution'])
+        if step is not None and (data['end'] - data['start']) / step > MAX_HISTORY_POINTS:
+            raise serializers.ValidationError(
+                {'resolution': f'Covers the range in more than {MAX_HISTORY_POINTS} buckets; use a coarser one or auto.'}
+            )
+        return data
+
+class VoteHistoryPointSerializer(serializers.Serializer):
+    bucket_start = serializers.DateTimeField()
+    votes = serializers.IntegerField()
+
+class VoteHistorySerializer(serializers.Serializer):
+    vote_type = serializers.CharField(allow_null=True)
+    item_id = serializers.IntegerField(allow_null=True)
+    start = serializers.DateTimeField()
+    end = serializers.DateTimeField()
+    resolution = serializers.CharField()
+    points = VoteHistoryPointSerializer(many=True)
+    unique_voters = serializers.IntegerField(required=False)
 
 class VoteStatsItemSerializer(serializers.Serializer):
     id = serializers.IntegerField()
     name = serializers.CharField()
     votes = serializers.IntegerField()
     percentage = serializers.FloatField()
+    unique_voters = serializers.IntegerField(required=False)
 
 class VoteStatsCategorySerializer(serializers.Serializer):
     total_votes = serializers.IntegerField()
+    unique_voters = serializers.IntegerField(required=False)
     top_items = VoteStatsItemSerializer(many=True)
 
 class VoteStatsSerializer(serializers.Serializer):
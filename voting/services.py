@@ -0,0 +1,343 @@
+import logging
+import random
+from collections import defaultdict
+from typing import Dict, Iterable, Set, Tuple
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.utils import timezone
+from core.catalog import get_catalog_id_index
+from core.models import Character, Film, Starship
+from starwars_api.metrics import record_cache
+from .models import Vote, VoteMove, VoteShard
+from .sharding import is_sharded, shard_for, vote_databases
+
+logger = logging.getLogger(__name__)
+
+ITEM_MODELS = {
+    'character': Character,
+    'film': Film,
+    'starship': Starship,
+}
+
+
+class VoteError(Exception):
+    """Custom exception for vote-related errors"""
+    pass
+
+
+class VoteItemNotFound(VoteError):
+    """The voted character, film or starship does not exist"""
+    pass
+
+
+class VoteService:
+    RETURNING_FIELDS = ['id', 'votes', 'created_at', 'updated_at']
+
+    @staticmethod
+    def upsert_sql(connection, vote_type: str, returning: bool = True, check_item: bool = True) -> str:
+        """Insert-or-increment statement for one (vote_type, item_id) that only
+        inserts when the voted item exists, optionally returning the resulting row.
+
+        Params: vote_type, item_id, count, created_at, updated_at, item_id.
+        With ``check_item=False`` (vote shards, which don't hold the catalog)
+        the trailing item_id is still passed but the existence check is skipped.
+        """
+        qn = connection.ops.quote_name
+        table = qn(Vote._meta.db_table)
+        if check_item:
+            item_table = qn(ITEM_MODELS[vote_type]._meta.db_table)
+            condition = f"EXISTS (SELECT 1 FROM {item_table} WHERE {qn('id')} = %s)"
+        else:
+            condition = "%s IS NOT NULL"
+        sql = (
+            f"INSERT INTO {table} ({qn('vote_type')}, {qn('item_id')}, {qn('votes')}, {qn('created_at')}, {qn('updated_at')}) "
+            f"SELECT %s, %s, %s, %s, %s WHERE {condition} "
+            f"ON CONFLICT ({qn('vote_type')}, {qn('item_id')}) DO UPDATE "
+            f"SET {qn('votes')} = {table}.{qn('votes')} + EXCLUDED.{qn('votes')}, "
+            f"{qn('updated_at')} = EXCLUDED.{qn('updated_at')}"
+        )
+        if returning:
+            sql += ' RETURNING ' + ', '.join(qn(field) for field in VoteService.RETURNING_FIELDS)
+        return sql
+
+    @staticmethod
+    def vote_from_row(connection, vote_type: str, item_id: int, row) -> Vote:
+        """Build a Vote from a RETURNING row, applying the backend's value converters"""
+        values = {}
+        for name, value in zip(VoteService.RETURNING_FIELDS, row):
+            field = Vote._meta.get_field(name)
+            col = field.get_col(Vote._meta.db_table)
+            for converter in connection.ops.get_db_converters(col) + field.get_db_converters(connection):
+                value = converter(value, col, connection)
+            values[name] = value
+        vote = Vote(vote_type=vote_type, item_id=item_id, **values)
+        vote._state.adding = False
+        vote._state.db = connection.alias
+        return vote
+
+    @staticmethod
+    def vote_db(vote_type: str, item_id: int) -> str:
+        """Database holding the item's Vote row"""
+        if is_sharded():
+            return shard_for(vote_type, item_id)
+        return router.db_for_write(Vote)
+
+    @staticmethod
+    def cast_vote(vote_type: str, item_id: int, count: int = 1) -> Vote:
+        """Add ``count`` votes for an item in a single round trip"""
+        if settings.VOTE_COUNTER_SHARDS:
+            return VoteService.cast_sharded_vote(vote_type, item_id, count)
+        if is_sharded():
+            # The catalog isn't on the vote shards, so check it separately
+            VoteService.ensure_item_exists(vote_type, item_id)
+            check_item = False
+        else:
+            check_item = not VoteService.indexed([(vote_type, item_id)])
+        alias = VoteService.vote_db(vote_type, item_id)
+        connection = connections[alias]
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        with connection.cursor() as cursor:
+            cursor.execute(
+                VoteService.upsert_sql(connection, vote_type, check_item=check_item),
+                [vote_type, item_id, count, now, now, item_id]
+            )
+            row = cursor.fetchone()
+        if row is None:
+            raise VoteService.item_not_found(vote_type)
+        return VoteService.vote_from_row(connection, vote_type, item_id, row)
+
+    @staticmethod
+    def item_not_found(vote_type: str) -> VoteItemNotFound:
+        model = ITEM_MODELS[vote_type]
+        return VoteItemNotFound(f"{model._meta.verbose_name.capitalize()} with this ID does not exist.")
+
+    @staticmethod
+    def ensure_item_exists(vote_type: str, item_id: int):
+        if not VoteService.existing_items({vote_type: [item_id]}):
+            raise VoteService.item_not_found(vote_type)
+
+    @staticmethod
+    def indexed(keys: Iterable[Tuple[str, int]]) -> bool:
+        """Whether the catalog id index knows every (vote_type, item_id), so
+        writes can skip checking that the items exist"""
+        index = get_catalog_id_index()
+        if index is None:
+            return False
+        keys = list(keys)
+        known = sum(index.contains(ITEM_MODELS[vote_type], item_id) for vote_type, item_id in keys)
+        record_cache('catalog_ids', hits=known, misses=len(keys) - known)
+        return known == len(keys)
+
+    @staticmethod
+    def existing_items(ids_by_type: Dict[str, Iterable[int]]) -> Set[Tuple[str, int]]:
+        """(vote_type, item_id) pairs that exist.
+
+        Ids are looked up in the in-memory catalog id index when it is
+        enabled; only ids it doesn't know are checked in the database, with
+        one ``IN`` query per vote type.
+        """
+        index = get_catalog_id_index()
+        existing = set()
+        for vote_type, item_ids in ids_by_type.items():
+            model = ITEM_MODELS[vote_type]
+            unknown = set()
+            item_ids = set(item_ids)
+            for item_id in item_ids:
+                if index is not None and index.contains(model, item_id):
+                    existing.add((vote_type, item_id))
+                else:
+                    unknown.add(item_id)
+            if index is not None:
+                record_cache('catalog_ids', hits=len(item_ids) - len(unknown), misses=len(unknown))
+            if unknown:
+                found = model.objects.filter(id__in=unknown).order_by().values_list('id', flat=True)
+                existing.update((vote_type, item_id) for item_id in found)
+        return existing
+
+    @staticmethod
+    def apply_increments(increments: Dict[Tuple[str, int], int]) -> int:
+        """Apply many (vote_type, item_id) -> count increments, one transaction per database.
+
+        Rows are written in key order so concurrent batches lock them in the
+        same order; increments for items that no longer exist are dropped.
+        With vote shards the items must already have been validated, and
+        batches whose items are all in the catalog id index aren't checked.
+        """
+        by_alias = {}
+        for key, count in increments.items():
+            if count:
+                by_alias.setdefault(VoteService.vote_db(*key), {})[key] = count
+        check_item = not is_sharded()
+        return sum(
+            VoteService.write_increments(alias, batch, check_item=check_item and not VoteService.indexed(batch))
+            for alias, batch in by_alias.items()
+        )
+
+    @staticmethod
+    def write_increments(alias: str, increments: Dict[Tuple[str, int], int], check_item: bool = True) -> int:
+        """Upsert increments into one database's Vote table in a single transaction"""
+        connection = connections[alias]
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        by_type = {}
+        for (vote_type, item_id), count in sorted(increments.items()):
+            if count:
+                by_type.setdefault(vote_type, []).append([vote_type, item_id, count, now, now, item_id])
+        with transaction.atomic(using=alias), connection.cursor() as cursor:
+            for vote_type, params in by_type.items():
+                cursor.executemany(
+                    VoteService.upsert_sql(connection, vote_type, returning=False, check_item=check_item), params
+                )
+        return sum(len(params) for params in by_type.values())
+
+    @staticmethod
+    def rebalance_shards(include_default: bool = False, dry_run: bool = False,
+                         batch_size: int = 500) -> Dict[str, int]:
+        """Move Vote rows that are on the wrong database for the current VOTE_SHARD_DATABASES.
+
+        Each batch is upserted into its target shards, together with a
+        VoteMove entry per row, before it is deleted from the source. A run
+        that dies between the two leaves the rows on both databases; the next
+        run finds their VoteMove entries and only deletes them from the
+        source, so an interrupted run can be repeated without counting votes
+        twice. Votes should be paused while rows move, or votes cast on the
+        old shard during a batch can be lost. ``include_default`` also drains
+        rows written to the default database before sharding was enabled.
+        Returns the rows moved per source database.
+        """
+        shards = vote_databases()
+        sources = list(dict.fromkeys(shards + (['default'] if include_default else [])))
+        if not dry_run:
+            VoteService._forget_finished_moves(shards)
+        moved = {}
+        for source in sources:
+            moved[source] = 0
+            last_pk = 0
+            while True:
+                rows = list(
+                    Vote.objects.using(source).filter(pk__gt=last_pk).order_by('pk')
+                    .values_list('pk', 'vote_type', 'item_id', 'votes')[:batch_size]
+                )
+                if not rows:
+                    break
+                last_pk = rows[-1][0]
+                by_target = defaultdict(dict)
+                for pk, vote_type, item_id, votes in rows:
+                    target = shard_for(vote_type, item_id, shards)
+                    if target != source:
+                        by_target[target][pk] = (vote_type, item_id, votes)
+                stray = [pk for rows_by_pk in by_target.values() for pk in rows_by_pk]
+                moved[source] += len(stray)
+                if dry_run or not stray:
+                    continue
+                for target, rows_by_pk in by_target.items():
+                    VoteService._copy_votes(source, target, rows_by_pk)
+                Vote.objects.using(source).filter(pk__in=stray).delete()
+                for target, rows_by_pk in by_target.items():
+                    VoteMove.objects.using(target).filter(source=source, source_pk__in=list(rows_by_pk)).delete()
+                logger.info("Moved %s votes off %s", len(stray), source)
+        return moved
+
+    @staticmethod
+    def _copy_votes(source: str, target: str, rows_by_pk: Dict[int, Tuple[str, int, int]]):
+        """Add source rows' votes to ``target``, skipping rows an earlier run already copied"""
+        with transaction.atomic(using=target):
+            copied = set(
+                VoteMove.objects.using(target).filter(source=source, source_pk__in=list(rows_by_pk))
+                .values_list('source_pk', flat=True)
+            )
+            pending = {pk: row for pk, row in rows_by_pk.items() if pk not in copied}
+            VoteMove.objects.using(target).bulk_create(
+                [VoteMove(source=source, source_pk=pk) for pk in pending]
+            )
+            increments = defaultdict(int)
+            for vote_type, item_id, votes in pending.values():
+                increments[(vote_type, item_id)] += votes
+            VoteService.write_increments(target, increments, check_item=False)
+
+    @staticmethod
+    def _forget_finished_moves(shards):
+        """Drop VoteMove entries whose source row is gone, so a reused pk isn't taken as copied"""
+        for target in shards:
+            entries = defaultdict(list)
+            for source, source_pk in VoteMove.objects.using(target).values_list('source', 'source_pk'):
+                entries[source].append(source_pk)
+            for source, pks in entries.items():
+                remaining = set(Vote.objects.using(source).filter(pk__in=pks).values_list('pk', flat=True))
+                VoteMove.objects.using(target).filter(
+                    source=source, source_pk__in=[pk for pk in pks if pk not in remaining]
+                ).delete()
+
+    @staticmethod
+    def shard_upsert_sql(connection, vote_type: str, check_item: bool = True) -> str:
+        """Insert-or-increment one counter shard, only when the voted item exists.
+
+        Params: vote_type, item_id, shard, count, item_id. ``check_item=False``
+        skips the existence check like in upsert_sql.
+        """
+        qn = connection.ops.quote_name
+        table = qn(VoteShard._meta.db_table)
+        if check_item:
+            item_table = qn(ITEM_MODELS[vote_type]._meta.db_table)
+            condition = f"EXISTS (SELECT 1 FROM {item_table} WHERE {qn('id')} = %s)"
+        else:
+            condition = "%s IS NOT NULL"
+        return (
+            f"INSERT INTO {table} ({qn('vote_type')}, {qn('item_id')}, {qn('shard')}, {qn('votes')}) "
+            f"SELECT %s, %s, %s, %s WHERE {condition} "
+            f"ON CONFLICT ({qn('vote_type')}, {qn('item_id')}, {qn('shard')}) DO UPDATE "
+            f"SET {qn('votes')} = {table}.{qn('votes')} + EXCLUDED.{qn('votes')}"
+        )
+
+    @staticmethod
+    def cast_sharded_vote(vote_type: str, item_id: int, count: int = 1) -> Vote:
+        """Add ``count`` votes to a random shard of the item's counter.
+
+        The Vote row is created with zero votes if missing but never updated
+        here, so concurrent voters only contend when they pick the same shard.
+        """
+        alias = router.db_for_write(Vote)
+        connection = connections[alias]
+        qn = connection.ops.quote_name
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        shard = random.randrange(settings.VOTE_COUNTER_SHARDS)
+        check_item = not VoteService.indexed([(vote_type, item_id)])
+        with transaction.atomic(using=alias), connection.cursor() as cursor:
+            cursor.execute(
+                VoteService.shard_upsert_sql(connection, vote_type, check_item=check_item),
+                [vote_type, item_id, shard, count, item_id]
+            )
+            if cursor.rowcount == 0:
+                raise VoteService.item_not_found(vote_type)
+            cursor.execute(
+                f"INSERT INTO {qn(Vote._meta.db_table)} "
+                f"({qn('vote_type')}, {qn('item_id')}, {qn('votes')}, {qn('created_at')}, {qn('updated_at')}) "
+                f"VALUES (%s, %s, 0, %s, %s) ON CONFLICT ({qn('vote_type')}, {qn('item_id')}) DO NOTHING",
+                [vote_type, item_id, now, now]
+            )
+        vote = Vote.objects.using(alias).with_shard_totals().get(vote_type=vote_type, item_id=item_id)
+        vote.votes = vote.total_votes
+        return vote
+
+    @staticmethod
+    def compact_shards() -> int:
+        """Fold all counter shards into their Vote rows; returns the counters compacted.
+
+        Shards are deleted and their sums added to Vote in one transaction, so
+        readers see every vote exactly once and a vote racing the compaction
+        simply starts a fresh shard row.
+        """
+        alias = router.db_for_write(VoteShard)
+        connection = connections[alias]
+        qn = connection.ops.quote_name
+        increments = defaultdict(int)
+        with transaction.atomic(using=alias):
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"DELETE FROM {qn(VoteShard._meta.db_table)} "
+                    f"RETURNING {qn('vote_type')}, {qn('item_id')}, {qn('votes')}"
+                )
+                for vote_type, item_id, votes in cursor.fetchall():
+                    increments[(vote_type, item_id)] += votes
+            if increments:
+                VoteService.apply_increments(increments)
+        return len(increments)
@@ -0,0 +1,137 @@
+import contextvars
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from operator import attrgetter
+from typing import Callable, List, Optional, Tuple
+from django.conf import settings
+from django.db import connections
+
+# Public vote ids encode the shard: local id * SHARD_ID_MULTIPLIER + shard index
+SHARD_ID_MULTIPLIER = 1024
+
+# Models stored on the shard of their (vote_type, item_id)
+SHARDED_MODELS = {'voting.vote', 'voting.votersketch', 'voting.voterbucket', 'voting.votemove'}
+
+_executor = None
+
+
+def is_sharded() -> bool:
+    return bool(settings.VOTE_SHARD_DATABASES)
+
+
+def vote_databases() -> List[str]:
+    """Databases holding Vote rows"""
+    return list(settings.VOTE_SHARD_DATABASES) or ['default']
+
+
+def shard_for(vote_type: str, item_id: int, shards: Optional[List[str]] = None) -> str:
+    """Shard owning an item's Vote row; a stable hash so every process agrees"""
+    shards = shards or settings.VOTE_SHARD_DATABASES
+    return shards[zlib.crc32(f'{vote_type}:{item_id}'.encode()) % len(shards)]
+
+
+def public_vote_id(vote) -> int:
+    """API id of a Vote: unique across shards as long as rows stay on their shard"""
+    shards = settings.VOTE_SHARD_DATABASES
+    if vote._state.db in shards:
+        return vote.pk * SHARD_ID_MULTIPLIER + shards.index(vote._state.db)
+    return vote.pk
+
+
+def locate_vote(public_id: int) -> Tuple[Optional[str], int]:
+    """(database, local pk) of an API vote id; the database is None for an unknown shard"""
+    shards = settings.VOTE_SHARD_DATABASES
+    if not shards:
+        return 'default', public_id
+    index = public_id % SHARD_ID_MULTIPLIER
+    return (shards[index] if index < len(shards) else None), public_id // SHARD_ID_MULTIPLIER
+
+
+def scatter(func: Callable[[str], object], aliases: Optional[List[str]] = None) -> list:
+    """Run ``func(alias)`` for every vote shard in parallel; results in alias order.
+
+    Without shards ``func`` is called once with None, which ``QuerySet.using``
+    treats as "let the routers pick", so replica reads keep working.
+    """
+    global _executor
+    aliases = aliases or list(settings.VOTE_SHARD_DATABASES) or [None]
+    if len(aliases) == 1:
+        return [func(aliases[0])]
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix='vote-scatter')
+
+    def run(alias):
+        try:
+            return func(alias)
+        finally:
+            # Worker threads outlive requests, so apply CONN_MAX_AGE here
+            connections[alias].close_if_unusable_or_obsolete()
+
+    # Each task runs in a copy of the caller's context (request timings, primary pinning)
+    futures = [_executor.submit(contextvars.copy_context().run, run, alias) for alias in aliases]
+    return [future.result() for future in futures]
+
+
+class GatheredRows:
+    """Rows merged from every shard in query order, sized as the full result set.
+
+    Each shard returns only its first ``limit`` rows, which is enough for any
+    page ending at ``limit``; ``len`` reports the summed shard counts so the
+    paginator's links and ``count`` stay correct. Ties are broken by pk
+    within each shard and by shard order across them, so pages never
+    overlap or skip rows.
+    """
+
+    def __init__(self, queryset, limit: int):
+        ordering = [field for field in queryset.query.order_by if isinstance(field, str)]
+        if not any(field.lstrip('-') in ('pk', 'id') for field in ordering):
+            ordering.append('pk')
+            queryset = queryset.order_by(*queryset.query.order_by, 'pk')
+        parts = scatter(lambda alias: (
+            queryset.using(alias).count(),
+            list(queryset.using(alias)[:limit]),
+        ))
+        self.total = sum(count for count, _ in parts)
+        self.rows = [row for _, rows in parts for row in rows]
+        # Stable sorts from the last ordering field to the first
+        for field in reversed(ordering):
+            self.rows.sort(key=attrgetter(field.lstrip('-')), reverse=field.startswith('-'))
+
+    def __len__(self):
+        return self.total
+
+    def __getitem__(self, index):
+        return self.rows[index]
+
+
+class VoteShardRouter:
+    """Place each Vote row, and its voter sketches, on one of VOTE_SHARD_DATABASES
+    by a hash of (vote_type, item_id).
+
+    Queries that aren't about a single row (lists, stats) have no shard key;
+    they are left to the next router and must be scattered explicitly with
+    ``scatter`` across ``vote_databases()``.
+    """
+
+    def _shard(self, model, hints):
+        if model._meta.label_lower not in SHARDED_MODELS or not settings.VOTE_SHARD_DATABASES:
+            return None
+        instance = hints.get('instance')
+        if instance is None:
+            return None
+        if instance._state.db in settings.VOTE_SHARD_DATABASES:
+            return instance._state.db
+        if instance.vote_type and instance.item_id:
+            return shard_for(instance.vote_type, instance.item_id)
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._shard(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._shard(model, hints)
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.VOTE_SHARD_DATABASES:
+            return f'{app_label}.{model_name}' in SHARDED_MODELS
+        return None
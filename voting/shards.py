@@ -0,0 +1,53 @@
+import logging
+import threading
+from django.conf import settings
+from django.db import close_old_connections
+from .services import VoteService
+
+logger = logging.getLogger(__name__)
+
+
+class ShardCompactor:
+    """Background thread that folds vote counter shards into Vote every ``interval`` seconds"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def ensure_running(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='vote-shard-compactor', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            close_old_connections()
+            try:
+                compacted = VoteService.compact_shards()
+                if compacted:
+                    logger.debug("Compacted vote shards for %s items", compacted)
+            except Exception as e:
+                logger.error("Failed to compact vote shards: %s", e)
+
+    def stop(self):
+        self._stopped.set()
+
+
+_compactor = None
+_compactor_lock = threading.Lock()
+
+
+def start_shard_compactor():
+    """Start this process's compactor unless background compaction is disabled"""
+    global _compactor
+    if not settings.VOTE_SHARD_COMPACT_INTERVAL:
+        return
+    with _compactor_lock:
+        if _compactor is None:
+            _compactor = ShardCompactor(settings.VOTE_SHARD_COMPACT_INTERVAL)
+    _compactor.ensure_running()
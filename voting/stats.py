@@ -0,0 +1,198 @@
+from functools import reduce
+from operator import or_
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import F, Q, Sum, Window
+from django.db.models.functions import RowNumber
+from core.models import Character, Film, Starship
+from .models import Vote
+from .sharding import is_sharded, scatter, shard_for
+
+TOP_ITEMS = 10
+MAX_TOP_ITEMS = 100
+
+# (vote_type, stats key, catalog model, field holding the display name)
+CATEGORIES = [
+    ('character', 'characters', Character, 'name'),
+    ('film', 'films', Film, 'title'),
+    ('starship', 'starships', Starship, 'name'),
+]
+
+
+def item_stats(item_id, votes, name, total):
+    percentage = (votes / total * 100) if total > 0 else 0
+    return {
+        'id': item_id,
+        'name': name,
+        'votes': votes,
+        'percentage': round(percentage, 2)
+    }
+
+
+def parse_top_n(value) -> int:
+    """The ``top_n`` query parameter clamped to 1..MAX_TOP_ITEMS; ValueError if not a number"""
+    if value in (None, ''):
+        return TOP_ITEMS
+    return max(1, min(int(value), MAX_TOP_ITEMS))
+
+
+def vote_counters():
+    """Vote rows and the field holding their current count"""
+    if settings.VOTE_COUNTER_SHARDS:
+        return Vote.objects.with_shard_totals(), 'total_votes'
+    return Vote.objects.all(), 'votes'
+
+
+def _stats_querysets(top_n, pending):
+    """Querysets for the per-type totals, the top ``top_n`` rows per type and
+    the stored counts of items with pending votes (None without pending).
+
+    Each is a single statement whatever ``top_n`` or the number of types.
+    """
+    votes, field = vote_counters()
+    totals = votes.order_by().values('vote_type').annotate(total=Sum(field)).values_list('vote_type', 'total')
+    ranked = votes.annotate(rank=Window(
+        RowNumber(),
+        partition_by=[F('vote_type')],
+        order_by=[F(field).desc(), F('item_id').asc()],
+    )).filter(rank__lte=top_n).values_list('vote_type', 'item_id', field)
+    stored = None
+    if pending:
+        by_type = {}
+        for vote_type, item_id in pending:
+            by_type.setdefault(vote_type, []).append(item_id)
+        condition = reduce(or_, (Q(vote_type=vote_type, item_id__in=ids) for vote_type, ids in by_type.items()))
+        stored = votes.filter(condition).values_list('vote_type', 'item_id', field)
+    return totals, ranked, stored
+
+
+def _scatter_stats_rows(top_n, pending):
+    """Rows of the stats querysets from every vote shard, fetched in parallel and concatenated"""
+    totals, ranked, stored = _stats_querysets(top_n, pending)
+
+    def fetch(alias):
+        return (
+            list(totals.using(alias)),
+            list(ranked.using(alias)),
+            None if stored is None else list(stored.using(alias)),
+        )
+
+    parts = scatter(fetch)
+    return (
+        [row for part in parts for row in part[0]],
+        [row for part in parts for row in part[1]],
+        None if stored is None else [row for part in parts for row in part[2]],
+    )
+
+
+def _rank_items(totals, ranked, stored, pending, top_n):
+    """Merge stored rows with pending deltas into per-type totals and top lists.
+
+    An item outside both the stored top rows and the pending items cannot
+    outrank the merged top list because pending deltas only add votes.
+    """
+    type_totals = {}
+    for vote_type, total in totals:
+        # One row per type per vote shard
+        type_totals[vote_type] = (type_totals.get(vote_type) or 0) + (total or 0)
+    counts = {}
+    for vote_type, item_id, votes in list(ranked) + list(stored or ()):
+        counts.setdefault(vote_type, {})[item_id] = votes
+    for (vote_type, item_id), delta in (pending or {}).items():
+        type_counts = counts.setdefault(vote_type, {})
+        type_counts[item_id] = type_counts.get(item_id, 0) + delta
+        type_totals[vote_type] = (type_totals.get(vote_type) or 0) + delta
+    top = {
+        vote_type: sorted(type_counts.items(), key=lambda item: (-item[1], item[0]))[:top_n]
+        for vote_type, type_counts in counts.items()
+    }
+    return type_totals, top
+
+
+def _name_lookups(top):
+    """One ``in_bulk`` lookup per vote type with top items, loading only the name"""
+    for vote_type, key, model, name_field in CATEGORIES:
+        item_ids = [item_id for item_id, _ in top.get(vote_type, [])]
+        if item_ids:
+            yield vote_type, model.objects.only(name_field), item_ids
+
+
+def _assemble(type_totals, top, items_by_type):
+    stats = {}
+    overall_total = 0
+    for vote_type, key, model, name_field in CATEGORIES:
+        total = type_totals.get(vote_type) or 0
+        items = items_by_type.get(vote_type, {})
+        stats[key] = {
+            'total_votes': total,
+            # Votes can outlive their item; those are counted but not listed
+            'top_items': [
+                item_stats(item_id, votes, getattr(items[item_id], name_field), total)
+                for item_id, votes in top.get(vote_type, [])
+                if item_id in items
+            ]
+        }
+        overall_total += total
+    stats['overall_total'] = overall_total
+    return stats
+
+
+def vote_rank(vote_type, item_id):
+    """1-based place of an item within its vote type from the database, or None if it has no votes"""
+    votes, field = vote_counters()
+    votes = votes.filter(vote_type=vote_type)
+    item_votes = votes.filter(item_id=item_id)
+    if is_sharded():
+        item_votes = item_votes.using(shard_for(vote_type, item_id))
+    row = item_votes.values_list(field, flat=True).first()
+    if row is None:
+        return None
+    ahead_filter = Q(**{f'{field}__gt': row}) | Q(**{field: row, 'item_id__lt': item_id})
+    counts = scatter(lambda alias: (
+        votes.using(alias).filter(ahead_filter).count(),
+        votes.using(alias).count(),
+    ))
+    return {
+        'vote_type': vote_type,
+        'item_id': item_id,
+        'votes': row,
+        'rank': sum(ahead for ahead, _ in counts) + 1,
+        'total_items': sum(total for _, total in counts),
+    }
+
+
+def build_vote_stats(pending=None, top_n=TOP_ITEMS):
+    """Vote totals and top ``top_n`` items with names and percentages for each category.
+
+    ``pending`` maps (vote_type, item_id) to votes not yet written to the Vote
+    table, e.g. from the write-behind buffer; they are merged into the result.
+    Runs at most six queries, independent of ``top_n``; with vote shards the
+    first three run on every shard in parallel.
+    """
+    if is_sharded():
+        totals, ranked, stored = _scatter_stats_rows(top_n, pending)
+    else:
+        totals, ranked, stored = _stats_querysets(top_n, pending)
+    type_totals, top = _rank_items(totals, ranked, stored, pending, top_n)
+    items_by_type = {
+        vote_type: queryset.in_bulk(item_ids)
+        for vote_type, queryset, item_ids in _name_lookups(top)
+    }
+    return _assemble(type_totals, top, items_by_type)
+
+
+async def abuild_vote_stats(pending=None, top_n=TOP_ITEMS):
+    """Async ORM counterpart of build_vote_stats"""
+    if is_sharded():
+        # The scatter-gather runs on a thread pool either way
+        return await sync_to_async(build_vote_stats)(pending, top_n)
+    totals, ranked, stored = _stats_querysets(top_n, pending)
+    totals = [row async for row in totals]
+    ranked = [row async for row in ranked]
+    if stored is not None:
+        stored = [row async for row in stored]
+    type_totals, top = _rank_items(totals, ranked, stored, pending, top_n)
+    items_by_type = {}
+    for vote_type, queryset, item_ids in _name_lookups(top):
+        items_by_type[vote_type] = await queryset.ain_bulk(item_ids)
+    return _assemble(type_totals, top, items_by_type)
@@ -0,0 +1,108 @@
+import asyncio
+import json
+import logging
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+KEEPALIVE_SECONDS = 15
+
+
+class _Subscriber:
+    def __init__(self):
+        self.pending = {}
+        self.ready = asyncio.Event()
+
+    def push(self, delta: dict):
+        # A slow client gets the changes coalesced rather than a backlog
+        self.pending.update(delta)
+        self.ready.set()
+
+    def take(self) -> dict:
+        delta, self.pending = self.pending, {}
+        self.ready.clear()
+        return delta
+
+
+class StatsBroadcaster:
+    """Computes vote stats once per ``interval`` and fans the changes out.
+
+    A single task per event loop runs while anyone is subscribed; each tick
+    it computes one snapshot and pushes the top-level keys that changed to
+    every subscriber, so the stats cost depends on the interval, not on the
+    number of connected dashboards.
+    """
+
+    def __init__(self, compute: Callable[[], Awaitable[dict]], interval: float = 2.0):
+        self.compute = compute
+        self.interval = interval
+        self.snapshot: Optional[dict] = None
+        self.computations = 0
+        self._subscribers = set()
+        self._task = None
+        # Held while the task is (re)started, so concurrent first subscribers start one
+        self._starting = asyncio.Lock()
+
+    async def refresh(self) -> dict:
+        """Compute a new snapshot and push what changed to all subscribers"""
+        snapshot = await self.compute()
+        self.computations += 1
+        previous = self.snapshot or {}
+        delta = {key: value for key, value in snapshot.items() if previous.get(key) != value}
+        self.snapshot = snapshot
+        if delta:
+            for subscriber in self._subscribers:
+                subscriber.push(delta)
+        return delta
+
+    async def _run(self):
+        while self._subscribers:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error("Failed to refresh streamed vote statistics: %s", e)
+
+    async def subscribe(self):
+        """Server-sent event stream: a full ``snapshot`` event, then ``stats`` events with changed keys"""
+        subscriber = _Subscriber()
+        async with self._starting:
+            if self._task is None or self._task.done():
+                # Nobody was watching, so the last snapshot may be stale
+                await self.refresh()
+                self._task = asyncio.create_task(self._run())
+            self._subscribers.add(subscriber)
+        try:
+            yield _event('snapshot', self.snapshot)
+            while True:
+                try:
+                    await asyncio.wait_for(subscriber.ready.wait(), KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+                yield _event('stats', subscriber.take())
+        finally:
+            self._subscribers.discard(subscriber)
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+
+def _event(name: str, data: dict) -> str:
+    return f"event: {name}\ndata: {json.dumps(data)}\n\n"
+
+
+_broadcasters = {}
+
+
+def get_stats_broadcaster(compute: Callable[[], Awaitable[dict]], interval: float) -> StatsBroadcaster:
+    """The broadcaster for the running event loop (one per ASGI worker process)"""
+    loop = asyncio.get_running_loop()
+    broadcaster = _broadcasters.get(loop)
+    if broadcaster is None:
+        # Drop broadcasters of loops that have since closed
+        for closed in [other for other in _broadcasters if other.is_closed()]:
+            del _broadcasters[closed]
+        broadcaster = _broadcasters[loop] = StatsBroadcaster(compute, interval)
+    return broadcaster
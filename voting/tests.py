@@ -1,10 +1,33 @@
-from django.test import TestCase
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.db.models import QuerySet
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework.test import APITestCase
 from rest_framework import status
+from core.catalog import catalog_generation
 from core.models import Character, Film, Starship
-from .models import Vote
-from datetime import date
+from core.services import SWAPIService
+from starwars_api.routers import PrimaryReplicaRouter, use_primary
+import asyncio
+import json
+import random
+from .buffer import VoteBuffer
+from .history import VoteHistoryService, get_history_recorder
+from .leaderboard import OrderStatisticTree, get_leaderboard
+from .loadtest import classify_error, load_items, run_load_test
+from .stream import StatsBroadcaster
+from .hll import HyperLogLog
+from .models import Vote, VoteBucket, VoteMove, VoterBucket, VoterSketch, VoteShard
+from .services import VoteService
+from .checks import check_vote_sharding
+from .sharding import VoteShardRouter, shard_for
+from .views import SHARDED_MAX_PAGE
+from .voters import CATEGORY_ITEM_ID, VoterSketchService, category_slot
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from unittest.mock import patch
 
 class VoteModelTest(TestCase):
     def setUp(self):
@@ -80,10 +103,21 @@ class VoteViewSetTest(APITestCase):
         self.assertEqual(response1.status_code, status.HTTP_201_CREATED)
         self.assertEqual(response1.data['votes'], 1)
         
-        # Second vote (vote already exists with this ID)
+        # Second vote increments the existing count
         response2 = self.client.post(url, data)
-        self.assertEqual(response2.status_code, status.HTTP_400_BAD_REQUEST)  # Should fail due to unique constraint
-        self.assertIn('non_field_errors', response2.data)
+        self.assertEqual(response2.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response2.data['votes'], 2)
+        self.assertEqual(response2.data['id'], response1.data['id'])
+        self.assertEqual(Vote.objects.get(pk=response1.data['id']).votes, 2)
+
+    def test_create_vote_is_single_statement(self):
+        url = reverse('votes-list')
+        data = {'vote_type': 'film', 'item_id': self.film.id}
+        self.client.post(url, data)
+        with self.assertNumQueries(1):
+            response = self.client.post(url, data)
+        self.assertEqual(response.data['votes'], 2)
+        self.assertIsNotNone(response.data['created_at'])
 
     def test_create_vote_invalid_character(self):
         url = reverse('votes-list')
@@ -93,6 +127,8 @@ class VoteViewSetTest(APITestCase):
         }
         response = self.client.post(url, data)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['non_field_errors'], ['Character with this ID does not exist.'])
+        self.assertFalse(Vote.objects.exists())
 
     def test_create_vote_invalid_film(self):
         url = reverse('votes-list')
@@ -141,6 +177,36 @@ class VoteViewSetTest(APITestCase):
         self.assertEqual(character_items[0]['votes'], 10)
         self.assertEqual(character_items[0]['percentage'], 100.0)
 
+    def test_vote_stats_query_count_is_constant(self):
+        for swapi_id in range(2, 30):
+            character = Character.objects.create(swapi_id=swapi_id, name=f"Character {swapi_id}")
+            Vote.objects.create(vote_type='character', item_id=character.id, votes=swapi_id)
+        Vote.objects.create(vote_type='film', item_id=self.film.id, votes=20)
+        Vote.objects.create(vote_type='starship', item_id=self.starship.id, votes=30)
+
+        # Totals, ranked top rows, then one in_bulk per category
+        for top_n in (1, 5, 50):
+            with self.assertNumQueries(5):
+                response = self.client.get(reverse('votes-stats'), {'top_n': top_n})
+            characters = response.data['characters']['top_items']
+            self.assertEqual(len(characters), min(top_n, 28))
+            self.assertEqual(characters[0]['name'], 'Character 29')
+        self.assertEqual(response.data['characters']['total_votes'], sum(range(2, 30)))
+        self.assertEqual(len(self.client.get(reverse('votes-stats')).data['characters']['top_items']), 10)
+
+    def test_vote_stats_rejects_invalid_top_n(self):
+        response = self.client.get(reverse('votes-stats'), {'top_n': 'many'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_async_vote_stats_matches_sync(self):
+        Vote.objects.create(vote_type='character', item_id=self.character.id, votes=10)
+        Vote.objects.create(vote_type='film', item_id=self.film.id, votes=20)
+
+        response = self.client.get(reverse('async-votes-stats'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), self.client.get(reverse('votes-stats')).json())
+        self.assertEqual(response.json()['overall_total'], 30)
+
     def test_filter_votes_by_type(self):
         Vote.objects.create(vote_type='character', item_id=self.character.id, votes=5)
         Vote.objects.create(vote_type='film', item_id=self.film.id, votes=3)
@@ -162,3 +228,816 @@ class VoteViewSetTest(APITestCase):
         votes = response.data['results']
         self.assertEqual(votes[0]['votes'], 10)  # Film vote should be first
         self.assertEqual(votes[1]['votes'], 3)   # Character vote should be second
+
+    def test_bulk_votes(self):
+        Vote.objects.create(vote_type='film', item_id=self.film.id, votes=2)
+        payload = [
+            {'vote_type': 'character', 'item_id': self.character.id},
+            {'vote_type': 'film', 'item_id': self.film.id, 'count': 3},
+            {'vote_type': 'character', 'item_id': self.character.id, 'count': 4},
+            {'vote_type': 'starship', 'item_id': 999},
+            {'vote_type': 'planet', 'item_id': 1},
+            {'vote_type': 'film', 'item_id': self.film.id, 'count': 0},
+        ]
+        # One IN query per vote type, then one statement per written type inside a savepoint
+        with self.assertNumQueries(7):
+            response = self.client.post(reverse('votes-bulk'), payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['accepted_votes'], 8)
+        self.assertCountEqual(response.data['accepted'], [
+            {'vote_type': 'character', 'item_id': self.character.id, 'count': 5},
+            {'vote_type': 'film', 'item_id': self.film.id, 'count': 3},
+        ])
+        self.assertEqual([entry['index'] for entry in response.data['rejected']], [3, 4, 5])
+        self.assertIn('item_id', response.data['rejected'][0]['errors'])
+        self.assertIn('vote_type', response.data['rejected'][1]['errors'])
+        self.assertIn('count', response.data['rejected'][2]['errors'])
+        self.assertEqual(Vote.objects.get(vote_type='character').votes, 5)
+        self.assertEqual(Vote.objects.get(vote_type='film').votes, 5)
+
+    def test_bulk_votes_requires_a_list(self):
+        response = self.client.post(reverse('votes-bulk'), {'vote_type': 'film', 'item_id': self.film.id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(VOTE_WRITE_BEHIND=True)
+class WriteBehindVoteTest(APITestCase):
+    def setUp(self):
+        self.character = Character.objects.create(swapi_id=1, name="Luke Skywalker", gender="male")
+        self.other = Character.objects.create(swapi_id=2, name="Leia Organa", gender="female")
+        self.buffer = VoteBuffer(flush_interval=None)
+        patcher = patch('voting.buffer.get_vote_buffer', return_value=self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch('voting.views.get_vote_buffer', return_value=self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_votes_are_buffered_then_flushed_in_one_batch(self):
+        url = reverse('votes-list')
+        for _ in range(3):
+            response = self.client.post(url, {'vote_type': 'character', 'item_id': self.character.id})
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['pending_votes'], 3)
+        self.assertFalse(Vote.objects.exists())
+
+        self.buffer.add('character', self.other.id, 2)
+        with self.assertNumQueries(3):  # savepoint, one executemany, release
+            self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(Vote.objects.get(item_id=self.character.id).votes, 3)
+        self.assertEqual(self.buffer.pending(), {})
+
+    def test_invalid_item_is_rejected(self):
+        response = self.client.post(reverse('votes-list'), {'vote_type': 'character', 'item_id': 999})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.buffer.pending(), {})
+
+    def test_reads_merge_pending_votes(self):
+        Vote.objects.create(vote_type='character', item_id=self.character.id, votes=5)
+        self.buffer.add('character', self.character.id, 2)
+        self.buffer.add('character', self.other.id, 10)
+
+        response = self.client.get(reverse('votes-list'))
+        self.assertEqual(response.data['results'][0]['votes'], 7)
+
+        stats = self.client.get(reverse('votes-stats')).data['characters']
+        self.assertEqual(stats['total_votes'], 17)
+        self.assertEqual([item['name'] for item in stats['top_items']], ['Leia Organa', 'Luke Skywalker'])
+        self.assertEqual(stats['top_items'][0]['votes'], 10)
+
+    def test_failed_flush_keeps_votes_pending(self):
+        self.buffer.add('character', self.character.id, 4)
+        with patch('voting.buffer.VoteService.apply_increments', side_effect=RuntimeError('db down')):
+            with self.assertRaises(RuntimeError):
+                self.buffer.flush()
+        self.assertEqual(self.buffer.pending(), {('character', self.character.id): 4})
+
+    def test_full_buffer_flushes_without_an_interval(self):
+        buffer = VoteBuffer(flush_interval=None, max_pending=3)
+        buffer.add('character', self.character.id, 2)
+        self.assertFalse(Vote.objects.exists())
+        buffer.add('character', self.character.id)
+        self.assertEqual(Vote.objects.get(item_id=self.character.id).votes, 3)
+        self.assertEqual(buffer.pending(), {})
+
+    def test_exit_flush_is_registered_and_reports_dropped_votes(self):
+        with patch('voting.buffer.atexit.register') as register:
+            buffer = VoteBuffer(flush_interval=None)
+        register.assert_called_once_with(buffer.stop)
+        buffer.add('character', self.character.id, 4)
+        with patch('voting.buffer.VoteService.apply_increments', side_effect=RuntimeError('db down')):
+            with self.assertLogs('voting.buffer', 'ERROR') as logs:
+                buffer.stop()
+        self.assertIn('dropping 4 pending votes', logs.output[0])
+
+
+@override_settings(VOTE_COUNTER_SHARDS=4, VOTE_SHARD_COMPACT_INTERVAL=0)
+class ShardedVoteTest(APITestCase):
+    def setUp(self):
+        self.character = Character.objects.create(swapi_id=1, name="Luke Skywalker", gender="male")
+        self.other = Character.objects.create(swapi_id=2, name="Leia Organa", gender="female")
+
+    def vote(self, item_id, times=1):
+        for _ in range(times):
+            response = self.client.post(reverse('votes-list'), {'vote_type': 'character', 'item_id': item_id})
+        return response
+
+    def test_votes_go_to_shards_and_reads_sum_them(self):
+        response = self.vote(self.character.id, 5)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['votes'], 5)
+        self.vote(self.other.id, 2)
+
+        self.assertEqual(Vote.objects.get(item_id=self.character.id).votes, 0)
+        self.assertEqual(sum(VoteShard.objects.values_list('votes', flat=True)), 7)
+        self.assertLessEqual(VoteShard.objects.filter(item_id=self.character.id).count(), 4)
+
+        results = self.client.get(reverse('votes-list')).data['results']
+        self.assertEqual([(row['item_id'], row['votes']) for row in results], [(self.character.id, 5), (self.other.id, 2)])
+        ascending = self.client.get(reverse('votes-list'), {'ordering': 'votes'}).data['results']
+        self.assertEqual(ascending[0]['item_id'], self.other.id)
+
+        stats = self.client.get(reverse('votes-stats')).data['characters']
+        self.assertEqual(stats['total_votes'], 7)
+        self.assertEqual(stats['top_items'][0]['name'], 'Luke Skywalker')
+
+    def test_compaction_folds_shards_into_vote(self):
+        self.vote(self.character.id, 3)
+        Vote.objects.filter(item_id=self.character.id).update(votes=10)
+
+        self.assertEqual(VoteService.compact_shards(), 1)
+        self.assertFalse(VoteShard.objects.exists())
+        self.assertEqual(Vote.objects.get(item_id=self.character.id).votes, 13)
+
+        response = self.vote(self.character.id)
+        self.assertEqual(response.data['votes'], 14)
+        call_command('compact_vote_shards', stdout=StringIO())
+        self.assertEqual(Vote.objects.get(item_id=self.character.id).votes, 14)
+
+    def test_invalid_item_writes_nothing(self):
+        response = self.vote(999)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Vote.objects.exists())
+        self.assertFalse(VoteShard.objects.exists())
+
+    def test_delete_removes_shards(self):
+        vote_id = self.vote(self.character.id, 2).data['id']
+        response = self.client.delete(reverse('votes-detail', args=[vote_id]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(VoteShard.objects.exists())
+
+
+class OrderStatisticTreeTest(TestCase):
+    def test_matches_sorted_list(self):
+        tree = OrderStatisticTree()
+        keys = []
+        rng = random.Random(7)
+        for _ in range(500):
+            key = (rng.randint(-50, 0), rng.randint(1, 40))
+            if key in keys:
+                tree.remove(key)
+                keys.remove(key)
+            else:
+                tree.insert(key)
+                keys.append(key)
+        keys.sort()
+        self.assertEqual(len(tree), len(keys))
+        self.assertEqual(tree.first(10), keys[:10])
+        self.assertEqual(tree.first(len(keys) + 5), keys)
+        for index, key in enumerate(keys):
+            self.assertEqual(tree.rank(key), index)
+
+
+@override_settings(VOTE_LEADERBOARD=True, VOTE_LEADERBOARD_VERIFY_INTERVAL=0)
+class LeaderboardTest(APITestCase):
+    def setUp(self):
+        patcher = patch('voting.leaderboard._leaderboard', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.luke = Character.objects.create(swapi_id=1, name="Luke Skywalker")
+        self.leia = Character.objects.create(swapi_id=2, name="Leia Organa")
+        self.han = Character.objects.create(swapi_id=3, name="Han Solo")
+        Vote.objects.create(vote_type='character', item_id=self.luke.id, votes=5)
+        Vote.objects.create(vote_type='character', item_id=self.leia.id, votes=3)
+
+    def rank(self, item_id):
+        return self.client.get(reverse('votes-rank'), {'vote_type': 'character', 'item_id': item_id})
+
+    def test_stats_and_rank_are_served_from_memory(self):
+        get_leaderboard()
+        for _ in range(3):
+            self.client.post(reverse('votes-list'), {'vote_type': 'character', 'item_id': self.leia.id})
+
+        with self.assertNumQueries(0):
+            stats = self.client.get(reverse('votes-stats')).data
+            leia = self.rank(self.leia.id).data
+        self.assertEqual(stats['characters']['total_votes'], 11)
+        self.assertEqual([item['name'] for item in stats['characters']['top_items']], ['Leia Organa', 'Luke Skywalker'])
+        self.assertEqual((leia['rank'], leia['votes'], leia['total_items']), (1, 6, 2))
+        self.assertEqual(self.rank(self.han.id).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_delete_and_bulk_update_the_leaderboard(self):
+        leia_vote = Vote.objects.get(item_id=self.leia.id)
+        self.client.post(reverse('votes-bulk'), [{'vote_type': 'character', 'item_id': self.han.id, 'count': 9}], format='json')
+        self.assertEqual(self.rank(self.han.id).data['rank'], 1)
+        self.client.delete(reverse('votes-detail', args=[leia_vote.id]))
+        self.assertEqual(self.rank(self.leia.id).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(reverse('votes-stats')).data['characters']['total_votes'], 14)
+
+    def test_verify_reloads_writes_from_other_processes(self):
+        leaderboard = get_leaderboard()
+        Vote.objects.filter(item_id=self.leia.id).update(votes=50)
+        self.assertEqual(leaderboard.verify(), 1)
+        self.assertEqual(self.rank(self.leia.id).data['rank'], 1)
+        self.assertEqual(leaderboard.verify(), 0)
+
+    def test_drift_warning_is_rate_limited(self):
+        leaderboard = get_leaderboard()
+        with self.assertLogs('voting.leaderboard', 'DEBUG') as logs:
+            for votes in [50, 60]:
+                Vote.objects.filter(item_id=self.leia.id).update(votes=votes)
+                self.assertEqual(leaderboard.verify(), 1)
+        self.assertEqual([record.levelname for record in logs.records], ['WARNING', 'DEBUG'])
+
+    @override_settings(VOTE_LEADERBOARD=False)
+    def test_rank_from_database_when_disabled(self):
+        Vote.objects.create(vote_type='character', item_id=self.han.id, votes=3)
+        response = self.rank(self.han.id)
+        self.assertEqual((response.data['rank'], response.data['total_items']), (3, 3))
+        self.assertEqual(self.rank(self.luke.id).data['rank'], 1)
+
+
+class StatsBroadcasterTest(TestCase):
+    async def test_one_computation_fans_out_to_all_subscribers(self):
+        state = {'overall_total': 1, 'films': {'total_votes': 1}}
+
+        async def compute():
+            return dict(state)
+
+        broadcaster = StatsBroadcaster(compute, interval=3600)
+        streams = [broadcaster.subscribe() for _ in range(3)]
+        first = [await anext(stream) for stream in streams]
+        self.assertTrue(all(event.startswith('event: snapshot') for event in first))
+        self.assertEqual(broadcaster.computations, 1)
+
+        state['overall_total'] = 2
+        await broadcaster.refresh()
+        state['overall_total'] = 3
+        await broadcaster.refresh()
+        events = [await asyncio.wait_for(anext(stream), 1) for stream in streams]
+        self.assertEqual(broadcaster.computations, 3)
+        for event in events:
+            name, data = event.strip().split('\n')
+            self.assertEqual(name, 'event: stats')
+            # Unchanged keys are not resent and missed updates are coalesced
+            self.assertEqual(json.loads(data[len('data: '):]), {'overall_total': 3})
+
+        for stream in streams:
+            await stream.aclose()
+        self.assertEqual(broadcaster.subscribers, 0)
+
+    async def test_concurrent_first_subscribers_start_one_task(self):
+        async def compute():
+            # Yield mid-refresh, so the other subscribers arrive while it runs
+            await asyncio.sleep(0.01)
+            return {'overall_total': 1}
+
+        broadcaster = StatsBroadcaster(compute, interval=3600)
+        streams = [broadcaster.subscribe() for _ in range(3)]
+        first = await asyncio.gather(*(anext(stream) for stream in streams))
+        self.assertTrue(all(event.startswith('event: snapshot') for event in first))
+        self.assertEqual(broadcaster.computations, 1)
+        runs = [task for task in asyncio.all_tasks() if task.get_coro().__qualname__ == 'StatsBroadcaster._run']
+        self.assertEqual(runs, [broadcaster._task])
+        for stream in streams:
+            await stream.aclose()
+
+    def test_stream_endpoint_refuses_wsgi(self):
+        response = self.client.get(reverse('async-votes-stats-stream'))
+        self.assertEqual(response.status_code, status.HTTP_501_NOT_IMPLEMENTED)
+        self.assertFalse(response.streaming)
+
+    async def test_stream_endpoint_starts_with_a_snapshot(self):
+        await Vote.objects.acreate(vote_type='film', item_id=1, votes=4)
+        response = await self.async_client.get(reverse('async-votes-stats-stream'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        first = await anext(aiter(response.streaming_content))
+        self.assertTrue(first.startswith(b'event: snapshot'))
+        self.assertEqual(json.loads(first.split(b'data: ')[1])['overall_total'], 4)
+
+
+class VoteHistoryTest(APITestCase):
+    def setUp(self):
+        self.character = Character.objects.create(swapi_id=1, name="Luke Skywalker")
+
+    def at(self, *args):
+        return datetime(*args, tzinfo=dt_timezone.utc)
+
+    def test_record_rolls_up_minutes_hours_and_days(self):
+        VoteHistoryService.record({
+            ('character', 1, self.at(2025, 5, 4, 10, 5)): 2,
+            ('character', 1, self.at(2025, 5, 4, 10, 59)): 3,
+            ('character', 1, self.at(2025, 5, 4, 11, 0)): 1,
+        })
+        VoteHistoryService.record({('character', 1, self.at(2025, 5, 4, 10, 5)): 4})
+
+        def votes(resolution):
+            return list(VoteBucket.objects.filter(resolution=resolution).order_by('bucket_start').values_list('votes', flat=True))
+        self.assertEqual(votes('minute'), [6, 3, 1])
+        self.assertEqual(votes('hour'), [9, 1])
+        self.assertEqual(votes('day'), [10])
+
+    def test_choose_resolution_bounds_points(self):
+        now = self.at(2025, 5, 4, 12, 0)
+        choose = VoteHistoryService.choose_resolution
+        self.assertEqual(choose(now - timedelta(hours=1), now, now), 'minute')
+        self.assertEqual(choose(now - timedelta(days=7), now, now), 'hour')
+        self.assertEqual(choose(now - timedelta(days=400), now, now), 'day')
+        # Minutes fit but have already been pruned that far back
+        self.assertEqual(choose(now - timedelta(hours=60), now - timedelta(hours=55), now), 'hour')
+
+    def test_prune_applies_retention(self):
+        now = self.at(2025, 5, 4, 12, 0)
+        VoteHistoryService.record({('character', 1, now - timedelta(days=100)): 1, ('character', 1, now): 1})
+        deleted = VoteHistoryService.prune(now)
+        self.assertEqual(deleted, {'minute': 1, 'hour': 1})
+        self.assertEqual(VoteBucket.objects.filter(resolution='day').count(), 2)
+
+    @override_settings(VOTE_HISTORY=True, VOTE_HISTORY_FLUSH_INTERVAL=None)
+    def test_history_endpoint(self):
+        patcher = patch('voting.history._recorder', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for _ in range(3):
+            self.client.post(reverse('votes-list'), {'vote_type': 'character', 'item_id': self.character.id})
+        get_history_recorder().flush()
+
+        url = reverse('votes-history')
+        response = self.client.get(url, {'vote_type': 'character', 'item_id': self.character.id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['resolution'], 'hour')
+        self.assertEqual(sum(point['votes'] for point in response.data['points']), 3)
+
+        start = (datetime.now(dt_timezone.utc) - timedelta(minutes=30)).isoformat()
+        response = self.client.get(url, {'vote_type': 'character', 'start': start})
+        self.assertEqual(response.data['resolution'], 'minute')
+        self.assertEqual(sum(point['votes'] for point in response.data['points']), 3)
+
+        self.assertEqual(self.client.get(url, {'item_id': self.character.id}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_history_rejects_resolution_with_too_many_points(self):
+        url = reverse('votes-history')
+        end = datetime.now(dt_timezone.utc)
+        year = {'start': (end - timedelta(days=365)).isoformat(), 'end': end.isoformat()}
+        response = self.client.get(url, {**year, 'resolution': 'minute'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('resolution', response.data)
+        self.assertEqual(self.client.get(url, {**year, 'resolution': 'day'}).status_code, status.HTTP_200_OK)
+
+
+class HyperLogLogTest(TestCase):
+    def test_estimate_is_within_the_documented_error(self):
+        sketch = HyperLogLog()
+        sketch.update(f"voter-{index}" for index in range(20000))
+        self.assertLess(abs(sketch.count() - 20000) / 20000, 3 * sketch.standard_error)
+        self.assertEqual(len(sketch.to_bytes()), 4097)
+
+    def test_small_counts_are_exact_and_stored_sparse(self):
+        sketch = HyperLogLog()
+        self.assertTrue(sketch.add('a'))
+        self.assertFalse(sketch.add('a'))
+        sketch.update(['b', 'c'])
+        self.assertEqual(sketch.count(), 3)
+        data = sketch.to_bytes()
+        self.assertEqual(len(data), 1 + 3 * 3)
+        self.assertEqual(HyperLogLog.from_bytes(data).registers, sketch.registers)
+
+    def test_merge_counts_the_union(self):
+        first, second = HyperLogLog(), HyperLogLog()
+        first.update(str(index) for index in range(0, 3000))
+        second.update(str(index) for index in range(2000, 5000))
+        union = HyperLogLog()
+        union.update(str(index) for index in range(0, 5000))
+        self.assertEqual(first.merge(second).count(), union.count())
+        with self.assertRaises(ValueError):
+            first.merge(HyperLogLog(precision=10))
+
+
+@override_settings(VOTE_UNIQUE_VOTERS=True)
+class UniqueVotersTest(APITestCase):
+    def setUp(self):
+        self.luke = Character.objects.create(swapi_id=1, name="Luke Skywalker")
+        self.leia = Character.objects.create(swapi_id=5, name="Leia Organa")
+
+    def vote(self, character, voter_id=None):
+        data = {'vote_type': 'character', 'item_id': character.id}
+        if voter_id:
+            data['voter_id'] = voter_id
+        response = self.client.post(reverse('votes-list'), data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn('voter_id', response.data)
+        return response
+
+    def test_stats_report_unique_voters(self):
+        for voter in ['ann', 'bob', 'ann']:
+            self.vote(self.luke, voter)
+        self.vote(self.luke)
+        self.vote(self.leia, 'ann')
+        response = self.client.post(reverse('votes-bulk'), [
+            {'vote_type': 'character', 'item_id': self.leia.id, 'voter_id': 'cy'},
+            {'vote_type': 'character', 'item_id': self.leia.id, 'voter_id': 'cy', 'count': 2},
+        ], format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        stats = self.client.get(reverse('votes-stats')).data['characters']
+        self.assertEqual(stats['unique_voters'], 3)
+        by_id = {item['id']: item for item in stats['top_items']}
+        self.assertEqual(by_id[self.luke.id]['votes'], 4)
+        self.assertEqual(by_id[self.luke.id]['unique_voters'], 2)
+        self.assertEqual(by_id[self.leia.id]['unique_voters'], 2)
+
+    def test_unchanged_sketch_is_not_rewritten(self):
+        self.vote(self.luke, 'ann')
+        with self.assertNumQueries(1):
+            self.assertEqual(VoterSketchService.record({('character', self.luke.id): ['ann']}), 0)
+
+    def test_deleting_the_vote_drops_its_voters(self):
+        vote_id = self.vote(self.luke, 'ann').data['id']
+        self.client.delete(reverse('votes-detail', args=[vote_id]))
+        self.assertFalse(VoterSketch.objects.exists())
+
+    def test_stats_read_category_and_listed_item_sketches_only(self):
+        self.vote(self.luke, 'ann')
+        self.vote(self.luke, 'bob')
+        vote_id = self.vote(self.leia, 'cy').data['id']
+        slots = {category_slot(voter) for voter in ['ann', 'bob', 'cy']}
+        self.assertEqual(VoterSketch.objects.filter(item_id=CATEGORY_ITEM_ID).count(), len(slots))
+        with patch('voting.voters.VoterSketchService.item_sketches', wraps=VoterSketchService.item_sketches) as loaded:
+            stats = self.client.get(reverse('votes-stats'), {'top_n': 1}).data['characters']
+        self.assertEqual(stats['unique_voters'], 3)
+        self.assertEqual([item['unique_voters'] for item in stats['top_items']], [2])
+        self.assertEqual(loaded.call_args.args[0], [('character', self.luke.id)])
+
+        # Deleting an item's vote takes its voters out of the category
+        self.client.delete(reverse('votes-detail', args=[vote_id]))
+        self.assertEqual(self.client.get(reverse('votes-stats')).data['characters']['unique_voters'], 2)
+
+    @override_settings(VOTE_UNIQUE_VOTERS_CATEGORY_SLOTS=4)
+    def test_category_voters_are_spread_over_slots(self):
+        voters = ['voter-%d' % i for i in range(40)]
+        VoterSketchService.record({('character', self.luke.id): voters[:30], ('character', self.leia.id): voters[20:]})
+        categories = VoterSketch.objects.filter(item_id=CATEGORY_ITEM_ID)
+        self.assertEqual(sorted(categories.values_list('slot', flat=True)), [0, 1, 2, 3])
+        self.assertFalse(VoterSketch.objects.exclude(item_id=CATEGORY_ITEM_ID).exclude(slot=0).exists())
+        self.assertEqual(VoterSketchService.category_sketches(['character'])['character'].count(), 40)
+
+        # Forgetting an item folds the category back into one row
+        VoterSketchService.forget('character', self.leia.id)
+        self.assertEqual(list(categories.values_list('slot', flat=True)), [0])
+        self.assertEqual(VoterSketchService.category_sketches(['character'])['character'].count(), 30)
+
+    @override_settings(VOTE_HISTORY=True)
+    def test_voters_are_counted_per_window(self):
+        at = datetime(2025, 5, 4, 10, 5, tzinfo=dt_timezone.utc)
+        VoterSketchService.record({('character', self.luke.id): ['ann', 'bob']}, at)
+        VoterSketchService.record({('character', self.leia.id): ['ann']}, at + timedelta(minutes=1))
+        VoterSketchService.record({('character', self.luke.id): ['cy']}, at + timedelta(hours=2))
+
+        def window(resolution, start, end, **item):
+            return VoterSketchService.window(start, end, resolution, **item).count()
+        self.assertEqual(window('minute', at, at + timedelta(minutes=2), vote_type='character'), 2)
+        self.assertEqual(window('minute', at, at + timedelta(minutes=2), vote_type='character', item_id=self.leia.id), 1)
+        self.assertEqual(window('hour', at, at + timedelta(hours=3), vote_type='character'), 3)
+        self.assertEqual(window('day', at, at + timedelta(days=1)), 3)
+
+        response = self.client.get(reverse('votes-history'), {
+            'vote_type': 'character', 'item_id': self.luke.id, 'resolution': 'hour',
+            'start': at.isoformat(), 'end': (at + timedelta(hours=1)).isoformat(),
+        })
+        self.assertEqual(response.data['unique_voters'], 2)
+
+        # Deleting an item's vote takes its voters out of the category buckets too
+        vote = Vote.objects.create(vote_type='character', item_id=self.leia.id, votes=1)
+        self.client.delete(reverse('votes-detail', args=[vote.id]))
+        self.assertFalse(VoterBucket.objects.filter(item_id=self.leia.id).exists())
+        self.assertEqual(window('minute', at, at + timedelta(minutes=2), vote_type='character'), 2)
+        self.assertEqual(window('minute', at + timedelta(minutes=1), at + timedelta(minutes=2), vote_type='character'), 0)
+
+    @override_settings(VOTE_WRITE_BEHIND=True)
+    def test_buffered_voters_are_recorded_on_flush(self):
+        buffer = VoteBuffer(flush_interval=None)
+        with patch('voting.views.get_vote_buffer', return_value=buffer):
+            for voter in ['ann', 'bob', 'ann']:
+                response = self.client.post(reverse('votes-list'), {
+                    'vote_type': 'character', 'item_id': self.luke.id, 'voter_id': voter
+                })
+                self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+            response = self.client.post(reverse('votes-bulk'), [
+                {'vote_type': 'character', 'item_id': self.leia.id, 'voter_id': 'cy'},
+            ], format='json')
+            self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertFalse(VoterSketch.objects.exists())
+
+        with patch('voting.voters.VoterSketchService.record', side_effect=DatabaseError('db down')):
+            with self.assertRaises(DatabaseError):
+                buffer.flush()
+        # The votes were written; their voters wait for the next flush
+        self.assertEqual(Vote.objects.get(item_id=self.luke.id).votes, 3)
+        buffer.flush()
+        self.assertEqual(Vote.objects.get(item_id=self.luke.id).votes, 3)
+        sketches = VoterSketchService.item_sketches([('character', self.luke.id), ('character', self.leia.id)])
+        self.assertEqual(sketches[('character', self.luke.id)].count(), 2)
+        self.assertEqual(VoterSketchService.category_sketches(['character'])['character'].count(), 3)
+
+    @override_settings(VOTE_UNIQUE_VOTERS=False)
+    def test_disabled_ignores_voter_ids(self):
+        self.vote(self.luke, 'ann')
+        self.assertFalse(VoterSketch.objects.exists())
+        self.assertNotIn('unique_voters', self.client.get(reverse('votes-stats')).data['characters'])
+
+
+@override_settings(CATALOG_ID_INDEX=True, CATALOG_ID_INDEX_CHECK_INTERVAL=3600)
+class CatalogIdIndexTest(APITestCase):
+    def setUp(self):
+        patcher = patch('core.catalog._id_index', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.character = Character.objects.create(swapi_id=1, name="Luke Skywalker")
+        self.starship = Starship.objects.create(swapi_id=1, name="Millennium Falcon")
+
+    def test_validation_needs_no_queries_once_loaded(self):
+        VoteService.existing_items({'character': [self.character.id]})
+        with self.assertNumQueries(0):
+            existing = VoteService.existing_items({
+                'character': [self.character.id, self.character.id],
+                'starship': [self.starship.id],
+            })
+        self.assertEqual(existing, {('character', self.character.id), ('starship', self.starship.id)})
+
+    def test_unknown_ids_fall_back_to_the_database(self):
+        VoteService.existing_items({'character': [self.character.id]})
+        leia = Character.objects.create(swapi_id=2, name="Leia Organa")
+        with self.assertNumQueries(1):
+            existing = VoteService.existing_items({'character': [self.character.id, leia.id, 999]})
+        self.assertEqual(existing, {('character', self.character.id), ('character', leia.id)})
+
+    def test_sync_status_change_reloads_the_index(self):
+        VoteService.existing_items({'character': [self.character.id]})
+        leia = Character.objects.create(swapi_id=2, name="Leia Organa")
+        SWAPIService.update_sync_status('characters', is_syncing=False, total_records=2)
+        VoteService.existing_items({'character': [leia.id]})
+        with self.assertNumQueries(0):
+            self.assertTrue(VoteService.existing_items({'character': [leia.id]}))
+
+    def test_votes_for_indexed_items_skip_the_item_check(self):
+        VoteService.existing_items({'character': [self.character.id]})
+        table = Character._meta.db_table
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('votes-list'), {'vote_type': 'character', 'item_id': self.character.id})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse([query for query in queries if table in query['sql']])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('votes-bulk'), [
+                {'vote_type': 'character', 'item_id': self.character.id, 'count': 2},
+            ], format='json')
+        self.assertEqual(response.data['accepted_votes'], 2)
+        self.assertFalse([query for query in queries if table in query['sql']])
+        self.assertEqual(Vote.objects.get(item_id=self.character.id).votes, 3)
+
+    def test_deleting_an_item_bumps_the_generation(self):
+        SWAPIService.update_sync_status('characters', is_syncing=False, total_records=1)
+        generation = catalog_generation()
+        VoteService.existing_items({'character': [self.character.id]})
+        character_id = self.character.id
+        with self.captureOnCommitCallbacks(execute=True):
+            self.character.delete()
+        self.assertNotEqual(catalog_generation(), generation)
+        self.assertFalse(VoteService.indexed([('character', character_id)]))
+        response = self.client.post(reverse('votes-list'), {'vote_type': 'character', 'item_id': character_id})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(VOTE_WRITE_BEHIND=True)
+    def test_buffered_vote_is_validated_without_queries(self):
+        VoteService.existing_items({'character': [self.character.id]})
+        with patch('voting.views.get_vote_buffer', return_value=VoteBuffer(flush_interval=None)):
+            with self.assertNumQueries(0):
+                response = self.client.post(reverse('votes-list'), {'vote_type': 'character', 'item_id': self.character.id})
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+
+class LoadTestHarnessTest(TransactionTestCase):
+    def test_report_counts_every_request(self):
+        for swapi_id in range(1, 6):
+            Character.objects.create(swapi_id=swapi_id, name=f"Character {swapi_id}")
+        items = load_items('character', 5)
+
+        report = run_load_test(items, threads=1, requests=60, skew=2.0, read_ratio=0.2, seed=3)
+
+        self.assertEqual(report['requests'], 60)
+        self.assertEqual(report['writes']['count'] + report['reads']['count'], 60)
+        self.assertGreater(report['reads']['count'], 0)
+        self.assertEqual(report['status_codes'], {200: report['reads']['count'], 201: report['writes']['count']})
+        self.assertEqual((report['errors'], report['deadlocks'], report['lock_timeouts']), (0, 0, 0))
+        self.assertLessEqual(report['writes']['p50_ms'], report['writes']['p99_ms'])
+        votes = dict(Vote.objects.values_list('item_id', 'votes'))
+        self.assertEqual(sum(votes.values()), report['writes']['count'])
+        # Zipf skew: the first item is the hottest
+        self.assertEqual(max(votes, key=votes.get), items[0][1])
+
+    def test_classify_error(self):
+        self.assertEqual(classify_error(Exception('deadlock detected')), 'deadlocks')
+        self.assertEqual(classify_error(Exception('database is locked')), 'lock_timeouts')
+        self.assertEqual(classify_error(Exception('canceling statement due to lock timeout')), 'lock_timeouts')
+        self.assertEqual(classify_error(Exception('boom')), 'errors')
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTest(APITestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.character = Character.objects.create(swapi_id=1, name="Luke Skywalker", gender="male")
+
+    def test_router_sends_reads_to_replica_and_writes_to_primary(self):
+        router = PrimaryReplicaRouter()
+        self.assertEqual(router.db_for_read(Vote), 'replica')
+        self.assertEqual(router.db_for_write(Vote), 'default')
+        with use_primary():
+            self.assertEqual(router.db_for_read(Vote), 'default')
+
+    def test_reads_after_vote_use_primary(self):
+        url = reverse('votes-list')
+        response = self.client.post(url, {'vote_type': 'character', 'item_id': self.character.id})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIn('primary_pin', response.cookies)
+
+        # The client reads its own write from the primary while pinned...
+        response = self.client.get(url)
+        self.assertEqual(response.data['count'], 1)
+
+        # ...and from the (empty) replica once the pin is gone
+        self.client.cookies.pop('primary_pin')
+        response = self.client.get(url)
+        self.assertEqual(response.data['count'], 0)
+        self.assertEqual(Vote.objects.using('replica').count(), 0)
+
+
+@override_settings(VOTE_SHARD_DATABASES=['votes_0', 'votes_1'])
+class VoteShardingTest(TransactionTestCase):
+    databases = {'default', 'votes_0', 'votes_1'}
+
+    def setUp(self):
+        self.characters = [
+            Character.objects.create(swapi_id=index, name=f"Character {index}") for index in range(1, 9)
+        ]
+        self.shards = {character.id: shard_for('character', character.id) for character in self.characters}
+        # The hash must actually spread these items for the tests to mean anything
+        self.assertEqual(set(self.shards.values()), {'votes_0', 'votes_1'})
+
+    def vote(self, character, count=1):
+        for _ in range(count):
+            response = self.client.post(
+                reverse('votes-list'), {'vote_type': 'character', 'item_id': character.id}
+            )
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response
+
+    def test_votes_are_written_to_their_shard(self):
+        for character in self.characters:
+            self.vote(character)
+        for character in self.characters:
+            shard = self.shards[character.id]
+            self.assertTrue(Vote.objects.using(shard).filter(item_id=character.id).exists())
+        self.assertFalse(Vote.objects.using('default').exists())
+        router = VoteShardRouter()
+        self.assertEqual(router.db_for_write(Vote, instance=Vote(vote_type='character', item_id=1)),
+                         shard_for('character', 1))
+        self.assertIsNone(router.db_for_read(Character))
+        self.assertFalse(router.allow_migrate('votes_0', 'core', 'character'))
+        self.assertTrue(router.allow_migrate('votes_0', 'voting', 'vote'))
+
+    def test_unknown_item_is_rejected(self):
+        response = self.client.post(reverse('votes-list'), {'vote_type': 'character', 'item_id': 999})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Vote.objects.using('votes_0').count() + Vote.objects.using('votes_1').count(), 0)
+
+    def test_list_merges_shards_in_order(self):
+        for index, character in enumerate(self.characters):
+            self.vote(character, index + 1)
+        response = self.client.get(reverse('votes-list'), {'page_size': 3, 'page': 2})
+        self.assertEqual(response.data['count'], 8)
+        self.assertEqual([row['votes'] for row in response.data['results']], [5, 4, 3])
+        self.assertIsNotNone(response.data['next'])
+
+        response = self.client.get(reverse('votes-list'), {'ordering': 'votes', 'page_size': 3})
+        self.assertEqual([row['votes'] for row in response.data['results']], [1, 2, 3])
+
+    def test_list_pages_through_ties_without_repeats(self):
+        for character in self.characters:
+            self.vote(character)
+        ids = []
+        for page in range(1, 5):
+            response = self.client.get(reverse('votes-list'), {'page_size': 2, 'page': page})
+            ids += [row['id'] for row in response.data['results']]
+        self.assertEqual(len(set(ids)), len(self.characters))
+
+        response = self.client.get(reverse('votes-list'), {'page': SHARDED_MAX_PAGE + 1})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_public_ids_locate_the_shard(self):
+        ids = {self.vote(character).data['id'] for character in self.characters}
+        self.assertEqual(len(ids), len(self.characters))
+        character = self.characters[0]
+        vote_id = self.vote(character).data['id']
+        response = self.client.get(reverse('votes-detail', args=[vote_id]))
+        self.assertEqual(response.data['item_id'], character.id)
+        self.assertEqual(response.data['votes'], 2)
+
+        response = self.client.delete(reverse('votes-detail', args=[vote_id]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Vote.objects.using(self.shards[character.id]).filter(item_id=character.id).exists())
+        self.assertEqual(self.client.get(reverse('votes-detail', args=[vote_id])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('votes-detail', args=[vote_id + 5])).status_code, 404)
+
+    def test_stats_rank_and_bulk_span_shards(self):
+        response = self.client.post(reverse('votes-bulk'), [
+            {'vote_type': 'character', 'item_id': character.id, 'count': index + 1}
+            for index, character in enumerate(self.characters)
+        ], content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        stats = self.client.get(reverse('votes-stats'), {'top_n': 3}).data
+        self.assertEqual(stats['characters']['total_votes'], 36)
+        self.assertEqual([item['id'] for item in stats['characters']['top_items']],
+                         [character.id for character in reversed(self.characters[-3:])])
+
+        response = self.client.get(reverse('votes-rank'), {'vote_type': 'character', 'item_id': self.characters[5].id})
+        self.assertEqual(response.data['rank'], 3)
+        self.assertEqual(response.data['total_items'], 8)
+
+    def test_rebalance_moves_rows_to_their_shard(self):
+        with override_settings(VOTE_SHARD_DATABASES=[]):
+            for character in self.characters[:4]:
+                self.vote(character, 2)
+        self.vote(self.characters[0])
+        out = StringIO()
+        call_command('rebalance_vote_shards', '--include-default', '--dry-run', stdout=out)
+        self.assertIn('Would move 4 votes', out.getvalue())
+        self.assertEqual(Vote.objects.using('default').count(), 4)
+
+        call_command('rebalance_vote_shards', '--include-default', stdout=StringIO())
+        self.assertFalse(Vote.objects.using('default').exists())
+        for character in self.characters[:4]:
+            vote = Vote.objects.using(self.shards[character.id]).get(item_id=character.id)
+            self.assertEqual(vote.votes, 3 if character == self.characters[0] else 2)
+
+        # Adding a shard rehashes every item; each row ends up where it now hashes to
+        shards = ['votes_0', 'votes_1', 'default']
+        with override_settings(VOTE_SHARD_DATABASES=shards):
+            VoteService.rebalance_shards()
+            for character in self.characters[:4]:
+                placed = [alias for alias in shards if Vote.objects.using(alias).filter(item_id=character.id).exists()]
+                self.assertEqual(placed, [shard_for('character', character.id)])
+
+    def test_interrupted_rebalance_can_be_repeated(self):
+        with override_settings(VOTE_SHARD_DATABASES=[]):
+            for character in self.characters[:4]:
+                self.vote(character, 2)
+        delete = QuerySet.delete
+
+        def fail_on_votes(queryset):
+            if queryset.model is Vote:
+                raise DatabaseError('connection lost')
+            return delete(queryset)
+
+        with patch.object(QuerySet, 'delete', fail_on_votes):
+            with self.assertRaises(DatabaseError):
+                call_command('rebalance_vote_shards', '--include-default', stdout=StringIO())
+        # Copied but not deleted: on both databases
+        self.assertEqual(Vote.objects.using('default').count(), 4)
+
+        call_command('rebalance_vote_shards', '--include-default', stdout=StringIO())
+        self.assertFalse(Vote.objects.using('default').exists())
+        for character in self.characters[:4]:
+            vote = Vote.objects.using(self.shards[character.id]).get(item_id=character.id)
+            self.assertEqual(vote.votes, 2)
+        self.assertFalse(VoteMove.objects.using('votes_0').exists())
+        self.assertFalse(VoteMove.objects.using('votes_1').exists())
+
+    @override_settings(VOTE_UNIQUE_VOTERS=True)
+    def test_voter_sketches_live_next_to_their_vote(self):
+        for character in self.characters:
+            self.client.post(reverse('votes-list'), {
+                'vote_type': 'character', 'item_id': character.id, 'voter_id': 'ann'
+            })
+        for character in self.characters:
+            self.assertTrue(
+                VoterSketch.objects.using(self.shards[character.id]).filter(item_id=character.id).exists()
+            )
+        stats = self.client.get(reverse('votes-stats')).data['characters']
+        self.assertEqual(stats['unique_voters'], 1)
+
+    def test_check_rejects_counter_shards(self):
+        with override_settings(VOTE_COUNTER_SHARDS=4):
+            self.assertEqual([error.id for error in check_vote_sharding(None)], ['voting.E001'])
@@ -1,13 +1,31 @@
 from rest_framework import mixins, viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from django.conf import settings
+from django.db import transaction
+from django.http import Http404
+from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import OrderingFilter
-from django.db.models import F, Sum
-from drf_spectacular.utils import extend_schema
-from .models import Vote
-from .serializers import VoteSerializer, VoteStatsSerializer
-from core.models import Character, Film, Starship
+from drf_spectacular.utils import OpenApiParameter, extend_schema
+from starwars_api.instrumentation import TimedSerializerMixin
+from starwars_api.tracing import TracedSerializerMixin, TracedViewMixin
+from starwars_api.metrics import VOTES_CAST
+from .models import Vote, VoteShard
+from .serializers import (
+    BulkVoteItemSerializer, BulkVoteResultSerializer, VoteHistoryQuerySerializer, VoteHistorySerializer,
+    VoteRankQuerySerializer, VoteRankSerializer, VoteSerializer, VoteStatsSerializer,
+)
+from .buffer import get_vote_buffer, pending_votes
+from .history import MAX_HISTORY_POINTS, VoteHistoryService, record_votes
+from .leaderboard import get_leaderboard
+from .services import VoteService, VoteItemNotFound
+from .sharding import GatheredRows, is_sharded, locate_vote
+from .shards import start_shard_compactor
+from .stats import MAX_TOP_ITEMS, build_vote_stats, parse_top_n, vote_rank
+from .voters import VoterSketchService, add_unique_voters, record_voters
 import logging
 
 logger = logging.getLogger(__name__)
@@ -19,8 +37,29 @@ class StandardResultsSetPagination(PageNumberPagination):
     page_size_query_param = 'page_size'
     max_page_size = 100
 
+BULK_MAX_ENTRIES = 1000
+# Every shard returns page * page_size rows for a sharded listing
+SHARDED_MAX_PAGE = 100
+
+
+class VoteOrderingFilter(OrderingFilter):
+    """Order by the shard-inclusive total when counters are sharded"""
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if ordering and 'total_votes' in queryset.query.annotations:
+            ordering = [
+                field.replace('votes', 'total_votes') if field.lstrip('-') == 'votes' else field
+                for field in ordering
+            ]
+        return ordering
+
+
 @extend_schema(tags=['Voting'])
-class VoteViewSet(mixins.CreateModelMixin,
+class VoteViewSet(TimedSerializerMixin,
+                  TracedSerializerMixin,
+                  TracedViewMixin,
+                  mixins.CreateModelMixin,
                   mixins.ListModelMixin,
                   mixins.RetrieveModelMixin,
                   mixins.DestroyModelMixin,
@@ -28,123 +67,265 @@ class VoteViewSet(mixins.CreateModelMixin,
     queryset = Vote.objects.all()
     serializer_class = VoteSerializer
     pagination_class = StandardResultsSetPagination
-    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, VoteOrderingFilter]
     filterset_fields = ['vote_type']
     ordering_fields = ['votes', 'created_at']
     ordering = ['-votes']
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if settings.VOTE_COUNTER_SHARDS:
+            queryset = queryset.with_shard_totals()
+        return queryset
+
+    def get_object(self):
+        if not is_sharded():
+            return super().get_object()
+        # The public id carries the shard, so a lookup hits a single database
+        try:
+            alias, pk = locate_vote(int(self.kwargs[self.lookup_url_kwarg or self.lookup_field]))
+        except ValueError:
+            raise Http404
+        if alias is None:
+            raise Http404
+        obj = get_object_or_404(self.get_queryset().using(alias), pk=pk)
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+    def list_sharded(self, request):
+        """Scatter the filtered, ordered query to every shard in parallel and merge one page"""
+        queryset = self.filter_queryset(self.get_queryset())
+        try:
+            page_number = max(1, int(request.query_params.get(self.paginator.page_query_param, 1)))
+        except ValueError:
+            # Let the paginator reject it
+            page_number = 1
+        if page_number > SHARDED_MAX_PAGE:
+            raise NotFound(f'Pages beyond {SHARDED_MAX_PAGE} are not available; narrow the query or use a larger page_size.')
+        gathered = GatheredRows(queryset, page_number * self.paginator.get_page_size(request))
+        page = self.paginate_queryset(gathered)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    def merge_pending(self, rows):
+        """Add votes still waiting in the write-behind buffer to serialized rows"""
+        pending = pending_votes()
+        if pending:
+            for row in rows:
+                row['votes'] += pending.get((row['vote_type'], row['item_id']), 0)
+        return rows
+
     @extend_schema(
         summary="List all votes",
         description="Retrieve a paginated list of all votes with filtering and ordering capabilities."
     )
     def list(self, request, *args, **kwargs):
-        return super().list(request, *args, **kwargs)
+        if is_sharded():
+            response = self.list_sharded(request)
+        else:
+            response = super().list(request, *args, **kwargs)
+        self.merge_pending(response.data['results'])
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        response = super().retrieve(request, *args, **kwargs)
+        self.merge_pending([response.data])
+        return response
 
     @extend_schema(
         summary="Cast a vote",
-        description="Cast a vote for a character, film, or starship. If a vote already exists for the item, the vote count will be incremented."
+        description="Cast a vote for a character, film, or starship. If a vote already exists for the item, the vote count will be incremented. "
+                    "In write-behind mode the vote is buffered and the response is 202 with the item's pending vote count."
     )
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        vote_type = serializer.validated_data['vote_type']
-        item_id = serializer.validated_data['item_id']
-        vote, created = Vote.objects.get_or_create(
-            vote_type=vote_type, item_id=item_id, defaults={'votes': 1}
-        )
-        if not created:
-            vote.votes = F('votes') + 1
-            vote.save(update_fields=['votes'])
-            vote.refresh_from_db()
+        try:
+            if settings.VOTE_WRITE_BEHIND:
+                return self.create_buffered(serializer.validated_data)
+            if settings.VOTE_COUNTER_SHARDS:
+                start_shard_compactor()
+            vote = VoteService.cast_vote(
+                serializer.validated_data['vote_type'], serializer.validated_data['item_id']
+            )
+        except VoteItemNotFound as e:
+            raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [str(e)]})
+        leaderboard = get_leaderboard()
+        if leaderboard:
+            leaderboard.set_votes(vote.vote_type, vote.item_id, vote.votes)
+        record_votes(vote.vote_type, vote.item_id)
+        VOTES_CAST.inc(vote_type=vote.vote_type, mode='direct')
+        record_voters({(vote.vote_type, vote.item_id): [serializer.validated_data.get('voter_id')]})
         serializer = self.get_serializer(vote)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            VoteShard.objects.filter(vote_type=instance.vote_type, item_id=instance.item_id).delete()
+            instance.delete()
+        VoterSketchService.forget(instance.vote_type, instance.item_id)
+        leaderboard = get_leaderboard()
+        if leaderboard:
+            leaderboard.remove(instance.vote_type, instance.item_id)
+
+    def create_buffered(self, data):
+        vote_type, item_id = data['vote_type'], data['item_id']
+        VoteService.ensure_item_exists(vote_type, item_id)
+        # Loaded before the write so a first load can't count this vote twice
+        leaderboard = get_leaderboard()
+        # Voters are counted when the buffer flushes, not per request
+        pending = get_vote_buffer().add(vote_type, item_id, voter_ids=[data.get('voter_id')])
+        if leaderboard:
+            leaderboard.add_votes(vote_type, item_id, 1)
+        record_votes(vote_type, item_id)
+        VOTES_CAST.inc(vote_type=vote_type, mode='buffered')
+        return Response({
+            'vote_type': vote_type,
+            'item_id': item_id,
+            'pending_votes': pending,
+        }, status=status.HTTP_202_ACCEPTED)
+
+    @extend_schema(
+        summary="Cast votes in bulk",
+        description="Submit up to 1000 queued votes as an array of {vote_type, item_id, count}. "
+                    "Items are validated with one query per vote type, duplicates are summed and all accepted "
+                    "increments are written in one transaction; invalid entries are reported by index under `rejected`.",
+        request=BulkVoteItemSerializer(many=True),
+        responses=BulkVoteResultSerializer
+    )
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        entries = request.data
+        if not isinstance(entries, list):
+            raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: ['Expected a list of votes.']})
+        if len(entries) > BULK_MAX_ENTRIES:
+            raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [f'At most {BULK_MAX_ENTRIES} votes per request.']})
+
+        rejected = []
+        valid = []
+        for index, entry in enumerate(entries):
+            serializer = BulkVoteItemSerializer(data=entry)
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data))
+            else:
+                rejected.append({'index': index, 'errors': serializer.errors})
+
+        ids_by_type = {}
+        for _, data in valid:
+            ids_by_type.setdefault(data['vote_type'], []).append(data['item_id'])
+        existing = VoteService.existing_items(ids_by_type)
+
+        increments = {}
+        voters = {}
+        for index, data in valid:
+            key = (data['vote_type'], data['item_id'])
+            if key not in existing:
+                message = str(VoteService.item_not_found(data['vote_type']))
+                rejected.append({'index': index, 'errors': {'item_id': [message]}})
+                continue
+            increments[key] = increments.get(key, 0) + data['count']
+            voters.setdefault(key, []).append(data.get('voter_id'))
+
+        leaderboard = get_leaderboard()
+        if settings.VOTE_WRITE_BEHIND:
+            vote_buffer = get_vote_buffer()
+            for (vote_type, item_id), count in increments.items():
+                vote_buffer.add(vote_type, item_id, count, voter_ids=voters[(vote_type, item_id)])
+            response_status = status.HTTP_202_ACCEPTED
+        else:
+            if increments:
+                VoteService.apply_increments(increments)
+            record_voters(voters)
+            response_status = status.HTTP_200_OK
+        for (vote_type, item_id), count in increments.items():
+            if leaderboard:
+                leaderboard.add_votes(vote_type, item_id, count)
+            record_votes(vote_type, item_id, count)
+            VOTES_CAST.inc(count, vote_type=vote_type, mode='bulk')
+
+        rejected.sort(key=lambda entry: entry['index'])
+        return Response({
+            'accepted': [
+                {'vote_type': vote_type, 'item_id': item_id, 'count': count}
+                for (vote_type, item_id), count in increments.items()
+            ],
+            'rejected': rejected,
+            'accepted_votes': sum(increments.values()),
+        }, status=response_status)
+
     @extend_schema(
         summary="Get enhanced voting statistics",
         description="Get comprehensive voting statistics with percentages and item names for each category, perfect for graph visualization.",
+        parameters=[
+            OpenApiParameter('top_n', int, description=f"Top items per category (1-{MAX_TOP_ITEMS}, default 10)")
+        ],
         responses=VoteStatsSerializer
     )
     @action(detail=False, methods=['get'])
     def stats(self, request):
         try:
-            # Get vote totals per category
-            character_votes = Vote.objects.filter(vote_type='character')
-            film_votes = Vote.objects.filter(vote_type='film')
-            starship_votes = Vote.objects.filter(vote_type='starship')
-            
-            character_total = character_votes.aggregate(total=Sum('votes'))['total'] or 0
-            film_total = film_votes.aggregate(total=Sum('votes'))['total'] or 0
-            starship_total = starship_votes.aggregate(total=Sum('votes'))['total'] or 0
-            overall_total = character_total + film_total + starship_total
-            
-            # Get top characters with details
-            top_character_votes = character_votes.order_by('-votes')[:10]
-            character_stats = []
-            for vote in top_character_votes:
-                try:
-                    character = Character.objects.get(id=vote.item_id)
-                    percentage = (vote.votes / character_total * 100) if character_total > 0 else 0
-                    character_stats.append({
-                        'id': vote.item_id,
-                        'name': character.name,
-                        'votes': vote.votes,
-                        'percentage': round(percentage, 2)
-                    })
-                except Character.DoesNotExist:
-                    continue
-            
-            # Get top films with details
-            top_film_votes = film_votes.order_by('-votes')[:10]
-            film_stats = []
-            for vote in top_film_votes:
-                try:
-                    film = Film.objects.get(id=vote.item_id)
-                    percentage = (vote.votes / film_total * 100) if film_total > 0 else 0
-                    film_stats.append({
-                        'id': vote.item_id,
-                        'name': film.title,
-                        'votes': vote.votes,
-                        'percentage': round(percentage, 2)
-                    })
-                except Film.DoesNotExist:
-                    continue
-            
-            # Get top starships with details
-            top_starship_votes = starship_votes.order_by('-votes')[:10]
-            starship_stats = []
-            for vote in top_starship_votes:
-                try:
-                    starship = Starship.objects.get(id=vote.item_id)
-                    percentage = (vote.votes / starship_total * 100) if starship_total > 0 else 0
-                    starship_stats.append({
-                        'id': vote.item_id,
-                        'name': starship.name,
-                        'votes': vote.votes,
-                        'percentage': round(percentage, 2)
-                    })
-                except Starship.DoesNotExist:
-                    continue
-            
-            stats_data = {
-                'characters': {
-                    'total_votes': character_total,
-                    'top_items': character_stats
-                },
-                'films': {
-                    'total_votes': film_total,
-                    'top_items': film_stats
-                },
-                'starships': {
-                    'total_votes': starship_total,
-                    'top_items': starship_stats
-                },
-                'overall_total': overall_total
-            }
-            
-            return Response(stats_data)
-            
+            top_n = parse_top_n(request.query_params.get('top_n'))
+        except ValueError:
+            return Response({'error': 'Query parameter "top_n" must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            leaderboard = get_leaderboard()
+            stats = leaderboard.stats(top_n) if leaderboard else build_vote_stats(pending_votes(), top_n)
+            if settings.VOTE_UNIQUE_VOTERS:
+                add_unique_voters(stats)
+            return Response(stats)
         except Exception as e:
-            logger.error(f"Error getting vote statistics: {e}")
+            logger.error("Error getting vote statistics: %s", e)
             return Response({
                 'error': 'Failed to retrieve voting statistics'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    @extend_schema(
+        summary="Get an item's voting rank",
+        description="Place of a character, film or starship within its vote type (1 = most votes; ties go to the lower item_id).",
+        parameters=[VoteRankQuerySerializer],
+        responses=VoteRankSerializer
+    )
+    @action(detail=False, methods=['get'])
+    def rank(self, request):
+        query = VoteRankQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        vote_type, item_id = query.validated_data['vote_type'], query.validated_data['item_id']
+        leaderboard = get_leaderboard()
+        result = leaderboard.rank(vote_type, item_id) if leaderboard else vote_rank(vote_type, item_id)
+        if result is None:
+            return Response({'error': 'No votes for this item'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(result)
+
+    @extend_schema(
+        summary="Get vote history",
+        description=f"Votes per bucket between `start` and `end` (default: the last 24 hours) for one item, a vote type or all votes. "
+                    f"With `resolution=auto` the finest retained resolution that fits the range in {MAX_HISTORY_POINTS} buckets is used; "
+                    f"an explicit resolution needing more buckets than that is rejected. "
+                    f"With unique voters on, `unique_voters` estimates the distinct voters in the range.",
+        parameters=[VoteHistoryQuerySerializer],
+        responses=VoteHistorySerializer
+    )
+    @action(detail=False, methods=['get'])
+    def history(self, request):
+        query = VoteHistoryQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        resolution = params['resolution']
+        if resolution == 'auto':
+            resolution = VoteHistoryService.choose_resolution(params['start'], params['end'])
+        points = VoteHistoryService.series(
+            params['start'], params['end'], resolution, params.get('vote_type'), params.get('item_id')
+        )
+        history = {
+            'vote_type': params.get('vote_type'),
+            'item_id': params.get('item_id'),
+            'start': params['start'],
+            'end': params['end'],
+            'resolution': resolution,
+            'points': points,
+        }
+        if settings.VOTE_UNIQUE_VOTERS:
+            history['unique_voters'] = VoterSketchService.window(
+                params['start'], params['end'], resolution, params.get('vote_type'), params.get('item_id')
+            ).count()
+        return Response(VoteHistorySerializer(history).data)
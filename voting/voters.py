@@ -0,0 +1,271 @@
+import zlib
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Q
+from django.utils import timezone
+from .history import RESOLUTIONS, bucket_start
+from .hll import HyperLogLog
+from .models import VoterBucket, VoterSketch
+from .sharding import is_sharded, scatter, shard_for, vote_databases
+from .stats import CATEGORIES
+
+# VoterSketch rows with this item_id hold a category's sketch: the union of the
+# sketches of that vote type's items on the same database. Item ids start at 1.
+# Each voter is counted in one of VOTE_UNIQUE_VOTERS_CATEGORY_SLOTS rows of the
+# category, picked by voter id, so concurrent votes don't all lock one row;
+# reads merge the slots.
+CATEGORY_ITEM_ID = 0
+
+# The fields that key each sketch model's rows, item_id last
+KEY_FIELDS = {
+    VoterSketch: ('slot', 'vote_type', 'item_id'),
+    VoterBucket: ('resolution', 'bucket_start', 'slot', 'vote_type', 'item_id'),
+}
+
+
+def category_slot(voter_id: str) -> int:
+    return zlib.crc32(voter_id.encode()) % max(1, settings.VOTE_UNIQUE_VOTERS_CATEGORY_SLOTS)
+
+
+def _keys_filter(model, keys):
+    by_prefix = defaultdict(list)
+    for *prefix, item_id in keys:
+        by_prefix[tuple(prefix)].append(item_id)
+    query = Q()
+    for prefix, item_ids in by_prefix.items():
+        query |= Q(**dict(zip(KEY_FIELDS[model], prefix)), item_id__in=item_ids)
+    return query
+
+
+class VoterSketchService:
+    @staticmethod
+    def sketch_db(vote_type: str, item_id: int) -> str:
+        if is_sharded():
+            return shard_for(vote_type, item_id)
+        return router.db_for_write(VoterSketch)
+
+    @staticmethod
+    def record(voters: Dict[Tuple[str, int], Iterable[str]], at: Optional[datetime] = None) -> int:
+        """Add voter ids to their items' and categories' sketches; returns the number of sketches written.
+
+        With VOTE_HISTORY on, the ids also go into the minute, hour and day
+        VoterBucket containing ``at`` (default: now). Once an item has a few
+        thousand voters almost every id lands in a register that already
+        holds a longer run, so sketches are first read without locks and only
+        the items whose sketch would change are re-read under lock and saved.
+        """
+        periods = [(VoterSketch, ())]
+        if settings.VOTE_HISTORY:
+            at = at or timezone.now()
+            periods += [(VoterBucket, (resolution, bucket_start(at, resolution))) for resolution, _ in RESOLUTIONS]
+        by_alias = defaultdict(lambda: defaultdict(dict))
+        for (vote_type, item_id), voter_ids in voters.items():
+            voter_ids = list(voter_ids)
+            if voter_ids:
+                by_model = by_alias[VoterSketchService.sketch_db(vote_type, item_id)]
+                for model, period in periods:
+                    by_model[model][period + (0, vote_type, item_id)] = voter_ids
+                    # Kept up to date alongside the item's, so stats never merge every item
+                    for voter_id in voter_ids:
+                        key = period + (category_slot(voter_id), vote_type, CATEGORY_ITEM_ID)
+                        by_model[model].setdefault(key, []).append(voter_id)
+        written = 0
+        for alias, by_model in by_alias.items():
+            for model, items in by_model.items():
+                rows = model.objects.using(alias).filter(_keys_filter(model, items))
+                stored = {tuple(key): sketch for *key, sketch in rows.values_list(*KEY_FIELDS[model], 'sketch')}
+                dirty = {}
+                for key, voter_ids in items.items():
+                    sketch = HyperLogLog.from_bytes(stored[key]) if key in stored else HyperLogLog()
+                    if sketch.update(voter_ids):
+                        dirty[key] = voter_ids
+                if dirty:
+                    written += VoterSketchService._write(model, alias, dirty)
+        return written
+
+    @staticmethod
+    def _write(model, alias, items) -> int:
+        fields = KEY_FIELDS[model]
+        with transaction.atomic(using=alias):
+            # Rows must exist to be locked; racing creators keep the first one
+            model.objects.using(alias).bulk_create(
+                [model(**dict(zip(fields, key)), sketch=HyperLogLog().to_bytes()) for key in items],
+                ignore_conflicts=True,
+            )
+            rows = {
+                tuple(getattr(row, field) for field in fields): row
+                for row in model.objects.using(alias).select_for_update().filter(_keys_filter(model, items))
+            }
+            changed = []
+            for key, voter_ids in items.items():
+                sketch = HyperLogLog.from_bytes(rows[key].sketch)
+                if sketch.update(voter_ids):
+                    rows[key].sketch = sketch.to_bytes()
+                    changed.append(rows[key])
+            model.objects.using(alias).bulk_update(changed, ['sketch', 'updated_at'])
+        return len(changed)
+
+    @staticmethod
+    def _load(queryset) -> Dict[Tuple[str, int], HyperLogLog]:
+        rows = scatter(lambda alias: list(queryset.using(alias).values_list('vote_type', 'item_id', 'sketch')))
+        sketches = {}
+        for part in rows:
+            for vote_type, item_id, data in part:
+                sketch = HyperLogLog.from_bytes(data)
+                if (vote_type, item_id) in sketches:
+                    # The same key sits in several rows: category slots and shards, items mid-rebalance
+                    sketch.merge(sketches[(vote_type, item_id)])
+                sketches[(vote_type, item_id)] = sketch
+        return sketches
+
+    @staticmethod
+    def item_sketches(keys: Iterable[Tuple[str, int]]) -> Dict[Tuple[str, int], HyperLogLog]:
+        """Sketches of the given (vote_type, item_id) items, from all vote shards"""
+        keys = list(keys)
+        if not keys:
+            return {}
+        return VoterSketchService._load(
+            VoterSketch.objects.filter(_keys_filter(VoterSketch, [(0,) + tuple(key) for key in keys]))
+        )
+
+    @staticmethod
+    def category_sketches(vote_types: Iterable[str]) -> Dict[str, HyperLogLog]:
+        """Each vote type's category sketch, merged across its slots and all vote shards"""
+        queryset = VoterSketch.objects.filter(vote_type__in=list(vote_types), item_id=CATEGORY_ITEM_ID)
+        return {vote_type: sketch for (vote_type, _), sketch in VoterSketchService._load(queryset).items()}
+
+    @staticmethod
+    def window(start: datetime, end: datetime, resolution: str,
+               vote_type: Optional[str] = None, item_id: Optional[int] = None) -> HyperLogLog:
+        """Voters in the buckets of [start, end), of one item, a vote type or all votes.
+
+        Bucket-aligned like VoteHistoryService.series. Without an item the
+        category buckets are merged, so the rows read stay bounded by the
+        number of buckets in the range.
+        """
+        buckets = VoterBucket.objects.filter(
+            resolution=resolution,
+            bucket_start__gte=bucket_start(start, resolution),
+            bucket_start__lt=end,
+            item_id=item_id or CATEGORY_ITEM_ID,
+        )
+        if vote_type:
+            buckets = buckets.filter(vote_type=vote_type)
+        sketch = HyperLogLog()
+        for part in scatter(lambda alias: list(buckets.using(alias).values_list('sketch', flat=True))):
+            for data in part:
+                sketch.merge(HyperLogLog.from_bytes(data))
+        return sketch
+
+    @staticmethod
+    def forget(vote_type: str, item_id: int):
+        """Drop an item's sketches and rebuild its category sketches without it.
+
+        HyperLogLog can't remove values, so the category is re-merged from the
+        remaining items on the database; deletes are rare admin actions.
+        """
+        alias = VoterSketchService.sketch_db(vote_type, item_id)
+        sketches = VoterSketch.objects.using(alias).filter(vote_type=vote_type)
+        with transaction.atomic(using=alias):
+            VoterSketchService._forget_buckets(alias, vote_type, item_id)
+            sketches.filter(item_id=item_id).delete()
+            category = HyperLogLog()
+            remaining = False
+            for data in sketches.exclude(item_id=CATEGORY_ITEM_ID).values_list('sketch', flat=True).iterator():
+                category.merge(HyperLogLog.from_bytes(data))
+                remaining = True
+            # The rebuilt category goes in one slot; later votes spread it again
+            sketches.filter(item_id=CATEGORY_ITEM_ID).exclude(slot=0).delete()
+            if remaining:
+                sketches.update_or_create(
+                    item_id=CATEGORY_ITEM_ID, slot=0, defaults={'sketch': category.to_bytes()}
+                )
+            else:
+                sketches.filter(item_id=CATEGORY_ITEM_ID).delete()
+
+    @staticmethod
+    def _forget_buckets(alias, vote_type: str, item_id: int):
+        """Drop an item's VoterBuckets and re-merge the category buckets of the same periods"""
+        buckets = VoterBucket.objects.using(alias).filter(vote_type=vote_type)
+        periods = list(buckets.filter(item_id=item_id).values_list('resolution', 'bucket_start'))
+        buckets.filter(item_id=item_id).delete()
+        for resolution, _ in RESOLUTIONS:
+            starts = [start for period, start in periods if period == resolution]
+            if not starts:
+                continue
+            in_periods = buckets.filter(resolution=resolution, bucket_start__in=starts)
+            merged = defaultdict(HyperLogLog)
+            rows = in_periods.exclude(item_id=CATEGORY_ITEM_ID).values_list('bucket_start', 'sketch')
+            for start, data in rows.iterator():
+                merged[start].merge(HyperLogLog.from_bytes(data))
+            in_periods.filter(item_id=CATEGORY_ITEM_ID).delete()
+            VoterBucket.objects.using(alias).bulk_create(
+                [VoterBucket(resolution=resolution, bucket_start=start, vote_type=vote_type,
+                             item_id=CATEGORY_ITEM_ID, sketch=sketch.to_bytes())
+                 for start, sketch in merged.items()],
+                update_conflicts=True,
+                unique_fields=['resolution', 'vote_type', 'item_id', 'bucket_start', 'slot'],
+                update_fields=['sketch'],
+            )
+
+    @staticmethod
+    def rebalance_shards(include_default: bool = False, dry_run: bool = False) -> int:
+        """Move sketches to the shard their item hashes to, merging into any sketch already there.
+
+        Category sketches move like items do; a category's sketches are merged
+        across shards when read, so where each one sits doesn't matter.
+        """
+        shards = vote_databases()
+        moved = 0
+        for model, fields in KEY_FIELDS.items():
+            for source in dict.fromkeys(shards + (['default'] if include_default else [])):
+                stray = [
+                    row for row in model.objects.using(source).only(*fields, 'sketch')
+                    if shard_for(row.vote_type, row.item_id, shards) != source
+                ]
+                moved += len(stray)
+                if dry_run:
+                    continue
+                for row in stray:
+                    target = shard_for(row.vote_type, row.item_id, shards)
+                    key = {field: getattr(row, field) for field in fields}
+                    with transaction.atomic(using=target):
+                        existing = model.objects.using(target).select_for_update().filter(**key).first()
+                        sketch = HyperLogLog.from_bytes(row.sketch)
+                        if existing:
+                            existing.sketch = sketch.merge(HyperLogLog.from_bytes(existing.sketch)).to_bytes()
+                            existing.save(using=target, update_fields=['sketch', 'updated_at'])
+                        else:
+                            model.objects.using(target).create(**key, sketch=row.sketch)
+                    row.delete(using=source)
+        return moved
+
+
+def record_voters(voters: Dict[Tuple[str, int], Iterable[str]], at: Optional[datetime] = None):
+    """Count voter ids towards unique voters when VOTE_UNIQUE_VOTERS is on"""
+    if settings.VOTE_UNIQUE_VOTERS:
+        voters = {key: [voter for voter in voter_ids if voter] for key, voter_ids in voters.items()}
+        VoterSketchService.record(voters, at)
+
+
+def add_unique_voters(stats: dict) -> dict:
+    """Add estimated ``unique_voters`` to each category and listed item of vote stats.
+
+    A category's count comes from its category sketch, the union of all its
+    items' sketches, so a voter who voted for several of them is counted
+    once. Only the listed items' own sketches are loaded.
+    """
+    categories = VoterSketchService.category_sketches(vote_type for vote_type, *_ in CATEGORIES)
+    sketches = VoterSketchService.item_sketches(
+        [(vote_type, item['id']) for vote_type, key, *_ in CATEGORIES for item in stats[key]['top_items']]
+    )
+    for vote_type, key, model, name_field in CATEGORIES:
+        category = categories.get(vote_type)
+        stats[key]['unique_voters'] = category.count() if category else 0
+        for item in stats[key]['top_items']:
+            sketch = sketches.get((vote_type, item['id']))
+            item['unique_voters'] = sketch.count() if sketch else 0
+    return stats